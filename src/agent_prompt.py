@@ -0,0 +1,186 @@
+import copy
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from chat_session import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+TOOL_RESPONSE_ROLES = ("tool-response", "tool")
+
+
+def message_field(message: Any, name: str) -> Any:
+    """读取消息的字段，兼容字典和 smolagents 的 ChatMessage 对象"""
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def message_role(message: Any) -> Optional[str]:
+    """消息的角色字符串（ChatMessage 的角色是 MessageRole 枚举）"""
+    role = message_field(message, "role")
+    return getattr(role, "value", role)
+
+
+def message_text(message: Any) -> str:
+    """取出消息的文本内容，兼容字符串和 [{"type": "text", "text": ...}] 两种格式"""
+    content = message_field(message, "content")
+    if isinstance(content, list):
+        return "".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return content or ""
+
+
+def _with_text(message: Any, text: str) -> Any:
+    """返回替换了文本内容的副本，保持原消息的类型和内容格式"""
+    if isinstance(message_field(message, "content"), list):
+        content: Any = [{"type": "text", "text": text}]
+    else:
+        content = text
+    if isinstance(message, dict):
+        return dict(message, content=content)
+    compacted = copy.copy(message)
+    compacted.content = content
+    return compacted
+
+
+class AgentPromptAssembler:
+    """智能体每一步发送给模型的提示组装
+
+    - 工具说明前言按工具集缓存，同一组工具每次返回完全相同的字符串，
+      消息列表的开头在各步之间保持不变，Ollama 可以复用这段前缀的KV缓存；
+    - 已经被模型"消费"过（其后已有助手回复）的工具输出压缩为简短摘要，
+      摘要只由原文决定，压缩后的内容在后续各步中也保持不变；
+    - 提示仍超出预算时，把较早的一半步骤折叠成一条摘要消息。与对话记忆(ChatSession)相同，
+      折叠一次性完成，之后各步沿用同一条摘要，直到再次超出预算，
+      提示的token数因此不随运行步数增长，而前缀只在折叠时变化。
+    """
+
+    # 工具输出压缩后保留的字符数
+    SUMMARY_CHARS = 160
+    # 折叠进摘要时每条消息保留的字符数
+    FOLD_CHARS_PER_MESSAGE = 60
+    # 折叠摘要的总长度上限
+    MAX_FOLD_CHARS = 1500
+    # 最近几条消息始终保留原文
+    KEEP_RECENT = 2
+    # 工具前言末尾的通用提醒，与具体工具集无关
+    DEFAULT_INSTRUCTIONS = ("单独调用工具时，将上一步的结果用于下一步", "确保完成所有步骤")
+
+    def __init__(self, max_prompt_tokens: int = 6000, instructions: Sequence[str] = DEFAULT_INSTRUCTIONS):
+        """
+        Args:
+            max_prompt_tokens: 每步提示的token预算
+            instructions: 附在工具前言末尾的提醒，针对具体工具的说明由调用方传入
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.instructions = tuple(instructions)
+        self._preambles: Dict[Tuple, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self.step_tokens: List[int] = []  # 每一步组装后的估算提示token数
+        # 当前运行的折叠状态：原始消息中 [head_end, fold_upto) 已折叠为 fold_summary
+        self._head_key: Optional[Tuple] = None
+        self._fold_upto = 0
+        self._fold_summary = ""
+
+    @staticmethod
+    def toolset_key(tools: Sequence[Any]) -> Tuple:
+        return tuple(
+            (tool.name, tool.description, json.dumps(getattr(tool, "inputs", {}), sort_keys=True, ensure_ascii=False))
+            for tool in tools
+        )
+
+    def preamble(self, tools: Sequence[Any]) -> Dict[str, str]:
+        """工具说明的系统消息，每个工具集只构建一次"""
+        key = self.toolset_key(tools)
+        with self._lock:
+            message = self._preambles.get(key)
+            if message is None:
+                tools_description = "\n".join(f"- {tool.name}: {tool.description}" for tool in tools)
+                content = f"可用工具列表：\n{tools_description}"
+                if self.instructions:
+                    content += "\n\n请记住：\n" + "\n".join(
+                        f"{index}. {instruction}" for index, instruction in enumerate(self.instructions, 1))
+                message = {"role": "system", "content": [{"type": "text", "text": content}]}
+                self._preambles[key] = message
+            return message
+
+    @classmethod
+    def summarize(cls, text: str, limit: int) -> str:
+        """保留开头部分并注明省略的长度，结果只由原文决定"""
+        text = text.strip()
+        if len(text) <= limit:
+            return text
+        return f"{text[:limit]}…（已省略{len(text) - limit}字）"
+
+    @staticmethod
+    def count_tokens(messages: Sequence[Any]) -> int:
+        return sum(estimate_tokens(message_text(m)) + 4 for m in messages)
+
+    def _compact_consumed_tool_outputs(self, messages: List[Any]) -> List[Any]:
+        last_assistant = max((i for i, m in enumerate(messages) if message_role(m) == "assistant"), default=-1)
+        compacted = []
+        for index, message in enumerate(messages):
+            if message_role(message) in TOOL_RESPONSE_ROLES and index < last_assistant:
+                message = _with_text(message, self.summarize(message_text(message), self.SUMMARY_CHARS))
+            compacted.append(message)
+        return compacted
+
+    def _fold(self, messages: List[Any], start: int, end: int):
+        """把 messages[start:end] 追加到折叠摘要中"""
+        lines = [self._fold_summary] if self._fold_summary else []
+        for message in messages[start:end]:
+            text = self.summarize(message_text(message).replace("\n", " "), self.FOLD_CHARS_PER_MESSAGE)
+            lines.append(f"{message_role(message)}: {text}")
+        summary = "\n".join(lines)
+        if len(summary) > self.MAX_FOLD_CHARS:
+            summary = summary[-self.MAX_FOLD_CHARS:]
+            summary = summary[summary.find("\n") + 1:]
+        self._fold_summary = summary
+        self._fold_upto = end
+
+    def _build(self, head: List[Any], messages: List[Any], head_end: int) -> List[Any]:
+        start = max(head_end, self._fold_upto)
+        history = self._compact_consumed_tool_outputs(messages[start:])
+        if self._fold_summary:
+            history = [{"role": "system",
+                        "content": [{"type": "text", "text": f"较早步骤的摘要：\n{self._fold_summary}"}]}] + history
+        return head + history
+
+    def assemble(self, messages: List[Any], tools: Optional[Sequence[Any]] = None) -> List[Any]:
+        """组装本步发送的消息：[工具前言, 智能体的系统提示和任务, (折叠摘要), 压缩后的历史...]"""
+        messages = list(messages)
+        # 系统提示和第一条用户任务保持原样
+        head_end = next((i for i, m in enumerate(messages) if message_role(m) == "user"), -1) + 1
+        head = ([self.preamble(tools)] if tools else []) + messages[:head_end]
+
+        head_key = tuple(message_text(m) for m in messages[:head_end])
+        if head_key != self._head_key or len(messages) < self._fold_upto:
+            # 新的一次运行，重新开始折叠
+            self._head_key = head_key
+            self._fold_upto = 0
+            self._fold_summary = ""
+
+        assembled = self._build(head, messages, head_end)
+        tokens = self.count_tokens(assembled)
+        while tokens > self.max_prompt_tokens:
+            start = max(head_end, self._fold_upto)
+            unfolded = len(messages) - start
+            if unfolded <= self.KEEP_RECENT:
+                break
+            # 一次折叠较早的一半，而不是每步滑动一条
+            self._fold(messages, start, start + max(1, min(unfolded - self.KEEP_RECENT, (unfolded + 1) // 2)))
+            assembled = self._build(head, messages, head_end)
+            tokens = self.count_tokens(assembled)
+
+        self.step_tokens.append(tokens)
+        logger.info(f"第 {len(self.step_tokens)} 步提示约 {tokens} tokens（{len(assembled)} 条消息）")
+        return assembled
+
+    def reset(self):
+        """新的一次运行开始，清空每步的统计和折叠状态"""
+        self.step_tokens = []
+        self._head_key = None
+        self._fold_upto = 0
+        self._fold_summary = ""
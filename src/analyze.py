@@ -1,11 +1,22 @@
 from pathlib import Path
 from PIL import Image
-from typing import Union, List, Optional
+from typing import Callable, Union, List, Optional
 import numpy as np
+from transformers import StoppingCriteria, StoppingCriteriaList
 
 from minicpm_helper import init_model
 
 
+class CancelCriteria(StoppingCriteria):
+    """Stops generation as soon as the given callback reports cancellation."""
+
+    def __init__(self, should_stop: Callable[[], bool]):
+        self.should_stop = should_stop
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return bool(self.should_stop())
+
+
 class AnalyzeImage:
     """
     A wrapper class for MiniCPMV model that provides a simple interface for image analysis.
@@ -42,6 +53,7 @@ class AnalyzeImage:
         stream: bool = False,
         max_new_tokens: int = 1000,
         sampling: bool = False,
+        should_stop: Optional[Callable[[], bool]] = None,
         **kwargs
     ) -> Union[str, iter]:
         """
@@ -53,6 +65,8 @@ class AnalyzeImage:
             stream: Whether to stream the output token by token
             max_new_tokens: Maximum number of tokens to generate
             sampling: Whether to use sampling for text generation
+            should_stop: Optional callback polled after every generated token;
+                generation stops early once it returns True
             **kwargs: Additional arguments to pass to the model's chat method
 
         Returns:
@@ -70,6 +84,9 @@ class AnalyzeImage:
             msgs = [{"role": "user", "content": image + [question]}]
             image_param = None
 
+        if should_stop is not None:
+            kwargs["stopping_criteria"] = StoppingCriteriaList([CancelCriteria(should_stop)])
+
         # 直接调用chat方法，不再使用processor预处理
         response = self.ov_model.chat(
             image=image_param,
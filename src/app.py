@@ -1,15 +1,17 @@
 import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QComboBox, QPushButton, QTextEdit, 
-                            QLabel, QSizePolicy, QFileDialog)
+                            QLabel, QSizePolicy, QFileDialog, QCheckBox, QSpinBox)
 from PyQt5.QtCore import Qt
-from llm_ollama import MODEL_LIST
+from llm_ollama import MODEL_LIST, OllamaClientPool
 from chat_handler import ChatHandler
 from PIL import Image
 from PyQt5.QtGui import QImage, QPixmap
 import numpy as np
 from generate import ImageGenerator
 from image import ImageProcessing  # 添加新的导入
+from stream_view import StreamingTextView
+from model_warmup import ModelWarmupManager
 
 class PosterGUI(QMainWindow):
     def __init__(self):
@@ -62,8 +64,13 @@ class PosterGUI(QMainWindow):
         default_model = MODEL_LIST[2]
         default_index = MODEL_LIST.index(default_model)
         self.model_combo.setCurrentIndex(default_index)
+        # 显示当前模型是否已加载
+        self.model_status_label = QLabel()
+        self.model_status_label.setAlignment(Qt.AlignCenter)
+        self.model_status_label.setMinimumWidth(90)
         model_layout.addWidget(model_label)
         model_layout.addWidget(self.model_combo)
+        model_layout.addWidget(self.model_status_label)
         
         # 创建图片大小组合控件的容器
         size_container = QWidget()
@@ -88,10 +95,15 @@ class PosterGUI(QMainWindow):
         top_controls.addWidget(self.generate_btn, 2)      # 新增，比例为2
         
         # 第二行：LLM输出框
-        self.llm_output = QTextEdit()
-        self.llm_output.setReadOnly(True)
+        self.llm_output = StreamingTextView()
         self.llm_output.setPlaceholderText("LLM输出将显示在这里...")
         
+        # deepseek-r1 的思考过程单独显示，默认折叠（不渲染）
+        self.reasoning_output = StreamingTextView()
+        self.reasoning_output.setPlaceholderText("思考过程将显示在这里...")
+        self.reasoning_output.setMaximumHeight(200)
+        self.reasoning_output.hide()
+        
         # 第三行控件组
         bottom_controls = QHBoxLayout()
         self.user_input = QTextEdit()
@@ -99,18 +111,48 @@ class PosterGUI(QMainWindow):
         self.user_input.setPlaceholderText("在这里输入你的提示...")
         
         self.send_btn = QPushButton("发送")
+        self.stop_btn = QPushButton("停止")
+        self.stop_btn.setEnabled(False)
         self.clear_btn = QPushButton("清除")
         
         button_layout = QVBoxLayout()
+        self.cache_check = QCheckBox("使用缓存")
+        self.cache_check.setToolTip("相同模型和对话再次提问时直接回放已缓存的回答")
+        
         button_layout.addWidget(self.send_btn)
+        button_layout.addWidget(self.stop_btn)
         button_layout.addWidget(self.clear_btn)
+        button_layout.addWidget(self.cache_check)
+        self.reasoning_check = QCheckBox("显示思考")
+        self.reasoning_check.setToolTip("单独显示 deepseek-r1 的 <think> 推理过程")
+        self.reasoning_check.toggled.connect(self.reasoning_output.setVisible)
+        button_layout.addWidget(self.reasoning_check)
+        
+        # 多模型对比：同一问题同时发给所有模型，结果并排显示
+        self.fanout_check = QCheckBox("多模型对比")
+        self.fanout_concurrency = QSpinBox()
+        self.fanout_concurrency.setRange(1, len(MODEL_LIST))
+        self.fanout_concurrency.setValue(ChatHandler.FANOUT_CONCURRENCY)
+        self.fanout_concurrency.setPrefix("并发: ")
+        self.fanout_concurrency.setToolTip("同时请求的模型数，显存较小时请调低")
+        button_layout.addWidget(self.fanout_check)
+        button_layout.addWidget(self.fanout_concurrency)
         
         bottom_controls.addWidget(self.user_input)
         bottom_controls.addLayout(button_layout)
         
         # 添加所有控件到左侧布局
         left_layout.addLayout(top_controls)
+        left_layout.addWidget(self.reasoning_output)
         left_layout.addWidget(self.llm_output)
+        
+        # 多模型对比的并排输出区域，开始对比时才显示
+        self.fanout_panel = QWidget()
+        self.fanout_layout = QHBoxLayout(self.fanout_panel)
+        self.fanout_layout.setContentsMargins(0, 0, 0, 0)
+        self.fanout_panel.hide()
+        self.fanout_panes = {}
+        left_layout.addWidget(self.fanout_panel, 2)
         left_layout.addLayout(bottom_controls)
         
         # 创建右侧图片显示区域
@@ -139,22 +181,40 @@ class PosterGUI(QMainWindow):
         self.chat_handler = ChatHandler()
         self.setup_chat_connections()
         
+        # 切换模型时在后台预加载，最近使用的两个模型保持常驻
+        self.warmup_manager = ModelWarmupManager(keep_resident=2)
+        self.warmup_manager.status_changed.connect(self.on_model_status_changed)
+        self.model_combo.currentTextChanged.connect(self.warmup_manager.warmup)
+        self.warmup_manager.warmup(self.model_combo.currentText())
+        
         # 连接开始生成按钮的点击事件
         self.generate_btn.clicked.connect(self.generate_poster)
         self.load_image_btn.clicked.connect(self.load_images)  # 添加按钮连接
         self.image_processor = ImageProcessing()  # 添加图像处理器实例
+        self.poster_worker = None  # 当前的海报生成工作线程
+        self.poster_pixmap = None  # 原始尺寸的海报
         
     def setup_chat_connections(self):
         """设置聊天相关的信号连接"""
         # 连接发送和清除按钮
         self.send_btn.clicked.connect(self.send_message)
+        self.stop_btn.clicked.connect(self.chat_handler.cancel)
         self.clear_btn.clicked.connect(self.clear_output)
         
         # 连接聊天处理器的信号
         self.chat_handler.message_received.connect(self.display_user_message)
         self.chat_handler.ai_stream.connect(self.update_ai_response)
+        self.chat_handler.ai_reconcile.connect(self.llm_output.replace_response)
+        self.chat_handler.ai_reasoning.connect(self.update_ai_reasoning)
+        self.chat_handler.ai_stats.connect(self.on_response_stats)
         self.chat_handler.ai_finished.connect(self.on_response_finished)
         self.chat_handler.error_occurred.connect(self.handle_error)
+        self.chat_handler.ai_cancelled.connect(self.on_response_cancelled)
+        self.chat_handler.fanout_cancelled.connect(self.on_fanout_cancelled)
+        self.chat_handler.fanout_started.connect(self.on_fanout_started)
+        self.chat_handler.fanout_stream.connect(self.on_fanout_stream)
+        self.chat_handler.fanout_model_finished.connect(self.on_fanout_model_finished)
+        self.chat_handler.fanout_finished.connect(self.on_fanout_finished)
         
     def send_message(self):
         """处理发送消息"""
@@ -162,69 +222,237 @@ class PosterGUI(QMainWindow):
         if not question:
             return
             
-        self.send_btn.setEnabled(False)
+        # 回答进行中也可以发送，新消息会取代正在进行的回答
         self.user_input.clear()
         
         # 发送消息到聊天处理器
+        if self.fanout_check.isChecked():
+            self.chat_handler.send_fanout(question, MODEL_LIST,
+                                          max_concurrency=self.fanout_concurrency.value(),
+                                          use_cache=self.cache_check.isChecked(),
+                                          keep_alive=self.warmup_manager.keep_alive_for)
+            self.stop_btn.setEnabled(True)
+            return
+        
         current_model = self.model_combo.currentText()
-        self.chat_handler.send_message(question, current_model)
+        self.chat_handler.send_message(question, current_model,
+                                       use_cache=self.cache_check.isChecked(),
+                                       keep_alive=self.warmup_manager.keep_alive_for(current_model))
+        self.stop_btn.setEnabled(True)
+        
+    def on_fanout_started(self, models: list):
+        """为每个参与对比的模型创建一个输出窗格"""
+        while self.fanout_layout.count():
+            item = self.fanout_layout.takeAt(0)
+            if item.widget() is not None:
+                item.widget().deleteLater()
+        self.fanout_panes = {}
+        for model in models:
+            pane = QWidget()
+            pane_layout = QVBoxLayout(pane)
+            pane_layout.setContentsMargins(0, 0, 0, 0)
+            header = QLabel(f"{model}  等待中...")
+            view = StreamingTextView()
+            view.begin_response()
+            pane_layout.addWidget(header)
+            pane_layout.addWidget(view)
+            self.fanout_layout.addWidget(pane)
+            self.fanout_panes[model] = (header, view)
+        self.fanout_panel.show()
+        
+    def on_fanout_stream(self, model: str, delta: str):
+        header, view = self.fanout_panes[model]
+        if header.text().endswith("等待中..."):
+            header.setText(f"{model}  生成中...")
+        view.append_delta(delta)
+        
+    def on_fanout_model_finished(self, model: str, stats: dict):
+        """在窗格标题显示该模型的延迟和生成速度"""
+        header, view = self.fanout_panes[model]
+        view.end_response()
+        if "error" in stats:
+            header.setText(f"{model}  错误")
+            view.append(f"错误: {stats['error']}")
+        else:
+            header.setText(f"{model}  {stats['latency']:.1f}s  {stats['tokens_per_second']} tok/s")
+        
+    def on_fanout_finished(self, summary: dict):
+        """对比完成后在主输出框汇总各模型的表现"""
+        self.llm_output.end_response()
+        for model, stats in summary.items():
+            if model == "total_seconds":
+                continue
+            if "error" in stats:
+                self.llm_output.append(f"{model}: 错误 {stats['error']}")
+            else:
+                self.llm_output.append(
+                    f"{model}: 总耗时 {stats['latency']:.1f}s，首字 {stats['first_token']:.1f}s，"
+                    f"提示 {stats['usage']['prompt_tokens']} tokens，"
+                    f"生成 {stats['tokens']} tokens，{stats['tokens_per_second']} tok/s")
+        self.llm_output.append(f"对比总耗时 {summary['total_seconds']:.1f}s")
+        self.llm_output.append("\n" + "="*50 + "\n")
+        self.stop_btn.setEnabled(self.chat_handler.is_busy)
+        
+    def on_model_status_changed(self, model: str, status: str):
+        """更新当前模型的加载状态"""
+        if model != self.model_combo.currentText():
+            return
+        if status == ModelWarmupManager.LOADING:
+            self.model_status_label.setText("加载中...")
+        elif status == ModelWarmupManager.READY:
+            load_time = self.warmup_manager.last_load_time(model)
+            self.model_status_label.setText(f"已就绪 {load_time:.1f}s")
+        elif status == ModelWarmupManager.ERROR:
+            self.model_status_label.setText("加载失败")
+        else:
+            self.model_status_label.setText("")
         
     def display_user_message(self, message: str):
         """显示用户消息"""
         self.llm_output.append("\n【用户】")
         self.llm_output.append(message)
         self.llm_output.append("\n【AI助手】\n")
+        self.llm_output.begin_response()
+        self.reasoning_output.clear()
         
-    def update_ai_response(self, text: str):
-        """更新AI响应"""
-        current_text = self.llm_output.toPlainText()
-        try:
-            last_ai_index = current_text.rindex("【AI助手】")
-            base_text = current_text[:last_ai_index + len("【AI助手】\n")]
-        except ValueError:
-            base_text = current_text
-            
-        self.llm_output.setPlainText(base_text + text)
-        self.llm_output.verticalScrollBar().setValue(
-            self.llm_output.verticalScrollBar().maximum()
-        )
+    def update_ai_response(self, delta: str):
+        """追加AI响应的增量文本"""
+        self.llm_output.append_delta(delta)
+        
+    def update_ai_reasoning(self, delta: str):
+        """思考过程折叠时直接丢弃，不产生任何渲染开销"""
+        if self.reasoning_check.isChecked():
+            self.reasoning_output.append_delta(delta)
+        
+    def on_response_stats(self, stats: dict):
+        """显示思考和回答各自的生成速度，以及本次和会话累计的token用量"""
+        self.llm_output.end_response()
+        line = f"回答 {stats['answer_tokens']} tokens，{stats['answer_tokens_per_second']} tok/s"
+        if stats['reasoning_tokens']:
+            line = (f"思考 {stats['reasoning_tokens']} tokens，{stats['reasoning_tokens_per_second']} tok/s；"
+                    + line)
+        self.llm_output.append(line)
+        usage, session = stats['usage'], stats['session']
+        line = f"提示 {usage['prompt_tokens']} tokens"
+        if usage['prompt_tokens_per_second']:
+            line += f"（{usage['prompt_tokens_per_second']} tok/s）"
+        if usage['cached']:
+            line += "，来自缓存"
+        self.llm_output.append(f"{line}；本次会话累计 {session['total_tokens']} tokens，{session['calls']} 次调用")
         
     def on_response_finished(self):
         """AI响应完成的处理"""
-        self.send_btn.setEnabled(True)
+        self.stop_btn.setEnabled(self.chat_handler.is_busy)
+        self.llm_output.end_response()
+        self.llm_output.append("\n" + "="*50 + "\n")
+        
+    def on_response_cancelled(self, partial_text: str):
+        """回答被停止或被新消息取代"""
+        self.llm_output.end_response()
+        self.llm_output.append("（已停止）")
         self.llm_output.append("\n" + "="*50 + "\n")
+        self.stop_btn.setEnabled(self.chat_handler.is_busy)
+        
+    def on_fanout_cancelled(self):
+        """多模型对比被停止，未完成的窗格标记为已停止"""
+        for model, (header, view) in self.fanout_panes.items():
+            if "tok/s" not in header.text() and not header.text().endswith("错误"):
+                header.setText(f"{model}  已停止")
+            view.end_response()
+        self.llm_output.end_response()
+        self.llm_output.append("（多模型对比已停止）")
+        self.stop_btn.setEnabled(self.chat_handler.is_busy)
         
     def handle_error(self, error_msg: str):
         """处理错误"""
-        current_text = self.llm_output.toPlainText()
-        try:
-            last_ai_index = current_text.rindex("【AI助手】")
-            base_text = current_text[:last_ai_index + len("【AI助手】\n")]
-        except ValueError:
-            base_text = current_text
-        self.llm_output.setPlainText(base_text)
+        self.llm_output.replace_response("")
+        self.llm_output.end_response()
         self.llm_output.append(f"错误: {error_msg}")
-        self.send_btn.setEnabled(True)
+        self.stop_btn.setEnabled(self.chat_handler.is_busy)
         
     def clear_output(self):
-        """清除输出"""
+        """清除输出，同时开始新的对话"""
         self.llm_output.clear()
+        self.fanout_panel.hide()
+        self.chat_handler.reset_session()
 
     def generate_poster(self):
-        """生成并显示空白图片"""
+        """开始生成海报；生成过程中再次点击则取消"""
+        if self.poster_worker is not None:
+            # 已有任务在运行：本次点击视为取消，等待工作线程在阶段/token之间退出
+            self.poster_worker.cancel()
+            self.generate_btn.setEnabled(False)
+            self.generate_btn.setText("正在取消...")
+            return
+        
         size_str = self.size_combo.currentText()
-        ImageGenerator.poster_generation_process(size_str, self.image_label, self.image_processor)
+        worker = ImageGenerator.create_poster_worker(size_str, self.image_processor)
+        if worker is None:
+            ImageGenerator.append_to_output(self.llm_output, "错误：没有找到输入图片")
+            return
+        
+        ImageGenerator.append_to_output(self.llm_output, f"开始生成 {size_str} 尺寸的海报...")
+        worker.stage.connect(self.on_poster_stage)
+        worker.partial.connect(self.on_poster_partial)
+        worker.preview.connect(self.on_poster_preview)
+        worker.result.connect(self.on_poster_result)
+        worker.error.connect(self.on_poster_error)
+        worker.cancelled.connect(self.on_poster_cancelled)
+        worker.finished.connect(self.on_poster_worker_finished)
+        self.poster_worker = worker
+        self.generate_btn.setText("取消生成")
+        worker.start()
+        
+    def on_poster_stage(self, stage: str, message: str):
+        """显示当前生成阶段"""
+        ImageGenerator.append_to_output(self.llm_output, message)
+        
+    def on_poster_partial(self, text: str):
+        """追加图片分析的增量文本"""
+        self.llm_output.append_delta(text)
+        
+    def on_poster_preview(self, image: QImage):
+        """显示渲染完成的海报"""
+        self.poster_pixmap = QPixmap.fromImage(image)
+        ImageGenerator.update_poster_image_preview(
+            self.image_label,
+            ImageGenerator.scale_pixmap(self.poster_pixmap, self.image_label.size())
+        )
+        
+    def on_poster_result(self, description: str):
+        ImageGenerator.append_to_output(self.llm_output, "\n海报生成完成")
+        
+    def on_poster_error(self, error_msg: str):
+        ImageGenerator.append_to_output(self.llm_output, f"错误：{error_msg}")
+        
+    def on_poster_cancelled(self):
+        ImageGenerator.append_to_output(self.llm_output, "\n海报生成已取消")
+        
+    def on_poster_worker_finished(self):
+        """工作线程退出后恢复按钮状态"""
+        self.poster_worker = None
+        self.generate_btn.setText("开始生成")
+        self.generate_btn.setEnabled(True)
         
     def resizeEvent(self, event):
         """窗口大小改变时重新调整图片大小"""
         super().resizeEvent(event)
-        if self.image_label.pixmap() is not None:
+        if self.poster_pixmap is not None:
+            # 始终从原始尺寸的海报缩放，避免反复缩放导致模糊
             scaled_pixmap = ImageGenerator.scale_pixmap(
-                self.image_label.pixmap(),
+                self.poster_pixmap,
                 self.image_label.size()
             )
             self.image_label.setPixmap(scaled_pixmap)
 
+    def closeEvent(self, event):
+        """关闭窗口前停止后台生成线程"""
+        self.chat_handler.shutdown()
+        if self.poster_worker is not None:
+            self.poster_worker.cancel()
+            self.poster_worker.wait()
+        super().closeEvent(event)
+
     def load_images(self):
         """处理图片加载"""
         file_dialog = QFileDialog()
@@ -239,5 +467,8 @@ class PosterGUI(QMainWindow):
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = PosterGUI()
+    # 退出时先卸载常驻显存的模型，再释放共享的 Ollama 连接（按连接顺序调用）
+    app.aboutToQuit.connect(window.warmup_manager.unload_resident)
+    app.aboutToQuit.connect(OllamaClientPool.close_all)
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
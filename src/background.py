@@ -0,0 +1,257 @@
+import json
+import math
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+Color = Tuple[int, int, int]
+Size = Union[str, Tuple[int, int]]
+
+# 背景描述中常见的颜色词
+COLOR_WORDS: Dict[str, Color] = {
+    "浅蓝": (173, 216, 240),
+    "天蓝": (135, 206, 235),
+    "深蓝": (20, 40, 120),
+    "蓝": (60, 110, 220),
+    "浅紫": (200, 170, 230),
+    "深紫": (75, 30, 120),
+    "紫": (130, 70, 180),
+    "粉": (245, 180, 200),
+    "玫瑰金": (230, 180, 160),
+    "金": (220, 180, 80),
+    "橙": (250, 150, 60),
+    "红": (220, 50, 50),
+    "绿": (70, 170, 100),
+    "青": (60, 190, 190),
+    "黄": (250, 220, 90),
+    "银": (200, 205, 210),
+    "灰": (128, 128, 128),
+    "黑": (20, 20, 25),
+    "白": (250, 250, 250),
+}
+
+
+def parse_size(size: Size) -> Tuple[int, int]:
+    """解析 '1080x1920' 或 (宽, 高)"""
+    if isinstance(size, str):
+        width, height = map(int, size.lower().split('x'))
+        return width, height
+    return int(size[0]), int(size[1])
+
+
+def _color_ramp(t: np.ndarray, colors: Sequence[Color], stops: Optional[Sequence[float]] = None) -> np.ndarray:
+    """按位置t(0~1)在多个色标之间插值，返回 HxWx3 float32"""
+    colors = np.asarray(colors, dtype=np.float32)
+    if stops is None:
+        stops = np.linspace(0.0, 1.0, len(colors))
+    stops = np.asarray(stops, dtype=np.float32)
+    out = np.empty(t.shape + (3,), dtype=np.float32)
+    for c in range(3):
+        out[..., c] = np.interp(t, stops, colors[:, c])
+    return out
+
+
+def _upsample(small: np.ndarray, width: int, height: int) -> np.ndarray:
+    """将低分辨率的单通道浮点图双线性放大到目标尺寸"""
+    image = Image.fromarray(small.astype(np.float32), 'F')
+    return np.asarray(image.resize((width, height), Image.BILINEAR), dtype=np.float32)
+
+
+class BackgroundGenerator:
+    """程序化海报背景生成器
+
+    支持线性渐变、径向渐变、噪声纹理和柔和光斑四种风格，全部用NumPy向量化计算。
+    结果按 (风格参数, 尺寸) 缓存在有界LRU缓存中，重复请求同一背景时直接返回。
+    """
+
+    STYLES = ('linear', 'radial', 'noise', 'blobs')
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._cache: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(style: Dict[str, Any], size: Size) -> str:
+        """将风格参数和尺寸规范化为缓存键"""
+        width, height = parse_size(size)
+        return json.dumps({"style": style, "size": [width, height]}, sort_keys=True, ensure_ascii=False)
+
+    def generate(self, style: Dict[str, Any], size: Size) -> np.ndarray:
+        """生成背景，返回只读的 HxWx3 uint8 数组
+
+        Args:
+            style: 风格参数，必须包含 'type'，其余参数见对应的 _render_* 方法
+            size: 目标尺寸，如 '1080x1920'
+        """
+        key = self.cache_key(style, size)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        width, height = parse_size(size)
+        params = dict(style)
+        style_type = params.pop('type', 'linear')
+        if style_type not in self.STYLES:
+            raise ValueError(f"未知的背景风格: {style_type}")
+        render = getattr(self, f"_render_{style_type}")
+        pixels = render(width, height, **params)
+
+        result = np.clip(pixels + 0.5, 0, 255).astype(np.uint8)
+        result.setflags(write=False)
+        self._store(key, result)
+        return result
+
+    def generate_image(self, style: Dict[str, Any], size: Size) -> Image.Image:
+        """生成背景并返回PIL图片"""
+        return Image.fromarray(self.generate(style, size), 'RGB')
+
+    def _store(self, key: str, value: np.ndarray) -> None:
+        self._cache[key] = value
+        self._cache_bytes += value.nbytes
+        while self._cache and (len(self._cache) > self.max_entries or self._cache_bytes > self.max_bytes):
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.nbytes
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+        self._cache_bytes = 0
+
+    def cache_info(self) -> Dict[str, int]:
+        """返回缓存命中统计"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._cache),
+            "bytes": self._cache_bytes,
+        }
+
+    @staticmethod
+    def _render_linear(width: int, height: int, colors: Sequence[Color] = ((173, 216, 240), (75, 30, 120)),
+                       angle: float = 45.0, stops: Optional[Sequence[float]] = None) -> np.ndarray:
+        """线性渐变，angle为渐变方向(度)，0表示从左到右，90表示从上到下"""
+        rad = math.radians(angle)
+        dx, dy = math.cos(rad), math.sin(rad)
+        xs = np.arange(width, dtype=np.float32)[None, :] * dx
+        ys = np.arange(height, dtype=np.float32)[:, None] * dy
+        t = xs + ys
+        t -= t.min()
+        span = t.max()
+        if span > 0:
+            t /= span
+        return _color_ramp(t, colors, stops)
+
+    @staticmethod
+    def _render_radial(width: int, height: int, colors: Sequence[Color] = ((250, 250, 250), (60, 110, 220)),
+                       center: Tuple[float, float] = (0.5, 0.5), radius: float = 0.75,
+                       stops: Optional[Sequence[float]] = None) -> np.ndarray:
+        """径向渐变，center和radius使用相对坐标(以较长边为单位)"""
+        scale = float(max(width, height))
+        cx, cy = center[0] * width, center[1] * height
+        xs = (np.arange(width, dtype=np.float32)[None, :] - cx) ** 2
+        ys = (np.arange(height, dtype=np.float32)[:, None] - cy) ** 2
+        t = np.sqrt(xs + ys) / (radius * scale)
+        np.clip(t, 0.0, 1.0, out=t)
+        return _color_ramp(t, colors, stops)
+
+    @staticmethod
+    def _render_noise(width: int, height: int, base: Color = (240, 240, 245), amplitude: float = 18.0,
+                      scale: int = 64, octaves: int = 3, seed: int = 0, monochrome: bool = True) -> np.ndarray:
+        """多倍频的值噪声纹理，scale为最粗一层噪声的格子边长(像素)"""
+        rng = np.random.default_rng(seed)
+        channels = 1 if monochrome else 3
+        noise = np.zeros((height, width, channels), dtype=np.float32)
+        weight_sum = 0.0
+        for octave in range(octaves):
+            cell = max(1, scale >> octave)
+            grid_w, grid_h = width // cell + 2, height // cell + 2
+            weight = 0.5 ** octave
+            for c in range(channels):
+                grid = rng.random((grid_h, grid_w), dtype=np.float32)
+                layer = _upsample(grid, grid_w * cell, grid_h * cell)[:height, :width]
+                noise[..., c] += (layer - 0.5) * weight
+            weight_sum += weight
+        noise *= 2.0 * amplitude / weight_sum
+        return np.asarray(base, dtype=np.float32) + noise
+
+    @staticmethod
+    def _render_blobs(width: int, height: int, base: Color = (245, 245, 250),
+                      colors: Sequence[Color] = ((173, 216, 240), (200, 170, 230), (245, 180, 200)),
+                      count: int = 5, softness: float = 0.25, seed: int = 0, downscale: int = 4) -> np.ndarray:
+        """柔和光斑：若干高斯光斑叠加在底色上
+
+        光斑本身是低频信号，先在 1/downscale 分辨率计算再双线性放大。
+        """
+        rng = np.random.default_rng(seed)
+        small_w, small_h = max(1, width // downscale), max(1, height // downscale)
+        xs = np.linspace(0.0, 1.0, small_w, dtype=np.float32)[None, :]
+        ys = np.linspace(0.0, 1.0, small_h, dtype=np.float32)[:, None]
+        aspect = height / width
+
+        color_acc = np.zeros((small_h, small_w, 3), dtype=np.float32)
+        weight_acc = np.zeros((small_h, small_w), dtype=np.float32)
+        palette = np.asarray(colors, dtype=np.float32)
+        for i in range(count):
+            cx, cy = rng.random(2)
+            sigma = softness * (0.6 + 0.8 * rng.random())
+            dist2 = (xs - cx) ** 2 + ((ys - cy) * aspect) ** 2
+            weight = np.exp(-dist2 / (2.0 * sigma * sigma))
+            color_acc += weight[..., None] * palette[i % len(palette)]
+            weight_acc += weight
+
+        alpha = np.clip(weight_acc, 0.0, 1.0)
+        blob_color = color_acc / np.maximum(weight_acc, 1e-6)[..., None]
+        small = blob_color * alpha[..., None] + np.asarray(base, dtype=np.float32) * (1.0 - alpha[..., None])
+
+        out = np.empty((height, width, 3), dtype=np.float32)
+        for c in range(3):
+            out[..., c] = _upsample(small[..., c], width, height)
+        return out
+
+    @staticmethod
+    def style_from_description(description: str) -> Dict[str, Any]:
+        """根据自然语言的背景描述粗略推断风格参数"""
+        found: List[Tuple[int, Color]] = []
+        remaining = description
+        # 先匹配较长的颜色词，避免"深紫"被"紫"抢先匹配
+        for word in sorted(COLOR_WORDS, key=len, reverse=True):
+            index = remaining.find(word)
+            while index >= 0:
+                found.append((index, COLOR_WORDS[word]))
+                remaining = remaining[:index] + "\0" * len(word) + remaining[index + len(word):]
+                index = remaining.find(word)
+        colors = [color for _, color in sorted(found)]
+
+        if "径向" in description or "中心" in description:
+            style: Dict[str, Any] = {"type": "radial"}
+        elif "噪点" in description or "纹理" in description or "磨砂" in description:
+            style = {"type": "noise"}
+            if colors:
+                style["base"] = colors[0]
+            return style
+        elif "光斑" in description or "柔光" in description or "弥散" in description:
+            style = {"type": "blobs"}
+        else:
+            style = {"type": "linear", "angle": 45.0}
+            if "上" in description and "下" in description and "左" not in description:
+                style["angle"] = 90.0
+            elif "左" in description and "右" in description and "上" not in description:
+                style["angle"] = 0.0
+
+        if len(colors) >= 2:
+            style["colors"] = colors
+        elif len(colors) == 1:
+            style["colors"] = [(250, 250, 250), colors[0]]
+        return style
+
+
+# 进程内共享的背景生成器
+default_generator = BackgroundGenerator()
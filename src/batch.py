@@ -0,0 +1,217 @@
+"""无界面批量生成海报
+
+用法示例：
+    python batch.py catalog.jsonl --out ../output/batch --size 1080x1920 --workers 2
+
+商品清单支持 CSV 或 JSONL，每行一个商品，字段：
+    id           可选，商品唯一标识（缺省时使用图片文件名），用作输出文件名，不能包含路径分隔符等字符
+    image        必填，商品图片路径（相对路径以清单所在目录为基准）
+    title/features/price/slogan  可选，海报文案
+    description  可选，已有的商品描述；提供时跳过图片分析
+
+结果写入输出目录下的 manifest.jsonl，每完成一个商品追加一行。
+重新运行同一命令时会跳过 manifest 中已成功生成的 (商品, 尺寸)，因此进程崩溃后可以直接续跑；
+增加新的尺寸后重新运行，已完成的商品只生成缺少的尺寸。
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from pipeline import DEFAULT_DEVICE, DEFAULT_MODEL_DIR, PosterPipeline
+
+TEXT_FIELDS = ('title', 'features', 'price', 'slogan')
+MANIFEST_NAME = 'manifest.jsonl'
+# 商品id用作输出文件名，不允许路径分隔符、控制字符和 Windows 文件名中的保留字符
+_INVALID_ID_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+# 每个工作进程各自持有一个流水线实例（及其加载的模型）
+_worker_pipeline: Optional[PosterPipeline] = None
+
+
+def load_catalog(path: str) -> List[Dict[str, Any]]:
+    """读取 CSV/JSONL 商品清单"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    items: List[Dict[str, Any]] = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.lower().endswith('.csv'):
+            rows: Iterable[Dict[str, Any]] = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for index, row in enumerate(rows):
+            if not row.get('image'):
+                raise ValueError(f"第 {index + 1} 行缺少 image 字段")
+            item = {k: v for k, v in row.items() if v not in (None, '')}
+            if not os.path.isabs(item['image']):
+                item['image'] = os.path.join(base_dir, item['image'])
+            item['id'] = str(item.get('id', os.path.splitext(os.path.basename(item['image']))[0])).strip()
+            if item['id'] in ('', '.', '..') or _INVALID_ID_CHARS.search(item['id']):
+                raise ValueError(f"第 {index + 1} 行的 id 不能用作文件名: {item['id']!r}")
+            items.append(item)
+
+    ids = [item['id'] for item in items]
+    if len(ids) != len(set(ids)):
+        raise ValueError("商品清单中存在重复的 id")
+    return items
+
+
+def _read_manifest(manifest_path: str) -> Iterable[Dict[str, Any]]:
+    if not os.path.exists(manifest_path):
+        return
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 崩溃时最后一行可能没写完整，忽略即可
+                continue
+            if 'id' in record:
+                yield record
+
+
+def load_completed(manifest_path: str) -> Set[Tuple[str, str]]:
+    """读取已成功生成的 (商品id, 尺寸)，用于断点续跑"""
+    completed: Set[Tuple[str, str]] = set()
+    for record in _read_manifest(manifest_path):
+        if record.get('status') == 'ok':
+            completed.update((record['id'], size_str) for size_str in record.get('outputs') or {})
+    return completed
+
+
+def _init_worker(model_dir: str, device: str, analyze: bool):
+    """工作进程初始化：创建流水线并预先加载模型"""
+    global _worker_pipeline
+    _worker_pipeline = PosterPipeline(model_dir=model_dir, device=device)
+    if analyze:
+        from pipeline import get_analyzer
+        get_analyzer(model_dir, device)
+
+
+def _process_item(item: Dict[str, Any], sizes: Sequence[str], out_dir: str, analyze: bool) -> Dict[str, Any]:
+    """在工作进程中处理单个商品：analyze → plan → render → 保存"""
+    start = time.perf_counter()
+    record: Dict[str, Any] = {"id": item['id'], "image": item['image'], "sizes": list(sizes), "pid": os.getpid()}
+    try:
+        pipeline = _worker_pipeline
+        product_image = pipeline.load_image(item['image'])
+
+        description = item.get('description', '')
+        if analyze and not description:
+            description = pipeline.analyze(product_image)
+        texts = {name: item[name] for name in TEXT_FIELDS if item.get(name)}
+
+        # 同一商品的多个尺寸共用一个场景，一次渲染完成
+        scene = pipeline.plan_scene(description, texts=texts)
+        compositors = pipeline.render_sizes(scene, sizes, product_image)
+
+        outputs = {}
+        for size_str, compositor in compositors.items():
+            output_path = os.path.join(out_dir, f"{item['id']}_{size_str}.png")
+            tmp_path = output_path + '.tmp'
+            compositor.to_image().save(tmp_path, format='PNG')
+            # 先写临时文件再替换，避免崩溃时留下半张图片
+            os.replace(tmp_path, output_path)
+            outputs[size_str] = output_path
+
+        record.update(status='ok', outputs=outputs, description=description, scene=scene.to_dict())
+    except Exception as e:
+        record.update(status='error', error=f"{type(e).__name__}: {e}")
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(catalog_path: str, out_dir: str, sizes: Sequence[str] = ('1080x1920',), workers: int = 1,
+              model_dir: str = DEFAULT_MODEL_DIR, device: str = DEFAULT_DEVICE, analyze: bool = True,
+              retry_failed: bool = True) -> Dict[str, Any]:
+    """批量生成海报并返回统计信息"""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+
+    items = load_catalog(catalog_path)
+    sizes = list(sizes)
+    done_sizes = load_completed(manifest_path)
+    if not retry_failed:
+        # 之前尝试过（无论成败）的尺寸都不再处理
+        done_sizes.update((record['id'], size_str) for record in _read_manifest(manifest_path)
+                          for size_str in record.get('sizes') or [])
+    # 每个商品只处理还没有生成的尺寸
+    pending = []
+    for item in items:
+        missing = [size_str for size_str in sizes if (item['id'], size_str) not in done_sizes]
+        if missing:
+            pending.append((item, missing))
+
+    print(f"商品总数 {len(items)}，已完成 {len(items) - len(pending)}，待处理 {len(pending)}")
+    stats = {"total": len(items), "skipped": len(items) - len(pending), "ok": 0, "error": 0, "posters": 0}
+    if not pending:
+        return stats
+
+    start = time.perf_counter()
+    broken = False
+    # spawn 方式启动工作进程，避免 fork 后 OpenVINO/torch 的线程状态异常
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(model_dir, device, analyze)) as executor, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest:
+        futures = {executor.submit(_process_item, item, missing, out_dir, analyze): (item, missing)
+                   for item, missing in pending}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except BrokenProcessPool as e:
+                # 工作进程崩溃或初始化失败后进程池不可用，剩余的商品都记为失败，续跑时会重新处理
+                item, missing = futures[future]
+                record = {"id": item['id'], "image": item['image'], "sizes": missing, "status": 'error',
+                          "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+                broken = True
+            manifest.write(json.dumps(record, ensure_ascii=False) + '\n')
+            manifest.flush()
+            os.fsync(manifest.fileno())
+
+            stats[record['status']] += 1
+            if record['status'] == 'ok':
+                stats['posters'] += len(record['outputs'])
+            done = stats['ok'] + stats['error']
+            elapsed = time.perf_counter() - start
+            rate = stats['posters'] / elapsed * 60 if elapsed > 0 else 0.0
+            status = "完成" if record['status'] == 'ok' else f"失败 ({record['error']})"
+            print(f"[{done}/{len(pending)}] {record['id']} {status}，耗时 {record['seconds']}s，"
+                  f"吞吐 {rate:.1f} 张/分钟")
+
+    if broken:
+        print(f"工作进程异常退出，未完成的商品已记为失败；重新运行同一命令即可从 {manifest_path} 继续")
+    elapsed = time.perf_counter() - start
+    stats['seconds'] = round(elapsed, 3)
+    stats['posters_per_minute'] = round(stats['posters'] / elapsed * 60, 2) if elapsed > 0 else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面批量生成商品海报")
+    parser.add_argument('catalog', help="商品清单文件 (.csv 或 .jsonl)")
+    parser.add_argument('--out', default=os.path.join('..', 'output', 'batch'), help="输出目录")
+    parser.add_argument('--size', default='1080x1920',
+                        help="海报尺寸，多个尺寸用逗号分隔，如 1080x1920,1920x1080,1200x1200")
+    parser.add_argument('--workers', type=int, default=1, help="工作进程数，每个进程加载一份模型")
+    parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR, help="MiniCPM-V 模型目录")
+    parser.add_argument('--device', default=DEFAULT_DEVICE, help="推理设备，如 CPU 或 GPU")
+    parser.add_argument('--no-analyze', action='store_true', help="跳过图片分析，只用清单中的文案排版")
+    parser.add_argument('--no-retry-failed', action='store_true', help="续跑时不重试之前失败的商品")
+    args = parser.parse_args()
+
+    stats = run_batch(
+        args.catalog, args.out, sizes=args.size.split(','), workers=args.workers,
+        model_dir=args.model_dir, device=args.device, analyze=not args.no_analyze,
+        retry_failed=not args.no_retry_failed,
+    )
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
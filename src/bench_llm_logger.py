@@ -0,0 +1,175 @@
+"""LLMLogger 调用开销的基准测试
+
+对比两种写法在调用方线程上的耗时（每次模型调用记录一次输入消息和一次响应）：
+- sync：原来的写法，在调用线程中逐条格式化(indent=2)并同步写入文件；
+- queued：当前的 LLMLogger，调用线程只入队，序列化和写入在后台线程完成。
+
+--chat-messages 时输入消息使用与 smolagents ChatMessage 相同形式的对象（角色为枚举），
+并检查增量记录能否还原出每一步完整的输入。
+
+用法示例：
+    python bench_llm_logger.py --steps 30 --runs 20
+    python bench_llm_logger.py --chat-messages
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from enum import Enum
+from typing import Any, Dict, List
+
+from utils.llm_log_viewer import format_record
+from utils.llm_logger import LLMLogger, expand_records, read_records, to_jsonable
+
+
+class Role(str, Enum):
+    """与 smolagents 的 MessageRole 相同的字符串枚举"""
+    SYSTEM = "system"
+    USER = "user"
+    ASSISTANT = "assistant"
+    TOOL_RESPONSE = "tool-response"
+
+
+class ChatMessageLike:
+    """与 smolagents ChatMessage 形式相同的消息对象，避免基准依赖 smolagents"""
+
+    def __init__(self, role: Role, content: Any, tool_calls: Any = None):
+        self.role = role
+        self.content = content
+        self.tool_calls = tool_calls
+
+
+class SyncPrettyLogger:
+    """原 LLMLogger 的同步写法，作为对照"""
+
+    def __init__(self, path: str):
+        self.logger = logging.getLogger('LLMLoggerBench')
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.logger.handlers = []
+        handler = logging.FileHandler(path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+        self.logger.addHandler(handler)
+        self.conversation_counter = 0
+
+    def _log(self, record_type: str, data: Any):
+        record = {"conv": self.conversation_counter, "type": record_type, "data": data}
+        for line in format_record(record):
+            self.logger.info(line)
+
+    def log_messages(self, messages: List[Dict[str, Any]]):
+        self.conversation_counter += 1
+        self._log("conversation_start", None)
+        self._log("messages", to_jsonable(messages))
+
+    def log_response(self, response: Any):
+        self._log("response", response)
+
+    def close(self):
+        for handler in self.logger.handlers:
+            handler.close()
+        self.logger.handlers = []
+
+
+def synthetic_run(steps: int, chat_messages: bool = False) -> List[List[Any]]:
+    """模拟一次智能体运行中每一步的输入消息：历史逐步增长，工具输出约2KB
+
+    chat_messages=True 时每条消息转换为 ChatMessageLike 对象。
+    """
+    history = [
+        {"role": "system", "content": [{"type": "text", "text": "你是海报设计助手。" * 80}]},
+        {"role": "user", "content": [{"type": "text", "text": "制作一张保温杯的海报"}]},
+    ]
+    per_step = []
+    for step in range(steps):
+        per_step.append(list(history))
+        history.append({"role": "assistant", "content": f"调用工具 step {step}",
+                        "tool_calls": [{"id": f"call_{step}", "type": "function",
+                                        "function": {"name": "get_product_description",
+                                                     "arguments": {"product_name": "保温杯"}}}]})
+        history.append({"role": "tool-response", "tool_call_id": f"call_{step}",
+                        "content": [{"type": "text", "text": json.dumps({"description": "保温杯" * 300},
+                                                                        ensure_ascii=False)}]})
+    if chat_messages:
+        converted: Dict[int, ChatMessageLike] = {}
+        per_step = [[converted.setdefault(id(m), ChatMessageLike(Role(m["role"]), m["content"], m.get("tool_calls")))
+                     for m in messages] for messages in per_step]
+    return per_step
+
+
+def check_deltas(log_file: str, per_step: List[List[Any]]) -> Dict[str, Any]:
+    """检查日志中的增量记录：从头写出完整列表(base=0)的次数，以及还原结果是否与输入一致"""
+    expected = [to_jsonable(messages) for messages in per_step]
+    restarts = 0
+    mismatches = 0
+    index = 0
+    records = list(read_records(log_file))
+    for record in records:
+        if record.get("type") == "messages_delta" and record["data"]["base"] == 0:
+            restarts += 1
+    for record in expand_records(records):
+        if record.get("type") == "messages":
+            if record["data"] != expected[index % len(expected)]:
+                mismatches += 1
+            index += 1
+    return {"steps": index, "full_restarts": restarts, "mismatches": mismatches}
+
+
+def measure(logger: Any, per_step: List[List[Any]], runs: int) -> List[float]:
+    response = {"role": "assistant", "content": "好的，下一步生成背景。" * 20}
+    durations = []
+    for _ in range(runs):
+        for messages in per_step:
+            start = time.perf_counter()
+            logger.log_messages(messages)
+            logger.log_response(response)
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    durations = sorted(durations)
+    return {
+        "calls": len(durations),
+        "mean_us": round(statistics.mean(durations) * 1e6, 1),
+        "p50_us": round(durations[len(durations) // 2] * 1e6, 1),
+        "p99_us": round(durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLMLogger 调用开销基准")
+    parser.add_argument('--steps', type=int, default=30, help="每次运行的步数")
+    parser.add_argument('--runs', type=int, default=10, help="运行次数")
+    parser.add_argument('--chat-messages', action='store_true', help="输入消息使用 ChatMessage 形式的对象")
+    args = parser.parse_args()
+
+    per_step = synthetic_run(args.steps, args.chat_messages)
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_logger = SyncPrettyLogger(os.path.join(tmp, 'sync.log'))
+        report["sync"] = summarize(measure(sync_logger, per_step, args.runs))
+        sync_logger.close()
+
+        # 日志写入临时目录，不混进 log/ 中的真实调用记录
+        queued_logger = LLMLogger(log_dir=tmp)
+        start = time.perf_counter()
+        report["queued"] = summarize(measure(queued_logger, per_step, args.runs))
+        queued_logger.close()
+        # 包括后台线程写完全部记录的时间
+        report["queued"]["drain_seconds"] = round(time.perf_counter() - start, 3)
+        report["queued"]["log_bytes"] = os.path.getsize(queued_logger.log_file)
+        # 同一任务的各步只有第一次写出完整列表，之后都只写新增的消息
+        report["queued"]["deltas"] = check_deltas(queued_logger.log_file, per_step)
+        os.remove(queued_logger.log_file)
+        report["sync"]["log_bytes"] = os.path.getsize(os.path.join(tmp, 'sync.log'))
+
+    report["speedup"] = round(report["sync"]["mean_us"] / max(report["queued"]["mean_us"], 1e-3), 1)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
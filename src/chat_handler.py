@@ -1,41 +1,305 @@
+import time
+from collections import deque
+from functools import partial
+from typing import Callable, Dict, List, Optional, Union
 from PyQt5.QtCore import QObject, pyqtSignal
-from llm_ollama import ChatWorker
+from llm_ollama import ChatWorker, DEFAULT_KEEP_ALIVE
+from chat_session import ChatSession, estimate_tokens
+from think_parser import ThinkStreamParser
+from utils.token_accounting import TokenLedger
 
 class ChatHandler(QObject):
     """处理聊天相关的逻辑，作为GUI和LLM之间的中间层"""
     message_received = pyqtSignal(str)  # 用户消息信号
-    ai_stream = pyqtSignal(str)         # AI流式响应信号
+    ai_stream = pyqtSignal(str)         # AI流式响应信号，只发送回答部分的增量文本
+    ai_reasoning = pyqtSignal(str)      # <think> 推理部分的增量文本
+    ai_stats = pyqtSignal(dict)         # 回答完成后推理/回答各自的token数和生成速度，以及本次和会话累计的用量
+    ai_reconcile = pyqtSignal(str)      # 流式结果与最终结果不一致时，发送完整文本用于替换
     ai_finished = pyqtSignal()          # AI响应完成信号
     error_occurred = pyqtSignal(str)    # 错误信号
-    
+    ai_cancelled = pyqtSignal(str)      # 回答被停止或被新消息取代，发送已显示的部分文本
+
+    # 多模型对比(fan-out)模式的信号
+    fanout_started = pyqtSignal(list)        # 参与对比的模型列表
+    fanout_stream = pyqtSignal(str, str)     # (模型, 增量文本)
+    fanout_model_finished = pyqtSignal(str, dict)  # (模型, 统计信息)，出错时统计中带 error
+    fanout_finished = pyqtSignal(dict)       # 全部模型完成，{模型: 统计信息} 及总耗时
+    fanout_cancelled = pyqtSignal()          # 对比被停止
+
+    # 对比模式默认同时请求的模型数，避免小显存机器同时加载过多模型
+    FANOUT_CONCURRENCY = 2
+
     def __init__(self):
         super().__init__()
         self.worker = None
-        self.current_response = ""
-    
-    def send_message(self, message: str, model: str):
-        """发送消息到LLM"""
+        self._active = False  # 当前worker的回答是否仍在进行
+        self.session = ChatSession()
+        self._pending_question = ""
+        self._response_parts = []
+        self._last_seq = 0
+        self._out_of_order = False
+        self._parser = ThinkStreamParser()
+        # 会话内每次回答的token用量，每轮对话记为一步
+        self.token_ledger = TokenLedger()
+
+        self._fanout_run = 0
+        self._fanout_active = False
+        self._fanout_queue = deque()
+        self._fanout_workers: Dict[str, ChatWorker] = {}
+        self._fanout_start: Dict[str, float] = {}
+        self._fanout_stats: Dict[str, dict] = {}
+        self._fanout_total = 0
+        self._fanout_begin = 0.0
+        self._fanout_options = {}
+        self._fanout_question = ""
+        self._fanout_keep_alive: Optional[Callable[[str], Union[str, int]]] = None
+        # 已取消但线程尚未退出的worker，保持引用直到线程结束
+        self._retired_workers: List[ChatWorker] = []
+
+    @property
+    def is_busy(self) -> bool:
+        """是否有回答（或多模型对比）正在进行"""
+        return self._active or self._fanout_active
+
+    @property
+    def current_response(self) -> str:
+        """当前已收到的回答文本"""
+        return "".join(self._response_parts)
+
+    def send_message(self, message: str, model: str, temperature: float = 0.7, use_cache: bool = False,
+                     keep_alive=DEFAULT_KEEP_ALIVE):
+        """发送消息到LLM
+
+        Args:
+            message: 用户消息
+            model: 模型名称
+            temperature: 采样温度，为0时自动使用响应缓存
+            use_cache: 温度不为0时也使用响应缓存
+            keep_alive: 模型在服务端的保留时长
+        """
         if not message.strip():
             return
-            
+
+        # 新消息取代仍在进行的回答
+        self.cancel()
         self.message_received.emit(message)
-        
-        # 创建并启动worker
-        self.worker = ChatWorker(message, model)
+        self._response_parts = []
+        self._last_seq = 0
+        self._out_of_order = False
+        self._parser = ThinkStreamParser()
+        self.token_ledger.next_step()
+
+        # 带上对话历史，历史超出模型预算时会自动压缩
+        messages = self.session.build_messages(message, model)
+        self._pending_question = message
+
+        # 创建并启动worker；上一个worker发出完成信号后线程可能还没退出，先保留其引用
+        if self.worker is not None:
+            self._retire(self.worker)
+        self.worker = ChatWorker(message, model, messages=messages,
+                                 temperature=temperature, use_cache=use_cache, keep_alive=keep_alive)
         self.worker.stream.connect(self.handle_stream)
         self.worker.finished.connect(self.handle_response)
         self.worker.error.connect(self.handle_error)
+        self._active = True
         self.worker.start()
-    
-    def handle_stream(self, text: str):
-        """处理流式输出"""
-        self.current_response = text
-        self.ai_stream.emit(text)
-    
-    def handle_response(self, full_response: str):
-        """处理完整响应"""
+
+    def _retire(self, worker: ChatWorker):
+        """保存已取消的worker的引用，直到其线程退出"""
+        self._retired_workers = [w for w in self._retired_workers if w.isRunning()]
+        if worker.isRunning():
+            self._retired_workers.append(worker)
+
+    def cancel(self) -> bool:
+        """停止正在进行的回答和多模型对比
+
+        worker 会在下一段输出到达时关闭HTTP流并退出，其后发出的信号全部忽略。
+
+        Returns:
+            是否有请求被取消
+        """
+        cancelled = False
+        if self._active and self.worker is not None:
+            self.worker.cancel()
+            self._retire(self.worker)
+            self.worker = None
+            self._active = False
+            self.ai_cancelled.emit(self.current_response)
+            cancelled = True
+        if self._fanout_active:
+            # 递增轮次后，本轮worker的信号都会被忽略
+            self._fanout_run += 1
+            self._fanout_queue.clear()
+            for worker in self._fanout_workers.values():
+                worker.cancel()
+                self._retire(worker)
+            self._fanout_workers = {}
+            self._fanout_active = False
+            self.fanout_cancelled.emit()
+            cancelled = True
+        return cancelled
+
+    def shutdown(self, timeout_ms: int = 3000):
+        """取消所有请求并等待工作线程退出，在关闭窗口时调用"""
+        self.cancel()
+        for worker in self._retired_workers:
+            worker.wait(timeout_ms)
+        self._retired_workers = []
+
+    def send_fanout(self, message: str, models: List[str], max_concurrency: int = FANOUT_CONCURRENCY,
+                    temperature: float = 0.7, use_cache: bool = False,
+                    keep_alive: Optional[Callable[[str], Union[str, int]]] = None):
+        """把同一问题同时发送给多个模型，用于对比文案
+
+        最多同时运行 max_concurrency 个请求，其余排队，某个模型完成后立即启动下一个，
+        总耗时接近最慢的模型而不是所有模型之和。对比结果不写入对话历史。
+
+        Args:
+            keep_alive: 按模型返回保留时长的函数，避免对比请求缩短常驻模型的保留时间；
+                为None时使用默认保留时长
+        """
+        if not message.strip() or not models:
+            return
+
+        self.cancel()
+        self.message_received.emit(message)
+        self._fanout_run += 1
+        self.token_ledger.next_step()
+        self._fanout_active = True
+        self._fanout_queue = deque(models)
+        for worker in self._fanout_workers.values():
+            self._retire(worker)
+        self._fanout_workers = {}
+        self._fanout_start = {}
+        self._fanout_stats = {}
+        self._fanout_total = len(models)
+        self._fanout_begin = time.monotonic()
+        self._fanout_options = {"temperature": temperature, "use_cache": use_cache}
+        self._fanout_keep_alive = keep_alive
+        self._fanout_question = message
+        self.fanout_started.emit(list(models))
+
+        for _ in range(max(1, max_concurrency)):
+            self._start_next_fanout()
+
+    def _start_next_fanout(self):
+        if not self._fanout_queue:
+            return
+        model = self._fanout_queue.popleft()
+        run = self._fanout_run
+        # 各模型的上下文窗口不同，按各自的token预算组装消息
+        messages = self.session.build_messages(self._fanout_question, model)
+        keep_alive = self._fanout_keep_alive(model) if self._fanout_keep_alive else DEFAULT_KEEP_ALIVE
+        worker = ChatWorker(self._fanout_question, model, messages=messages, keep_alive=keep_alive,
+                            **self._fanout_options)
+        worker.stream.connect(partial(self._handle_fanout_stream, run, model))
+        worker.finished.connect(partial(self._handle_fanout_finished, run, model))
+        worker.error.connect(partial(self._handle_fanout_error, run, model))
+        self._fanout_workers[model] = worker
+        self._fanout_start[model] = time.monotonic()
+        worker.start()
+
+    def _handle_fanout_stream(self, run: int, model: str, seq: int, delta: str):
+        if run == self._fanout_run:
+            self.fanout_stream.emit(model, delta)
+
+    def _fanout_model_stats(self, model: str, worker: ChatWorker, text: str = "") -> dict:
+        """统计单个模型的延迟和生成速度"""
+        end = time.monotonic()
+        start = self._fanout_start[model]
+        first = worker.first_token_time or end
+        # 服务端没有返回 eval_count（如命中缓存）时按文本估算
+        tokens = worker.eval_tokens or estimate_tokens(text)
+        generate_seconds = end - first
+        return {
+            "latency": round(end - start, 3),
+            "first_token": round(first - start, 3),
+            "tokens": tokens,
+            "tokens_per_second": round(tokens / generate_seconds, 1) if generate_seconds > 0 else 0.0,
+            "from_cache": worker.from_cache,
+        }
+
+    def _record_usage(self, worker: ChatWorker) -> dict:
+        """把一次回答的用量记入会话账本，优先使用服务端返回的计数和耗时"""
+        if worker.usage:
+            usage = worker.usage
+            return self.token_ledger.record(worker.model, usage["prompt_tokens"], usage["completion_tokens"],
+                                            seconds=usage["total_seconds"], eval_seconds=usage["eval_seconds"],
+                                            prompt_seconds=usage["prompt_seconds"])
+        return self.token_ledger.record(worker.model, worker.prompt_tokens, worker.eval_tokens,
+                                        cached=worker.from_cache)
+
+    def _finish_fanout_model(self, model: str, stats: dict):
+        self._fanout_stats[model] = stats
+        self.fanout_model_finished.emit(model, stats)
+        if len(self._fanout_stats) == self._fanout_total:
+            self._fanout_active = False
+            summary = dict(self._fanout_stats)
+            summary["total_seconds"] = round(time.monotonic() - self._fanout_begin, 3)
+            self.fanout_finished.emit(summary)
+        else:
+            self._start_next_fanout()
+
+    def _handle_fanout_finished(self, run: int, model: str, last_seq: int, full_response: str):
+        if run != self._fanout_run:
+            return
+        worker = self._fanout_workers[model]
+        stats = self._fanout_model_stats(model, worker, full_response)
+        stats["usage"] = self._record_usage(worker)
+        self._finish_fanout_model(model, stats)
+
+    def _handle_fanout_error(self, run: int, model: str, error_msg: str):
+        if run != self._fanout_run:
+            return
+        worker = self._fanout_workers[model]
+        stats = self._fanout_model_stats(model, worker)
+        stats["error"] = error_msg
+        self._finish_fanout_model(model, stats)
+
+    def reset_session(self):
+        """清空多轮对话历史"""
+        self.session.reset()
+        self.token_ledger.start_run()
+
+    def handle_stream(self, seq: int, delta: str):
+        """处理流式输出的增量"""
+        if self.sender() is not self.worker:
+            return
+        if seq != self._last_seq + 1:
+            # 序号不连续，结束时用完整文本校对
+            self._out_of_order = True
+        self._last_seq = seq
+        self._response_parts.append(delta)
+        # 增量拆分推理和回答，界面可以分开显示或直接丢弃推理部分
+        reasoning, answer = self._parser.feed(delta)
+        if reasoning:
+            self.ai_reasoning.emit(reasoning)
+        if answer:
+            self.ai_stream.emit(answer)
+
+    def handle_response(self, last_seq: int, full_response: str):
+        """处理完整响应，必要时校对已显示的文本"""
+        if self.sender() is not self.worker:
+            return
+        reasoning, answer = self._parser.finish()
+        if reasoning:
+            self.ai_reasoning.emit(reasoning)
+        if answer:
+            self.ai_stream.emit(answer)
+        if self._out_of_order or last_seq != self._last_seq or self.current_response != full_response:
+            self._response_parts = [full_response]
+            self.ai_reconcile.emit(ThinkStreamParser.split(full_response)[1])
+        self._active = False
+        self.session.add_turn(self._pending_question, full_response, self.worker.prompt_tokens)
+        stats = self._parser.stats(self.worker.eval_tokens)
+        stats["usage"] = self._record_usage(self.worker)
+        stats["session"] = self.token_ledger.totals()
+        self.ai_stats.emit(stats)
         self.ai_finished.emit()
-    
+
     def handle_error(self, error_msg: str):
         """处理错误"""
-        self.error_occurred.emit(error_msg) 
\ No newline at end of file
+        if self.sender() is not self.worker:
+            return
+        self._active = False
+        self.error_occurred.emit(error_msg)
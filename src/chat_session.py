@@ -0,0 +1,135 @@
+import re
+from typing import Dict, List, Optional
+
+from llm_ollama import MODEL_CONTEXT_WINDOW, DEFAULT_CONTEXT_WINDOW
+
+# 默认系统提示，保持固定不变，使 Ollama 能复用同一段前缀的KV缓存
+DEFAULT_SYSTEM_PROMPT = "你是一个专业的电商海报文案助手，回答简洁、有吸引力，使用中文。"
+
+_THINK_RE = re.compile(r"<think>.*?</think>", re.S)
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本的token数：中文约每字1个token，其余约每4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def strip_reasoning(text: str) -> str:
+    """去掉 deepseek-r1 的 <think> 推理部分，历史中只保留最终回答"""
+    return _THINK_RE.sub("", text).strip()
+
+
+class ChatSession:
+    """多轮对话记忆
+
+    历史以 chat 格式保存，每个模型有各自的token预算。为了让 Ollama 的提示缓存命中，
+    发送的消息列表总是 [系统提示, (摘要), 历史..., 新问题]，历史只在末尾追加；
+    超出预算时一次性把较早的一半轮次压缩成摘要，而不是每轮滑动一条，
+    这样前缀在多轮之间保持不变，只有压缩时才会重建一次缓存。
+    """
+
+    # 为模型回答预留的token数
+    RESPONSE_RESERVE = 1024
+    # 摘要中每条旧消息保留的字符数
+    SUMMARY_CHARS_PER_MESSAGE = 60
+    # 摘要的总长度上限，超出时丢弃最早的条目
+    MAX_SUMMARY_CHARS = 1500
+
+    def __init__(self, system_prompt: str = DEFAULT_SYSTEM_PROMPT):
+        self.system_prompt = system_prompt
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self.last_prompt_tokens = 0
+
+    def reset(self):
+        """清空对话历史"""
+        self.summary = ""
+        self.turns = []
+        self.last_prompt_tokens = 0
+
+    @staticmethod
+    def context_window(model: str) -> int:
+        return MODEL_CONTEXT_WINDOW.get(model, DEFAULT_CONTEXT_WINDOW)
+
+    def token_budget(self, model: str) -> int:
+        """发送给指定模型的提示最多可以使用的token数"""
+        return max(256, self.context_window(model) - self.RESPONSE_RESERVE)
+
+    def _prefix(self) -> List[Dict[str, str]]:
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": f"较早的对话摘要：\n{self.summary}"})
+        return messages
+
+    @staticmethod
+    def _count(messages: List[Dict[str, str]]) -> int:
+        # 每条消息额外计入少量模板token
+        return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+    def _compact(self):
+        """把较早的一半历史压缩进摘要"""
+        keep_from = len(self.turns) // 2
+        # 保证保留部分从用户消息开始
+        while keep_from < len(self.turns) and self.turns[keep_from]["role"] != "user":
+            keep_from += 1
+        dropped, self.turns = self.turns[:keep_from], self.turns[keep_from:]
+
+        lines = [self.summary] if self.summary else []
+        for message in dropped:
+            speaker = "用户" if message["role"] == "user" else "助手"
+            content = message["content"].replace("\n", " ")
+            if len(content) > self.SUMMARY_CHARS_PER_MESSAGE:
+                content = content[:self.SUMMARY_CHARS_PER_MESSAGE] + "…"
+            lines.append(f"{speaker}：{content}")
+        summary = "\n".join(lines)
+        if len(summary) > self.MAX_SUMMARY_CHARS:
+            summary = summary[-self.MAX_SUMMARY_CHARS:]
+            summary = summary[summary.find("\n") + 1:]
+        self.summary = summary
+
+    @classmethod
+    def _summary_tail(cls, summary: str, max_tokens: int) -> str:
+        """保留摘要末尾（最近的部分），使摘要消息不超过 max_tokens"""
+        overhead = cls._count([{"role": "system", "content": "较早的对话摘要：\n"}])
+        # 二分查找能放下的最长末尾
+        low, high = 0, len(summary)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if estimate_tokens(summary[-mid:]) + overhead <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return summary[-low:] if low else ""
+
+    def build_messages(self, question: str, model: str) -> List[Dict[str, str]]:
+        """生成本轮要发送的消息列表，必要时压缩历史以满足模型的token预算"""
+        budget = self.token_budget(model)
+        new_message = {"role": "user", "content": question}
+        while True:
+            messages = self._prefix() + self.turns + [new_message]
+            tokens = self._count(messages)
+            if tokens <= budget or not self.turns:
+                break
+            self._compact()
+
+        if tokens > budget and self.summary:
+            # 摘要本身也超出预算时只保留最近的部分，按token数截取
+            summary, self.summary = self.summary, ""
+            available = budget - self._count(self._prefix() + [new_message])
+            self.summary = self._summary_tail(summary, available)
+            messages = self._prefix() + [new_message]
+            tokens = self._count(messages)
+
+        self.last_prompt_tokens = tokens
+        return messages
+
+    def add_turn(self, question: str, answer: str, prompt_tokens: Optional[int] = None):
+        """记录一轮完成的对话"""
+        self.turns.append({"role": "user", "content": question})
+        self.turns.append({"role": "assistant", "content": strip_reasoning(answer)})
+        if prompt_tokens:
+            self.last_prompt_tokens = prompt_tokens
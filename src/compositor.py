@@ -0,0 +1,301 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# 矩形区域统一使用 (x0, y0, x1, y1)，右下角为开区间
+Rect = Tuple[int, int, int, int]
+
+# 常见中文字体候选，按顺序尝试
+FONT_CANDIDATES = [
+    "msyh.ttc",                                   # Windows 微软雅黑
+    "C:/Windows/Fonts/msyh.ttc",
+    "/System/Library/Fonts/PingFang.ttc",         # macOS
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+]
+
+_font_cache: Dict[Tuple[Optional[str], int], ImageFont.ImageFont] = {}
+
+
+def load_font(size: int, font_path: Optional[str] = None) -> ImageFont.ImageFont:
+    """按字号加载字体，找不到中文字体时退回PIL默认字体"""
+    key = (font_path, size)
+    if key in _font_cache:
+        return _font_cache[key]
+
+    candidates = [font_path] if font_path else FONT_CANDIDATES
+    font = None
+    for path in candidates:
+        try:
+            font = ImageFont.truetype(path, size)
+            break
+        except (OSError, IOError):
+            continue
+    if font is None:
+        try:
+            # Pillow>=10.1 的默认字体支持指定字号
+            font = ImageFont.load_default(size)
+        except TypeError:
+            font = ImageFont.load_default()
+
+    _font_cache[key] = font
+    return font
+
+
+def intersect(a: Rect, b: Rect) -> Optional[Rect]:
+    """求两个矩形的交集，没有交集时返回None"""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1, y1)
+
+
+def union(a: Rect, b: Rect) -> Rect:
+    """求包含两个矩形的最小矩形"""
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def rect_area(rect: Rect) -> int:
+    return (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+
+def merge_rects(rects: List[Rect]) -> List[Rect]:
+    """合并相互重叠的脏区域，避免同一块像素被重复合成"""
+    merged: List[Rect] = []
+    for rect in rects:
+        current = rect
+        changed = True
+        while changed:
+            changed = False
+            for other in merged:
+                if intersect(current, other) is not None:
+                    merged.remove(other)
+                    current = union(current, other)
+                    changed = True
+                    break
+        merged.append(current)
+    return merged
+
+
+class Layer:
+    """海报图层：RGBA像素数据及其在画布上的位置"""
+
+    def __init__(self, name: str, pixels: np.ndarray, x: int = 0, y: int = 0,
+                 opacity: float = 1.0, visible: bool = True):
+        """
+        Args:
+            name: 图层名称，在同一画布内唯一
+            pixels: HxWx4(RGBA) 或 HxWx3(RGB) 的uint8数组
+            x, y: 图层左上角在画布上的坐标
+            opacity: 整体不透明度 0~1
+            visible: 是否参与合成
+        """
+        self.name = name
+        self.x = int(x)
+        self.y = int(y)
+        self.opacity = float(opacity)
+        self.visible = visible
+        self.set_pixels(pixels)
+
+    def set_pixels(self, pixels: np.ndarray) -> None:
+        """设置图层像素，预先拆分颜色和alpha以便合成时直接使用"""
+        if pixels.ndim != 3 or pixels.shape[2] not in (3, 4):
+            raise ValueError(f"图层 {self.name} 的像素形状无效: {pixels.shape}")
+        self.height, self.width = pixels.shape[:2]
+        self.rgb = np.ascontiguousarray(pixels[..., :3], dtype=np.float32)
+        if pixels.shape[2] == 4:
+            self.alpha = pixels[..., 3:4].astype(np.float32) / 255.0
+            self.opaque = bool(np.all(pixels[..., 3] == 255))
+        else:
+            self.alpha = np.ones((self.height, self.width, 1), dtype=np.float32)
+            self.opaque = True
+
+    @property
+    def bounds(self) -> Rect:
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+
+    @staticmethod
+    def from_image(name: str, image: Image.Image, x: int = 0, y: int = 0, **kwargs) -> 'Layer':
+        """由PIL图片创建图层（如背景图、产品抠图）"""
+        return Layer(name, np.asarray(image.convert('RGBA')), x, y, **kwargs)
+
+    @staticmethod
+    def from_text(name: str, text: str, x: int, y: int, font_size: int = 48,
+                  color: Tuple[int, int, int] = (0, 0, 0), font_path: Optional[str] = None,
+                  line_spacing: int = 8, **kwargs) -> 'Layer':
+        """将文字栅格化为透明底的文本图层"""
+        image = render_text_image(text, font_size, color, font_path, line_spacing)
+        return Layer.from_image(name, image, x, y, **kwargs)
+
+    @staticmethod
+    def price_badge(name: str, text: str, x: int, y: int, font_size: int = 56,
+                    fill: Tuple[int, int, int] = (230, 40, 50),
+                    text_color: Tuple[int, int, int] = (255, 255, 255),
+                    padding: int = 24, font_path: Optional[str] = None, **kwargs) -> 'Layer':
+        """生成圆角矩形价格角标图层"""
+        image = render_badge_image(text, font_size, fill, text_color, padding, font_path)
+        return Layer.from_image(name, image, x, y, **kwargs)
+
+
+def render_text_image(text: str, font_size: int = 48, color: Tuple[int, int, int] = (0, 0, 0),
+                      font_path: Optional[str] = None, line_spacing: int = 8) -> Image.Image:
+    """将文字栅格化为刚好包住文字的透明底RGBA图片"""
+    font = load_font(font_size, font_path)
+    probe = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+    left, top, right, bottom = probe.multiline_textbbox((0, 0), text, font=font, spacing=line_spacing)
+    width, height = max(1, right - left), max(1, bottom - top)
+
+    canvas = Image.new('RGBA', (width, height), tuple(color) + (0,))
+    draw = ImageDraw.Draw(canvas)
+    draw.multiline_text((-left, -top), text, font=font, fill=tuple(color) + (255,), spacing=line_spacing)
+    return canvas
+
+
+def render_badge_image(text: str, font_size: int = 56, fill: Tuple[int, int, int] = (230, 40, 50),
+                       text_color: Tuple[int, int, int] = (255, 255, 255), padding: int = 24,
+                       font_path: Optional[str] = None) -> Image.Image:
+    """绘制圆角矩形价格角标的RGBA图片"""
+    font = load_font(font_size, font_path)
+    probe = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+    left, top, right, bottom = probe.textbbox((0, 0), text, font=font)
+    width = right - left + padding * 2
+    height = bottom - top + padding * 2
+
+    canvas = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(canvas)
+    draw.rounded_rectangle((0, 0, width - 1, height - 1), radius=height // 2, fill=tuple(fill) + (255,))
+    draw.text((padding - left, padding - top), text, font=font, fill=tuple(text_color) + (255,))
+    return canvas
+
+
+class PosterCompositor:
+    """分层海报合成器
+
+    图层按添加顺序自下而上叠放（背景 → 产品抠图 → 文字 → 价格角标），
+    使用NumPy向量化做alpha混合。每次修改只记录受影响的脏矩形，
+    render() 时只重新合成这些区域，便于交互式编辑预览。
+    """
+
+    # 脏区域超过画布面积的该比例时直接整体重绘
+    FULL_REDRAW_RATIO = 0.6
+
+    def __init__(self, width: int, height: int, background_color: Tuple[int, int, int] = (255, 255, 255)):
+        self.width = width
+        self.height = height
+        self.background_color = np.array(background_color, dtype=np.float32)
+        self.layers: List[Layer] = []
+        self._canvas = np.empty((height, width, 3), dtype=np.uint8)
+        self._dirty: List[Rect] = [self.full_rect]
+
+    @property
+    def full_rect(self) -> Rect:
+        return (0, 0, self.width, self.height)
+
+    @property
+    def dirty_rects(self) -> List[Rect]:
+        return list(self._dirty)
+
+    def get_layer(self, name: str) -> Layer:
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        raise KeyError(f"图层不存在: {name}")
+
+    def mark_dirty(self, rect: Rect) -> None:
+        """标记需要重新合成的区域"""
+        clipped = intersect(rect, self.full_rect)
+        if clipped is not None:
+            self._dirty.append(clipped)
+
+    def add_layer(self, layer: Layer, index: Optional[int] = None) -> Layer:
+        """添加图层，index为None时放在最上层"""
+        if any(existing.name == layer.name for existing in self.layers):
+            raise ValueError(f"图层名称重复: {layer.name}")
+        if index is None:
+            self.layers.append(layer)
+        else:
+            self.layers.insert(index, layer)
+        self.mark_dirty(layer.bounds)
+        return layer
+
+    def remove_layer(self, name: str) -> None:
+        layer = self.get_layer(name)
+        self.layers.remove(layer)
+        self.mark_dirty(layer.bounds)
+
+    def replace_layer(self, layer: Layer) -> Layer:
+        """用同名新图层替换旧图层，保持叠放顺序（如重新生成某个文本块）"""
+        old = self.get_layer(layer.name)
+        self.layers[self.layers.index(old)] = layer
+        self.mark_dirty(old.bounds)
+        self.mark_dirty(layer.bounds)
+        return layer
+
+    def update_layer(self, name: str, pixels: Optional[np.ndarray] = None, x: Optional[int] = None,
+                     y: Optional[int] = None, opacity: Optional[float] = None,
+                     visible: Optional[bool] = None) -> Layer:
+        """修改图层属性，旧位置和新位置都会被标记为脏区域"""
+        layer = self.get_layer(name)
+        self.mark_dirty(layer.bounds)
+        if pixels is not None:
+            layer.set_pixels(pixels)
+        if x is not None:
+            layer.x = int(x)
+        if y is not None:
+            layer.y = int(y)
+        if opacity is not None:
+            layer.opacity = float(opacity)
+        if visible is not None:
+            layer.visible = visible
+        self.mark_dirty(layer.bounds)
+        return layer
+
+    def _composite_region(self, rect: Rect) -> None:
+        """重新合成一个矩形区域"""
+        x0, y0, x1, y1 = rect
+        region = np.empty((y1 - y0, x1 - x0, 3), dtype=np.float32)
+        region[:] = self.background_color
+
+        for layer in self.layers:
+            if not layer.visible or layer.opacity <= 0:
+                continue
+            overlap = intersect(rect, layer.bounds)
+            if overlap is None:
+                continue
+            ox0, oy0, ox1, oy1 = overlap
+            src = layer.rgb[oy0 - layer.y:oy1 - layer.y, ox0 - layer.x:ox1 - layer.x]
+            dst = region[oy0 - y0:oy1 - y0, ox0 - x0:ox1 - x0]
+
+            if layer.opaque and layer.opacity >= 1.0:
+                dst[:] = src
+                continue
+            alpha = layer.alpha[oy0 - layer.y:oy1 - layer.y, ox0 - layer.x:ox1 - layer.x]
+            if layer.opacity < 1.0:
+                alpha = alpha * layer.opacity
+            # dst = src * a + dst * (1 - a)，原地计算减少临时数组
+            dst -= src
+            dst *= 1.0 - alpha
+            dst += src
+
+        np.clip(region, 0, 255, out=region)
+        self._canvas[y0:y1, x0:x1] = (region + 0.5).astype(np.uint8)
+
+    def render(self) -> np.ndarray:
+        """合成所有脏区域，返回 HxWx3 的uint8画布（内部缓冲区，勿修改）"""
+        if not self._dirty:
+            return self._canvas
+
+        rects = merge_rects(self._dirty)
+        if sum(rect_area(r) for r in rects) >= self.FULL_REDRAW_RATIO * rect_area(self.full_rect):
+            rects = [self.full_rect]
+        for rect in rects:
+            self._composite_region(rect)
+
+        self._dirty = []
+        return self._canvas
+
+    def to_image(self) -> Image.Image:
+        """合成并返回PIL图片"""
+        return Image.fromarray(self.render().copy(), 'RGB')
@@ -0,0 +1,348 @@
+"""本地模拟的 Ollama 服务，用于离线测试和压测
+
+实现 /api/generate 和 /api/chat（流式与非流式），以及 /api/tags、/api/show、/api/ps、
+/api/version。回答可以来自录制文件，也可以按模型合成（deepseek-r1 会带 <think> 部分），
+并按配置的首字延迟、生成速度、模型加载时间和错误率输出。客户端中途断开时立即停止生成，
+与真实 Ollama 的行为一致。GET /stats 返回请求、完成、中断、错误等计数。
+
+用法示例：
+    python fake_ollama_server.py --port 11435 --rate 40 --latency 0.3 --error-rate 0.05
+    set OLLAMA_HOST=http://127.0.0.1:11435  然后运行 app.py / load_test.py
+
+录制文件为 JSONL，每行 {"response": "...", "match": "可选，出现在最后一条用户消息中时使用"}。
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+# 按中文单字、单词、标点切分，近似模型的token粒度
+_TOKEN_RE = re.compile(r"[㐀-鿿＀-￯　-〿]|\s*[A-Za-z0-9_]+|\s*[^\sA-Za-z0-9_]|\s+")
+
+_SYNTHETIC_SENTENCES = [
+    "这款产品采用精选材料打造，", "细节处理精致，", "兼顾颜值与实用，",
+    "适合日常通勤与户外出行，", "现在下单享受限时优惠，", "品质生活从这里开始。",
+]
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text)
+
+
+class FakeOllamaConfig:
+    """模拟服务的行为参数"""
+
+    def __init__(self, tokens_per_second: float = 30.0, first_token_latency: float = 0.2,
+                 load_time: float = 0.0, error_rate: float = 0.0, response_tokens: int = 200,
+                 responses_path: Optional[str] = None, seed: Optional[int] = None):
+        """
+        Args:
+            tokens_per_second: 每个请求的生成速度，0表示不限速
+            first_token_latency: 提示处理时间，即首个token之前的延迟(秒)
+            load_time: 模型首次加载(或卸载后再加载)的额外延迟(秒)
+            error_rate: 请求直接返回500错误的概率
+            response_tokens: 合成回答的token数
+            responses_path: 录制的回答(JSONL)，提供时优先回放
+            seed: 随机数种子，便于复现
+        """
+        self.tokens_per_second = tokens_per_second
+        self.first_token_latency = first_token_latency
+        self.load_time = load_time
+        self.error_rate = error_rate
+        self.response_tokens = response_tokens
+        self.recorded = self._load_recorded(responses_path) if responses_path else []
+        self.random = random.Random(seed)
+
+    @staticmethod
+    def _load_recorded(path: str) -> List[Dict[str, str]]:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class FakeOllamaState:
+    """服务端共享状态：已加载的模型和统计计数"""
+
+    def __init__(self, config: FakeOllamaConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.loaded_models = set()
+        self.counters = {"requests": 0, "completed": 0, "aborted": 0, "errors": 0,
+                         "active": 0, "max_active": 0, "tokens_sent": 0}
+        self._replay_index = 0
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+            if name == "active":
+                self.counters["max_active"] = max(self.counters["max_active"], self.counters["active"])
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters, loaded_models=sorted(self.loaded_models))
+
+    def ensure_loaded(self, model: str) -> float:
+        """返回本次请求需要的加载时间，模型已加载时为0"""
+        with self.lock:
+            if model in self.loaded_models:
+                return 0.0
+            self.loaded_models.add(model)
+        return self.config.load_time
+
+    def unload(self, model: str):
+        with self.lock:
+            self.loaded_models.discard(model)
+
+    def pick_response(self, model: str, prompt: str) -> str:
+        """选择要回放的回答：先按 match 匹配录制内容，其次轮流回放，最后合成"""
+        recorded = self.config.recorded
+        for entry in recorded:
+            if entry.get("match") and entry["match"] in prompt:
+                return entry["response"]
+        unmatched = [entry for entry in recorded if not entry.get("match")]
+        if unmatched:
+            with self.lock:
+                entry = unmatched[self._replay_index % len(unmatched)]
+                self._replay_index += 1
+            return entry["response"]
+        return self.synthetic_response(model)
+
+    def synthetic_response(self, model: str) -> str:
+        rng = self.config.random
+        target = self.config.response_tokens
+        parts: List[str] = []
+        count = 0
+        while count < target:
+            sentence = rng.choice(_SYNTHETIC_SENTENCES)
+            parts.append(sentence)
+            count += len(tokenize(sentence))
+        text = "".join(parts)
+        if model.startswith('deepseek-r1'):
+            # 推理模型先输出思考过程，约占回答长度的一半
+            thinking = "".join(rng.choice(_SYNTHETIC_SENTENCES) for _ in range(max(1, target // 20)))
+            text = f"<think>\n{thinking}\n</think>\n\n{text}"
+        return text
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeOllama/0.1'
+    state: FakeOllamaState = None
+
+    def log_message(self, format, *args):
+        # 压测时请求量很大，不打印访问日志
+        pass
+
+    def _send_json(self, status: int, payload: Any):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _begin_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._stream_started = True
+
+    def _write_chunk(self, payload: Dict[str, Any]):
+        data = (json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+    def do_GET(self):
+        # 延迟导入：压测脚本需要先启动本服务、设置 OLLAMA_HOST 后才能导入 llm_ollama
+        from llm_ollama import MODEL_LIST
+        if self.path == '/api/tags':
+            self._send_json(200, {"models": [{"name": m, "model": m} for m in MODEL_LIST]})
+        elif self.path == '/api/version':
+            self._send_json(200, {"version": "0.0.0-fake"})
+        elif self.path == '/api/ps':
+            self._send_json(200, {"models": [{"name": m, "model": m} for m in self.state.stats()["loaded_models"]]})
+        elif self.path == '/stats':
+            self._send_json(200, self.state.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        # 同一连接上的多个请求共用一个处理器实例，每个请求重新开始
+        self._stream_started = False
+        try:
+            request = self._read_body()
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+        if self.path == '/api/show':
+            from llm_ollama import MODEL_CONTEXT_WINDOW, DEFAULT_CONTEXT_WINDOW
+            model = request.get('model') or request.get('name', '')
+            context = MODEL_CONTEXT_WINDOW.get(model, DEFAULT_CONTEXT_WINDOW)
+            self._send_json(200, {"model_info": {"general.architecture": "fake", "fake.context_length": context},
+                                  "details": {"family": "fake"}})
+        elif self.path in ('/api/generate', '/api/chat'):
+            self._generate(request, chat=self.path == '/api/chat')
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _generate(self, request: Dict[str, Any], chat: bool):
+        state = self.state
+        config = state.config
+        model = request.get('model', '')
+        state.count("requests")
+
+        if chat:
+            messages = request.get('messages') or []
+            prompt = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+            prompt_tokens = sum(len(tokenize(m.get('content') or '')) for m in messages)
+        else:
+            prompt = request.get('prompt') or ''
+            prompt_tokens = len(tokenize(prompt))
+
+        if request.get('keep_alive') in (0, '0', '0s'):
+            state.unload(model)
+            self._send_done(request, chat, model, "", 0, 0, 0.0, 0.0, done_reason='unload')
+            return
+
+        if config.error_rate and config.random.random() < config.error_rate:
+            state.count("errors")
+            self._send_json(500, {"error": "fake server: injected error"})
+            return
+
+        load_seconds = state.ensure_loaded(model)
+        if not prompt and not (chat and request.get('messages')):
+            # 空提示只加载模型，与 Ollama 的预加载行为一致
+            time.sleep(load_seconds)
+            self._send_done(request, chat, model, "", 0, 0, load_seconds, 0.0)
+            state.count("completed")
+            return
+
+        tokens = tokenize(state.pick_response(model, prompt))
+        start = time.perf_counter()
+        time.sleep(load_seconds + config.first_token_latency)
+        stream = request.get('stream', True)
+        state.count("active")
+        try:
+            if stream:
+                self._begin_stream()
+            interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+            next_time = time.perf_counter()
+            for token in self._paced(tokens, interval, next_time):
+                if stream:
+                    if chat:
+                        self._write_chunk({"model": model, "created_at": _now(),
+                                           "message": {"role": "assistant", "content": token}, "done": False})
+                    else:
+                        self._write_chunk({"model": model, "created_at": _now(), "response": token, "done": False})
+                state.count("tokens_sent")
+            elapsed = time.perf_counter() - start
+            self._send_done(request, chat, model, "" if stream else "".join(tokens), prompt_tokens,
+                            len(tokens), load_seconds, elapsed, stream=stream)
+            state.count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开（例如取消生成），停止输出
+            state.count("aborted")
+            self.close_connection = True
+        finally:
+            state.count("active", -1)
+
+    @staticmethod
+    def _paced(tokens: List[str], interval: float, next_time: float) -> Iterator[str]:
+        for token in tokens:
+            if interval:
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield token
+
+    def _send_done(self, request: Dict[str, Any], chat: bool, model: str, content: str, prompt_tokens: int,
+                   eval_tokens: int, load_seconds: float, elapsed: float, done_reason: str = 'stop',
+                   stream: Optional[bool] = None):
+        if stream is None:
+            stream = request.get('stream', True)
+        eval_seconds = max(0.0, elapsed - load_seconds - self.state.config.first_token_latency)
+        payload = {
+            "model": model,
+            "created_at": _now(),
+            "done": True,
+            "done_reason": done_reason,
+            "total_duration": int(elapsed * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.state.config.first_token_latency * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+        }
+        if chat:
+            payload["message"] = {"role": "assistant", "content": content}
+        else:
+            payload["response"] = content
+        if stream:
+            if not self._stream_started:
+                self._begin_stream()
+            self._write_chunk(payload)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        else:
+            self._send_json(200, payload)
+
+
+def create_server(config: FakeOllamaConfig, host: str = '127.0.0.1', port: int = 11435) -> ThreadingHTTPServer:
+    """创建模拟服务（未启动），port 为0时自动分配端口"""
+    handler = type('BoundFakeOllamaHandler', (FakeOllamaHandler,), {"state": FakeOllamaState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(config: FakeOllamaConfig, host: str = '127.0.0.1', port: int = 0):
+    """在后台线程中启动模拟服务，返回 (server, base_url)"""
+    server = create_server(config, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 Ollama 服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--rate', type=float, default=30.0, help="每个请求的生成速度(token/s)，0为不限速")
+    parser.add_argument('--latency', type=float, default=0.2, help="首个token前的延迟(秒)")
+    parser.add_argument('--load-time', type=float, default=0.0, help="模型冷加载的延迟(秒)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="请求失败的概率")
+    parser.add_argument('--tokens', type=int, default=200, help="合成回答的token数")
+    parser.add_argument('--responses', help="录制的回答文件(JSONL)")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        tokens_per_second=args.rate, first_token_latency=args.latency, load_time=args.load_time,
+        error_rate=args.error_rate, response_tokens=args.tokens, responses_path=args.responses, seed=args.seed,
+    )
+    server = create_server(config, args.host, args.port)
+    print(f"模拟 Ollama 服务已启动: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
 from PIL import Image
 from PyQt5.QtGui import QImage, QPixmap
 from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QLabel, QTextEdit, QApplication
+from PyQt5.QtWidgets import QLabel, QTextEdit
 import numpy as np
+from typing import Dict, Optional
 from image import ImageProcessing
-from analyze import AnalyzeImage
+from compositor import PosterCompositor
+from scene import Scene
+from pipeline import PosterPipeline, get_analyzer, DEFAULT_MODEL_DIR, DEFAULT_DEVICE, ANALYZE_PROMPT
+from poster_worker import PosterWorker
 
 class ImageGenerator:
     """处理图片生成和转换的类"""
@@ -28,6 +32,36 @@ class ImageGenerator:
         # 转换为QPixmap
         return QPixmap.fromImage(q_img)
     
+    @staticmethod
+    def array_to_pixmap(img_array: np.ndarray) -> QPixmap:
+        """将 HxWx3 的uint8数组转换为QPixmap"""
+        img_array = np.ascontiguousarray(img_array)
+        height, width, channels = img_array.shape
+        q_img = QImage(img_array.data, width, height, channels * width, QImage.Format_RGB888)
+        # QPixmap.fromImage 会复制像素，之后数组可以被复用
+        return QPixmap.fromImage(q_img)
+
+    @staticmethod
+    def render_compositor(compositor: PosterCompositor, target_size) -> QPixmap:
+        """增量合成分层海报并缩放到预览大小"""
+        pixmap = ImageGenerator.array_to_pixmap(compositor.render())
+        return ImageGenerator.scale_pixmap(pixmap, target_size)
+    
+    @staticmethod
+    def render_scene(scene: Scene, sizes, product_image: Optional[Image.Image] = None) -> Dict[str, Image.Image]:
+        """将与分辨率无关的场景一次渲染为多个尺寸的海报
+        
+        Args:
+            scene: Scene - 海报场景
+            sizes: 尺寸列表，如 ["1080x1920", "1920x1080", "1200x1200"]
+            product_image: 产品图片，只解码和重采样一次
+            
+        Returns:
+            Dict[str, Image.Image]: 尺寸字符串到海报图片的映射
+        """
+        compositors = PosterPipeline.render_sizes(scene, sizes, product_image)
+        return {size_str: compositor.to_image() for size_str, compositor in compositors.items()}
+    
     @staticmethod
     def scale_pixmap(pixmap: QPixmap, target_size, keep_aspect=True) -> QPixmap:
         """缩放QPixmap到指定大小"""
@@ -73,66 +107,35 @@ class ImageGenerator:
         Returns:
             str: 图片内容的描述
         """
-        # 初始化分析器
-        analyzer = AnalyzeImage(model_dir='../../models/minicpm_v_2_6', device='GPU')
+        # 使用共享的分析器，模型只加载一次
+        analyzer = get_analyzer(DEFAULT_MODEL_DIR, DEFAULT_DEVICE)
         
         # 分析图片内容
-        description = analyzer.analyze(image, "请详细描述这张图片的内容")
+        description = analyzer.analyze(image, ANALYZE_PROMPT)
         
         return description
 
     @staticmethod
     def append_to_output(text_widget: QTextEdit, message: str):
-        """向输出文本框添加消息并立即显示
+        """向输出文本框添加消息并滚动到底部
+        
+        只能在主线程调用；耗时任务应放在 PosterWorker 中执行，
+        不再通过 processEvents 强制刷新界面。
         
         Args:
             text_widget: QTextEdit - 输出文本框
             message: str - 要显示的消息
         """
         text_widget.append(message)
-        # 强制更新UI
-        QApplication.processEvents()
         # 滚动到底部
         text_widget.verticalScrollBar().setValue(
             text_widget.verticalScrollBar().maximum()
         )
 
     @staticmethod
-    def poster_generation_process(size_str: str, image_label: QLabel, image_processor: ImageProcessing) -> str:
-        """生成并显示空白图片，如果有输入图片则分析其内容"""
-        # 获取输出文本框引用
-        output_text = image_label.window().findChild(QTextEdit)
-        
-        # 生成并缩放图片
-        ImageGenerator.append_to_output(output_text, f"正在生成 {size_str} 尺寸的空白图片...")
-        scaled_pixmap = ImageGenerator.generate_blank_poster(size_str, image_label.size())
-        
-        # 显示图片
-        ImageGenerator.append_to_output(output_text, "正在更新图片预览...")
-        ImageGenerator.update_poster_image_preview(image_label, scaled_pixmap)
-        
-        # 检查是否有输入图片
-        ImageGenerator.append_to_output(output_text, "正在检查输入图片...")
+    def create_poster_worker(size_str: str, image_processor: ImageProcessing) -> Optional[PosterWorker]:
+        """为当前输入图片创建海报生成工作线程，没有输入图片时返回None"""
         image_paths = image_processor.get_image_paths()
         if not image_paths:
-            ImageGenerator.append_to_output(output_text, "错误：没有找到输入图片")
-            return ""
-            
-        try:
-            # 尝试打开第一张图片
-            ImageGenerator.append_to_output(output_text, f"正在打开图片：{image_paths[0]}")
-            input_image = Image.open(image_paths[0])
-            
-            ImageGenerator.append_to_output(output_text, "正在分析图片内容，请稍候...")
-            result = ImageGenerator.understand_input_image(input_image)
-            
-            # 显示分析结果
-            ImageGenerator.append_to_output(output_text, "\n分析结果：")
-            ImageGenerator.append_to_output(output_text, result)
-            
-            return result
-            
-        except Exception as e:
-            error_msg = f"错误：无法打开图片 {image_paths[0]}: {str(e)}"
-            ImageGenerator.append_to_output(output_text, error_msg)
-            return ""
\ No newline at end of file
+            return None
+        return PosterWorker(size_str, image_paths[0])
@@ -1,6 +1,17 @@
+from llama_index.core.llms import ChatMessage
 from llama_index.llms.ollama import Ollama
+from ollama import Client
 from PyQt5.QtCore import QThread, pyqtSignal
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+import httpcore
+import httpx
 import logging
+import os
+import socket
+import threading
+import time
+from utils.llm_cache import LLMResponseCache, get_default_cache
+from utils.token_accounting import usage_from_ollama
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -9,31 +20,350 @@ logger = logging.getLogger(__name__)
 # 可用的模型列表
 MODEL_LIST = ['qwen2.5:7b', 'qwen2.5:14b', 'deepseek-r1:7b', 'deepseek-r1:14b']
 
+# 各模型使用的上下文窗口(num_ctx)，对话记忆按此计算token预算
+MODEL_CONTEXT_WINDOW = {
+    'qwen2.5:7b': 8192,
+    'qwen2.5:14b': 8192,
+    'deepseek-r1:7b': 8192,
+    'deepseek-r1:14b': 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Ollama 服务地址及默认参数
+OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+REQUEST_TIMEOUT = 120.0
+# 模型在服务端常驻的时长，避免两次对话之间模型被卸载
+DEFAULT_KEEP_ALIVE = '30m'
+
+
+class _TrackedStream(httpcore.NetworkStream):
+    """包装连接：读取时登记当前线程，以便其他线程取消时关闭套接字"""
+
+    def __init__(self, stream: httpcore.NetworkStream, registry: "_InflightReads"):
+        self._stream = stream
+        self._registry = registry
+
+    def read(self, max_bytes: int, timeout: Optional[float] = None) -> bytes:
+        self._registry.begin(self)
+        try:
+            return self._stream.read(max_bytes, timeout)
+        finally:
+            self._registry.end()
+
+    def write(self, buffer: bytes, timeout: Optional[float] = None) -> None:
+        self._stream.write(buffer, timeout)
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def start_tls(self, ssl_context, server_hostname: Optional[str] = None,
+                  timeout: Optional[float] = None) -> httpcore.NetworkStream:
+        return _TrackedStream(self._stream.start_tls(ssl_context, server_hostname, timeout), self._registry)
+
+    def get_extra_info(self, info: str):
+        return self._stream.get_extra_info(info)
+
+    def shutdown(self):
+        """关闭套接字的读写，正在阻塞读取的线程立即返回，Ollama 随之检测到连接断开"""
+        sock = self._stream.get_extra_info("socket")
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+
+class _TrackingBackend(httpcore.NetworkBackend):
+    """创建 _TrackedStream 连接的网络后端"""
+
+    def __init__(self, backend: httpcore.NetworkBackend, registry: "_InflightReads"):
+        self._backend = backend
+        self._registry = registry
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        return _TrackedStream(self._backend.connect_tcp(host, port, timeout, local_address, socket_options),
+                              self._registry)
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return _TrackedStream(self._backend.connect_unix_socket(path, timeout, socket_options), self._registry)
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+class _InflightReads:
+    """各线程当前阻塞读取的连接
+
+    Ollama 在处理完提示、生成第一个token之前不会返回任何数据，长提示时工作线程会一直阻塞在读取上。
+    abort() 从其他线程关闭该线程正在读取的连接，使请求立即结束；在 abort() 之后才开始的读取也会立即关闭。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reading: Dict[int, _TrackedStream] = {}
+        self._aborted: Set[int] = set()
+
+    def begin(self, stream: _TrackedStream):
+        ident = threading.get_ident()
+        with self._lock:
+            self._reading[ident] = stream
+            aborted = ident in self._aborted
+        if aborted:
+            stream.shutdown()
+
+    def end(self):
+        with self._lock:
+            self._reading.pop(threading.get_ident(), None)
+
+    def abort(self, ident: int):
+        with self._lock:
+            self._aborted.add(ident)
+            stream = self._reading.get(ident)
+        if stream is not None:
+            stream.shutdown()
+
+    def clear(self, ident: int):
+        with self._lock:
+            self._aborted.discard(ident)
+
+
+_inflight_reads = _InflightReads()
+
+
+def _cancellable_transport(limits: httpx.Limits) -> httpx.HTTPTransport:
+    """连接可以被 _inflight_reads.abort() 从其他线程关闭的 HTTP 传输层"""
+    transport = httpx.HTTPTransport(limits=limits)
+    pool = getattr(transport, '_pool', None)
+    if hasattr(pool, '_network_backend'):
+        pool._network_backend = _TrackingBackend(pool._network_backend, _inflight_reads)
+    else:
+        logger.warning("当前 httpx 版本无法包装连接，取消只在收到下一段输出时生效")
+    return transport
+
+
+class OllamaClientPool:
+    """进程级的 Ollama 客户端池
+
+    同一服务地址共享一个带连接保活的 HTTP 客户端，同一组(模型, 参数)共享一个
+    llama_index Ollama 实例，这样每条消息不再新建会话、重新握手和重新查询模型信息。
+    在应用退出时调用 close_all() 释放连接。
+    """
+    _http_clients: Dict[Tuple[str, float], Client] = {}
+    _llms: Dict[Tuple, Ollama] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_http_client(cls, base_url: str, request_timeout: float) -> Client:
+        key = (base_url, request_timeout)
+        client = cls._http_clients.get(key)
+        if client is None:
+            client = Client(
+                host=base_url,
+                timeout=request_timeout,
+                transport=_cancellable_transport(
+                    httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=300)),
+            )
+            cls._http_clients[key] = client
+        return client
+
+    @classmethod
+    def client(cls, base_url: str = OLLAMA_HOST, request_timeout: float = REQUEST_TIMEOUT) -> Client:
+        """获取共享的原生 ollama 客户端，用于预加载/卸载模型等不经过 llama_index 的请求"""
+        with cls._lock:
+            return cls._get_http_client(base_url, request_timeout)
+
+    @classmethod
+    def get(cls, model: str, temperature: float = 0.7, request_timeout: float = REQUEST_TIMEOUT,
+            keep_alive: Optional[Union[str, float]] = DEFAULT_KEEP_ALIVE, base_url: str = OLLAMA_HOST) -> Ollama:
+        """获取（必要时创建）指定模型和参数的 Ollama 实例"""
+        context_window = MODEL_CONTEXT_WINDOW.get(model, DEFAULT_CONTEXT_WINDOW)
+        key = (model, temperature, request_timeout, keep_alive, base_url)
+        with cls._lock:
+            llm = cls._llms.get(key)
+            if llm is None:
+                llm = Ollama(
+                    model=model,
+                    base_url=base_url,
+                    temperature=temperature,
+                    request_timeout=request_timeout,
+                    keep_alive=keep_alive,
+                    # 固定上下文窗口：既避免每次查询模型信息，也避免num_ctx变化导致模型重新加载
+                    context_window=context_window,
+                    client=cls._get_http_client(base_url, request_timeout),
+                )
+                cls._llms[key] = llm
+            return llm
+
+    @classmethod
+    def close_all(cls):
+        """关闭所有 HTTP 连接并清空客户端池"""
+        with cls._lock:
+            for client in cls._http_clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.warning(f"关闭 Ollama 客户端失败: {str(e)}")
+            cls._http_clients.clear()
+            cls._llms.clear()
+
 class ChatWorker(QThread):
-    """处理AI对话的工作线程，支持流式输出"""
-    finished = pyqtSignal(str)  # 完成信号，发送最终完整结果
-    error = pyqtSignal(str)     # 错误信号
-    stream = pyqtSignal(str)    # 流式输出信号
+    """处理AI对话的工作线程，支持流式输出
+
+    流式信号只发送增量文本(chunk.delta)，并按时间或长度合并后再发送，
+    每批带递增的序号；结束时通过 finished 发送最后的序号和完整文本用于校对。
+    这样跨线程传递的数据量与回答长度无关。
 
-    def __init__(self, question, model):
+    调用 cancel() 后立即关闭工作线程正在读取的HTTP连接（包括仍在等待首个token的长提示处理），
+    Ollama 检测到连接断开后会中止服务端的提示处理和生成。
+    """
+    finished = pyqtSignal(int, str)  # 完成信号，发送最后一批的序号和最终完整结果
+    error = pyqtSignal(str)          # 错误信号
+    stream = pyqtSignal(int, str)    # 流式输出信号，发送 (序号, 增量文本)
+    cancelled = pyqtSignal(str)      # 已取消信号，发送取消前已生成的文本
+
+    # 增量合并的阈值：满足任一条件即发送一批
+    STREAM_BATCH_SECONDS = 0.03
+    STREAM_BATCH_CHARS = 256
+
+    def __init__(self, question, model, messages: Optional[List[Dict[str, str]]] = None,
+                 temperature: float = 0.7, use_cache: bool = False,
+                 keep_alive: Optional[Union[str, float]] = DEFAULT_KEEP_ALIVE):
+        """
+        Args:
+            question: 用户问题
+            model: 模型名称
+            messages: 可选的完整对话消息(chat格式，已包含本轮问题)，提供时使用多轮对话接口
+            temperature: 采样温度，为0时自动使用响应缓存
+            use_cache: 温度不为0时也使用响应缓存
+            keep_alive: 模型在服务端的保留时长，常驻模型传入-1
+        """
         super().__init__()
         self.question = question
         self.model = model
+        self.messages = messages
+        self.temperature = temperature
+        self.use_cache = use_cache
+        self.keep_alive = keep_alive
+        self.prompt_tokens = 0  # 服务端统计的提示token数(prompt_eval_count)
+        self.eval_tokens = 0    # 服务端统计的生成token数(eval_count)
+        self.usage = None       # 服务端返回的token数和各阶段耗时，见 usage_from_ollama
+        self.first_token_time = None  # 收到第一段文本的时间(time.monotonic)
+        self.from_cache = False  # 本次回答是否来自缓存
+        self._cancel_event = threading.Event()
+        self._thread_ident: Optional[int] = None  # 执行 run() 的线程，只在运行期间有值
+        self._thread_lock = threading.Lock()
 
-    def run(self):
-        try:
-            llm = Ollama(
-                model=self.model,
-                temperature=0.7,
-                timeout=120
-            )
+    def cancel(self):
+        """请求停止生成，可在任意线程调用"""
+        with self._thread_lock:
+            self._cancel_event.set()
+            if self._thread_ident is not None:
+                _inflight_reads.abort(self._thread_ident)
+
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def _iter_deltas(self) -> Iterator[Tuple[str, Optional[str]]]:
+        """向 Ollama 发起流式请求，逐个返回 (增量文本, 截至目前的完整文本)"""
+        llm = OllamaClientPool.get(self.model, temperature=self.temperature, keep_alive=self.keep_alive)
+        if self.messages:
+            response = llm.stream_chat([ChatMessage(role=m["role"], content=m["content"])
+                                        for m in self.messages])
+        else:
             response = llm.stream_complete(self.question)
-            full_response = ""
+        try:
             for chunk in response:
-                if chunk and chunk.text:
-                    self.stream.emit(chunk.text)
-                    full_response = chunk.text
-            self.finished.emit(full_response)
+                if not chunk:
+                    continue
+                raw = chunk.raw or {}
+                if raw.get('prompt_eval_count'):
+                    self.prompt_tokens = raw['prompt_eval_count']
+                if raw.get('eval_count'):
+                    self.eval_tokens = raw['eval_count']
+                    # 最后一块带有完整的计数和耗时
+                    self.usage = usage_from_ollama(raw)
+                text = chunk.message.content if hasattr(chunk, 'message') else chunk.text
+                yield chunk.delta or "", text
+        finally:
+            # 提前退出时关闭响应生成器，底层的 httpx 流随之关闭、连接断开
+            response.close()
+
+    def run(self):
+        with self._thread_lock:
+            self._thread_ident = threading.get_ident()
+            if self._cancel_event.is_set():
+                # run 开始之前已经调用过 cancel()
+                _inflight_reads.abort(self._thread_ident)
+        full_response = ""
+        pending = []
+        try:
+            cache = None
+            cache_key = None
+            source = None
+            if LLMResponseCache.should_cache(self.temperature, self.use_cache):
+                cache = get_default_cache()
+                cache_key = cache.make_key(
+                    self.model, self.messages or self.question, temperature=self.temperature,
+                    options={"num_ctx": MODEL_CONTEXT_WINDOW.get(self.model, DEFAULT_CONTEXT_WINDOW)},
+                )
+                cached = cache.get(cache_key)
+                cache.log_stats()
+                if cached is not None:
+                    # 命中缓存时按小段回放，界面上的表现与真实流式输出一致
+                    self.from_cache = True
+                    self.prompt_tokens = cached.get("prompt_tokens", 0)
+                    self.eval_tokens = cached.get("eval_tokens", 0)
+                    source = ((delta, None) for delta in LLMResponseCache.replay_chunks(cached["text"]))
+                    full_response = cached["text"]
+            if source is None:
+                source = self._iter_deltas()
+
+            seq = 0
+            pending = []
+            pending_chars = 0
+            last_emit = time.monotonic()
+            for delta, text in source:
+                if self._cancel_event.is_set():
+                    break
+                if delta and self.first_token_time is None:
+                    self.first_token_time = time.monotonic()
+                if delta:
+                    pending.append(delta)
+                    pending_chars += len(delta)
+                if text:
+                    full_response = text
+                now = time.monotonic()
+                if pending and (pending_chars >= self.STREAM_BATCH_CHARS
+                                or now - last_emit >= self.STREAM_BATCH_SECONDS):
+                    seq += 1
+                    self.stream.emit(seq, "".join(pending))
+                    pending = []
+                    pending_chars = 0
+                    last_emit = now
+            if self._cancel_event.is_set():
+                source.close()
+                partial_text = full_response or "".join(pending)
+                logger.info(f"已取消 {self.model} 的生成，已生成 {len(partial_text)} 个字符")
+                self.cancelled.emit(partial_text)
+                return
+            if pending:
+                seq += 1
+                self.stream.emit(seq, "".join(pending))
+
+            if cache is not None and not self.from_cache and full_response:
+                cache.put(cache_key, {"text": full_response, "prompt_tokens": self.prompt_tokens,
+                                      "eval_tokens": self.eval_tokens}, self.model)
+            self.finished.emit(seq, full_response)
         except Exception as e:
+            if self._cancel_event.is_set():
+                # 取消时连接被关闭，读取会以连接错误结束
+                partial_text = full_response or "".join(pending)
+                logger.info(f"已取消 {self.model} 的请求，已生成 {len(partial_text)} 个字符")
+                self.cancelled.emit(partial_text)
+                return
             logger.error(f"LLM处理错误: {str(e)}")
-            self.error.emit(str(e)) 
\ No newline at end of file
+            self.error.emit(str(e))
+        finally:
+            # 线程ID可能被之后的线程复用，结束时清除取消标记
+            with self._thread_lock:
+                _inflight_reads.clear(self._thread_ident)
+                self._thread_ident = None
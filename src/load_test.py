@@ -0,0 +1,234 @@
+"""聊天链路压测：多个 ChatHandler 并发对话，统计界面侧的吞吐、延迟和资源增长
+
+默认在进程内启动模拟的 Ollama 服务（见 fake_ollama_server.py），不需要安装 Ollama。
+
+用法示例：
+    python load_test.py --chats 100 --concurrency 20 --rate 50 --tokens 300
+    python load_test.py --chats 40 --concurrency 8 --cancel-ratio 0.3 --cancel-after 0.5
+    python load_test.py --host http://127.0.0.1:11435   # 使用已启动的服务
+
+输出 JSON 统计：端到端延迟和首字延迟的 p50/p95、界面线程收到的字符/信号速率、
+事件循环的最大卡顿、线程数和内存(RSS)在压测前/峰值/结束后的变化，以及服务端计数。
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法的百分位数，保留3位小数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+
+def process_stats() -> Dict[str, float]:
+    """当前进程的线程数和内存占用(MB)"""
+    stats = {"python_threads": threading.active_count()}
+    try:
+        import psutil
+        process = psutil.Process()
+        stats.update(os_threads=process.num_threads(), rss_mb=round(process.memory_info().rss / 2**20, 1))
+    except ImportError:
+        # 没有 psutil 时读取 /proc（仅Linux）
+        try:
+            with open('/proc/self/status', 'r') as f:
+                for line in f:
+                    if line.startswith('Threads:'):
+                        stats["os_threads"] = int(line.split()[1])
+                    elif line.startswith('VmRSS:'):
+                        stats["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+        except OSError:
+            pass
+    return stats
+
+
+class LoadTest:
+    """在 Qt 事件循环中驱动多个并发对话"""
+
+    SAMPLE_INTERVAL_MS = 10
+
+    def __init__(self, app, chats: int, concurrency: int, models: List[str], cancel_ratio: float = 0.0,
+                 cancel_after: float = 0.5, question: str = "为保温杯写一句海报文案"):
+        from PyQt5.QtCore import QTimer
+        from chat_handler import ChatHandler
+
+        self.app = app
+        self.total = chats
+        self.models = models
+        self.question = question
+        self.cancel_after = cancel_after
+        # 每隔 1/cancel_ratio 个对话取消一个
+        self.cancel_every = int(round(1 / cancel_ratio)) if cancel_ratio > 0 else 0
+
+        self.handlers = [ChatHandler() for _ in range(concurrency)]
+        self.next_index = 0
+        self.done = 0
+        self.results: List[Dict[str, Any]] = []
+        self.chars = 0
+        self.signals = 0
+        self.baseline = process_stats()
+        self.peak = dict(self.baseline)
+
+        self._current: Dict[int, Dict[str, Any]] = {}
+        for slot, handler in enumerate(self.handlers):
+            handler.ai_stream.connect(lambda delta, slot=slot: self._on_delta(slot, delta))
+            handler.ai_reasoning.connect(lambda delta, slot=slot: self._on_delta(slot, delta))
+            handler.ai_finished.connect(lambda slot=slot: self._on_done(slot, "ok"))
+            handler.error_occurred.connect(lambda msg, slot=slot: self._on_done(slot, "error", msg))
+            handler.ai_cancelled.connect(lambda text, slot=slot: self._on_done(slot, "cancelled"))
+
+        # 定时器测量事件循环的卡顿，同时采样线程数和内存
+        self.max_lag = 0.0
+        self._last_tick = None
+        self._timer = QTimer()
+        self._timer.setInterval(self.SAMPLE_INTERVAL_MS)
+        self._timer.timeout.connect(self._tick)
+
+    def _tick(self):
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            self.max_lag = max(self.max_lag, now - self._last_tick - self.SAMPLE_INTERVAL_MS / 1000)
+        self._last_tick = now
+        if int(now * 10) % 5 == 0:
+            for key, value in process_stats().items():
+                self.peak[key] = max(self.peak.get(key, 0), value)
+
+    def _start(self, slot: int):
+        from PyQt5.QtCore import QTimer
+
+        if self.next_index >= self.total:
+            return
+        index = self.next_index
+        self.next_index += 1
+        handler = self.handlers[slot]
+        handler.reset_session()
+        model = self.models[index % len(self.models)]
+        self._current[slot] = {"index": index, "model": model, "start": time.perf_counter(), "first": None}
+        handler.send_message(self.question, model)
+        if self.cancel_every and index % self.cancel_every == self.cancel_every - 1:
+            QTimer.singleShot(int(self.cancel_after * 1000),
+                              lambda: self._current.get(slot, {}).get("index") == index and handler.cancel())
+
+    def _on_delta(self, slot: int, delta: str):
+        self.chars += len(delta)
+        self.signals += 1
+        current = self._current.get(slot)
+        if current is not None and current["first"] is None:
+            current["first"] = time.perf_counter()
+
+    def _on_done(self, slot: int, status: str, error: str = ""):
+        current = self._current.pop(slot, None)
+        if current is None:
+            return
+        end = time.perf_counter()
+        self.results.append({
+            "model": current["model"],
+            "status": status,
+            "latency": end - current["start"],
+            "first_token": (current["first"] - current["start"]) if current["first"] else None,
+            "error": error,
+        })
+        self.done += 1
+        if self.done >= self.total:
+            self.app.quit()
+        else:
+            self._start(slot)
+
+    def run(self) -> Dict[str, Any]:
+        self._timer.start()
+        start = time.perf_counter()
+        for slot in range(len(self.handlers)):
+            self._start(slot)
+        self.app.exec_()
+        elapsed = time.perf_counter() - start
+        self._timer.stop()
+
+        for handler in self.handlers:
+            handler.shutdown()
+        final = process_stats()
+
+        ok = [r for r in self.results if r["status"] == "ok"]
+        latencies = [r["latency"] for r in ok]
+        first_tokens = [r["first_token"] for r in ok if r["first_token"] is not None]
+        return {
+            "chats": self.total,
+            "concurrency": len(self.handlers),
+            "ok": len(ok),
+            "errors": sum(r["status"] == "error" for r in self.results),
+            "cancelled": sum(r["status"] == "cancelled" for r in self.results),
+            "seconds": round(elapsed, 3),
+            "chats_per_second": round(len(self.results) / elapsed, 2) if elapsed else 0.0,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+            "first_token_p50": percentile(first_tokens, 50),
+            "first_token_p95": percentile(first_tokens, 95),
+            "ui_chars_per_second": round(self.chars / elapsed, 1) if elapsed else 0.0,
+            "ui_signals_per_second": round(self.signals / elapsed, 1) if elapsed else 0.0,
+            "ui_max_lag_ms": round(self.max_lag * 1000, 1),
+            "baseline": self.baseline,
+            "peak": self.peak,
+            "final": final,
+        }
+
+
+def fetch_server_stats(base_url: str) -> Optional[Dict[str, Any]]:
+    """读取模拟服务的计数（真实 Ollama 没有该接口）"""
+    try:
+        with urllib.request.urlopen(base_url + '/stats', timeout=5) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聊天链路压测")
+    parser.add_argument('--chats', type=int, default=50, help="对话总数")
+    parser.add_argument('--concurrency', type=int, default=10, help="同时进行的对话数")
+    parser.add_argument('--models', default='qwen2.5:7b,deepseek-r1:7b', help="轮流使用的模型，逗号分隔")
+    parser.add_argument('--cancel-ratio', type=float, default=0.0, help="被中途取消的对话比例")
+    parser.add_argument('--cancel-after', type=float, default=0.5, help="开始后多少秒取消(秒)")
+    parser.add_argument('--host', help="已启动的 Ollama(或模拟)服务地址，不指定时在进程内启动模拟服务")
+    parser.add_argument('--rate', type=float, default=50.0, help="模拟服务的生成速度(token/s)")
+    parser.add_argument('--latency', type=float, default=0.1, help="模拟服务的首字延迟(秒)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="模拟服务的错误率")
+    parser.add_argument('--tokens', type=int, default=200, help="模拟回答的token数")
+    parser.add_argument('--responses', help="模拟服务回放的录制回答(JSONL)")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.host
+    if base_url is None:
+        from fake_ollama_server import FakeOllamaConfig, start_in_thread
+        config = FakeOllamaConfig(tokens_per_second=args.rate, first_token_latency=args.latency,
+                                  error_rate=args.error_rate, response_tokens=args.tokens,
+                                  responses_path=args.responses, seed=0)
+        server, base_url = start_in_thread(config)
+    # llm_ollama 在导入时读取服务地址，必须在导入 Qt 相关模块之前设置
+    os.environ['OLLAMA_HOST'] = base_url
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication([])
+    test = LoadTest(app, args.chats, args.concurrency, args.models.split(','),
+                    cancel_ratio=args.cancel_ratio, cancel_after=args.cancel_after)
+    report = test.run()
+    report["server"] = fetch_server_stats(base_url)
+    if server is not None:
+        server.shutdown()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1167,6 +1167,8 @@ class OvMiniCPMV:
             generation_config["min_new_tokens"] = min_new_tokens
 
         generation_config.update((k, kwargs[k]) for k in generation_config.keys() & kwargs.keys())
+        if "stopping_criteria" in kwargs:
+            generation_config["stopping_criteria"] = kwargs["stopping_criteria"]
 
         inputs.pop("image_sizes")
         with torch.inference_mode():
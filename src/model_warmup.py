@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Union
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from llm_ollama import (OllamaClientPool, MODEL_CONTEXT_WINDOW, DEFAULT_CONTEXT_WINDOW,
+                        DEFAULT_KEEP_ALIVE)
+
+logger = logging.getLogger(__name__)
+
+
+class ModelWarmupManager(QObject):
+    """模型预加载与常驻管理
+
+    切换模型时在后台向 Ollama 发送一个空提示的请求，让服务端提前把模型加载到显存，
+    这样第一条消息不再等待冷加载。可选地让最近使用的 N 个模型常驻(keep_alive=-1)，
+    超出 N 个时卸载最久未使用的模型(keep_alive=0)。服务端同时能加载的模型数还受
+    OLLAMA_MAX_LOADED_MODELS 限制。
+    """
+    status_changed = pyqtSignal(str, str)   # (模型, 状态)，状态为 loading/ready/error
+    load_finished = pyqtSignal(str, float)  # (模型, 加载耗时秒数)
+
+    LOADING = 'loading'
+    READY = 'ready'
+    ERROR = 'error'
+
+    # 常驻模型使用的 keep_alive：负数表示一直保留在显存中
+    RESIDENT_KEEP_ALIVE = -1
+
+    def __init__(self, keep_resident: int = 2):
+        """
+        Args:
+            keep_resident: 常驻的最近使用模型数，为0时只预加载、不改变模型的常驻时长
+        """
+        super().__init__()
+        self.keep_resident = keep_resident
+        self.status: Dict[str, str] = {}
+        self.load_times: Dict[str, List[float]] = {}
+        self._recent: List[str] = []  # 最近使用的模型，最新的在最前
+        self._lock = threading.Lock()
+
+    def keep_alive_for(self, model: str) -> Union[str, int]:
+        """对话请求应使用的 keep_alive，保证请求本身不会缩短常驻模型的保留时间"""
+        with self._lock:
+            if self.keep_resident > 0 and model in self._recent[:self.keep_resident]:
+                return self.RESIDENT_KEEP_ALIVE
+        return DEFAULT_KEEP_ALIVE
+
+    def is_ready(self, model: str) -> bool:
+        return self.status.get(model) == self.READY
+
+    def last_load_time(self, model: str) -> Optional[float]:
+        times = self.load_times.get(model)
+        return times[-1] if times else None
+
+    def touch(self, model: str) -> List[str]:
+        """把模型标记为最近使用，返回需要卸载的模型"""
+        with self._lock:
+            if model in self._recent:
+                self._recent.remove(model)
+            self._recent.insert(0, model)
+            if self.keep_resident <= 0:
+                return []
+            evicted = self._recent[self.keep_resident:]
+            del self._recent[self.keep_resident:]
+        return evicted
+
+    def warmup(self, model: str):
+        """在后台预加载模型；模型已就绪或正在加载时只更新最近使用顺序"""
+        evicted = self.touch(model)
+        for old_model in evicted:
+            if self.status.pop(old_model, None) is not None:
+                self.status_changed.emit(old_model, '')
+            self._start(self._unload, old_model)
+
+        if self.status.get(model) in (self.LOADING, self.READY):
+            return
+        self._set_status(model, self.LOADING)
+        self._start(self._load, model)
+
+    @staticmethod
+    def _start(target, model: str):
+        # 预加载请求可能持续到超时，使用守护线程，退出程序时不需要等待
+        threading.Thread(target=target, args=(model,), daemon=True).start()
+
+    def _set_status(self, model: str, status: str):
+        self.status[model] = status
+        self.status_changed.emit(model, status)
+
+    def _load(self, model: str):
+        start = time.perf_counter()
+        try:
+            response = OllamaClientPool.client().generate(
+                model=model,
+                prompt='',
+                keep_alive=self.keep_alive_for(model),
+                # 与对话请求使用相同的上下文窗口，否则第一条消息会触发模型重新加载
+                options={'num_ctx': MODEL_CONTEXT_WINDOW.get(model, DEFAULT_CONTEXT_WINDOW)},
+            )
+        except Exception as e:
+            logger.error(f"预加载模型 {model} 失败: {str(e)}")
+            self._set_status(model, self.ERROR)
+            return
+
+        elapsed = time.perf_counter() - start
+        # 优先使用服务端统计的加载时间(纳秒)，模型已在显存中时接近0
+        load_duration = getattr(response, 'load_duration', None)
+        seconds = load_duration / 1e9 if load_duration else elapsed
+        self.load_times.setdefault(model, []).append(seconds)
+        logger.info(f"模型 {model} 已就绪，加载耗时 {seconds:.2f}s (请求耗时 {elapsed:.2f}s)")
+        self._set_status(model, self.READY)
+        self.load_finished.emit(model, seconds)
+
+    def unload_resident(self):
+        """卸载所有常驻模型，程序退出时调用
+
+        常驻模型使用 keep_alive=-1，不主动卸载会在程序退出后一直占用显存。
+        """
+        with self._lock:
+            models = self._recent[:self.keep_resident] if self.keep_resident > 0 else []
+            self._recent = []
+        for model in models:
+            self.status.pop(model, None)
+            self._unload(model)
+
+    def _unload(self, model: str):
+        try:
+            OllamaClientPool.client().generate(model=model, prompt='', keep_alive=0)
+            logger.info(f"已卸载模型 {model}")
+        except Exception as e:
+            logger.warning(f"卸载模型 {model} 失败: {str(e)}")
@@ -0,0 +1,136 @@
+import re
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+
+from PIL import Image
+
+from background import default_generator as background_generator
+from compositor import PosterCompositor
+from scene import Scene, SceneRenderer
+
+# 默认的图片分析模型配置（与原 ImageGenerator.understand_input_image 一致）
+DEFAULT_MODEL_DIR = '../../models/minicpm_v_2_6'
+DEFAULT_DEVICE = 'GPU'
+ANALYZE_PROMPT = "请详细描述这张图片的内容"
+
+# 已加载的分析模型，按 (模型目录, 设备) 复用，避免每次生成都重新编译模型
+_analyzers: Dict[Tuple[str, str], Any] = {}
+_analyzers_lock = threading.Lock()
+
+scene_renderer = SceneRenderer(background_generator)
+
+
+def get_analyzer(model_dir: Union[str, Path] = DEFAULT_MODEL_DIR, device: str = DEFAULT_DEVICE):
+    """获取（必要时加载）共享的 AnalyzeImage 实例"""
+    key = (str(model_dir), device)
+    with _analyzers_lock:
+        analyzer = _analyzers.get(key)
+        if analyzer is None:
+            # 延迟导入：只做排版渲染时不需要加载 torch/openvino
+            from analyze import AnalyzeImage
+            analyzer = AnalyzeImage(model_dir=model_dir, device=device)
+            _analyzers[key] = analyzer
+        return analyzer
+
+
+class PosterPipeline:
+    """海报生成流水线：load → analyze → plan → render
+
+    GUI 工作线程和批处理共用这一套阶段实现，每个阶段都是普通的同步方法，
+    由调用方决定在哪个线程执行以及阶段之间如何取消。
+    """
+
+    STAGES = ('load', 'analyze', 'plan', 'render')
+
+    def __init__(self, model_dir: Union[str, Path] = DEFAULT_MODEL_DIR, device: str = DEFAULT_DEVICE,
+                 max_new_tokens: int = 1000):
+        self.model_dir = model_dir
+        self.device = device
+        self.max_new_tokens = max_new_tokens
+
+    @staticmethod
+    def load_image(path: Union[str, Path]) -> Image.Image:
+        """读取产品图片，保留透明通道（抠图）"""
+        with Image.open(path) as img:
+            img.load()
+            if img.mode in ('RGBA', 'LA') or 'transparency' in img.info:
+                return img.convert('RGBA')
+            return img.convert('RGB')
+
+    def analyze(self, image: Image.Image, question: str = ANALYZE_PROMPT,
+                on_token: Optional[Callable[[str], None]] = None,
+                should_stop: Optional[Callable[[], bool]] = None) -> str:
+        """流式分析图片内容
+
+        Args:
+            image: 产品图片
+            question: 提问内容
+            on_token: 每生成一段文本时回调（增量文本）
+            should_stop: 取消检查，返回True时在下一个token处停止生成
+
+        Returns:
+            str: 完整的描述（取消时为已生成的部分）
+        """
+        analyzer = get_analyzer(self.model_dir, self.device)
+        parts = []
+        for token in analyzer.analyze(image.convert('RGB'), question, stream=True,
+                                      max_new_tokens=self.max_new_tokens, should_stop=should_stop):
+            if not token:
+                continue
+            parts.append(token)
+            if on_token is not None:
+                on_token(token)
+            if should_stop is not None and should_stop():
+                break
+        return "".join(parts).strip()
+
+    @staticmethod
+    def _title_from_description(description: str, max_len: int = 16) -> str:
+        """从描述中截取第一句作为默认标题"""
+        first = re.split(r'[。！？!?\n]', description.strip(), maxsplit=1)[0] if description else ""
+        first = first.strip(' ，,：:')
+        if len(first) > max_len:
+            first = first[:max_len] + "…"
+        return first or "新品上市"
+
+    @staticmethod
+    def plan_scene(description: str, texts: Optional[Dict[str, str]] = None,
+                   background: Optional[Dict[str, Any]] = None) -> Scene:
+        """根据图片描述和文案规划与分辨率无关的海报场景
+
+        Args:
+            description: 图片分析结果
+            texts: 可选文案，键为 title/features/price/slogan
+            background: 可选背景风格参数，默认按描述推断
+        """
+        texts = dict(texts or {})
+        texts.setdefault('title', PosterPipeline._title_from_description(description))
+        if background is None:
+            background = background_generator.style_from_description(description)
+            if background.get('type') == 'linear' and 'colors' not in background:
+                background = {"type": "blobs", "seed": len(description) % 97}
+        return Scene(texts, background, description)
+
+    @staticmethod
+    def plan(description: str, size: Union[str, Tuple[int, int]], texts: Optional[Dict[str, str]] = None,
+             background: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """规划指定尺寸的海报布局
+
+        坐标均为相对画布的比例(0~1)，字号为相对画布短边的比例。
+
+        Returns:
+            Dict: 可JSON序列化的布局描述
+        """
+        return PosterPipeline.plan_scene(description, texts, background).layout_for(size)
+
+    @staticmethod
+    def render(layout: Dict[str, Any], product_image: Optional[Image.Image] = None) -> PosterCompositor:
+        """按布局生成分层合成器（背景 → 产品 → 文字 → 价格角标）"""
+        return scene_renderer.render_layout(layout, product_image)
+
+    @staticmethod
+    def render_sizes(scene: Scene, sizes: Sequence[Union[str, Tuple[int, int]]],
+                     product_image: Optional[Image.Image] = None) -> Dict[str, PosterCompositor]:
+        """将同一场景一次渲染为多个尺寸，解码、重采样、文字栅格化和背景都只做一次"""
+        return scene_renderer.render_scene(scene, sizes, product_image)
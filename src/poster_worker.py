@@ -0,0 +1,93 @@
+import threading
+from typing import Dict, Optional
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from pipeline import PosterPipeline
+
+
+class GenerationCancelled(Exception):
+    """生成流程被用户取消"""
+
+
+class PosterWorker(QThread):
+    """在后台线程中执行海报生成流水线，避免阻塞GUI
+
+    阶段依次为 load → analyze → plan → render，每个阶段开始前都会检查取消标志，
+    analyze 阶段在每个token之间也会检查，因此取消最多等待一个token。
+    所有结果都通过信号投递回主线程，不在工作线程中操作任何控件。
+    """
+    stage = pyqtSignal(str, str)     # 阶段名称, 阶段说明
+    progress = pyqtSignal(int)       # 总体进度 0-100
+    partial = pyqtSignal(str)        # 分析阶段的增量文本
+    preview = pyqtSignal(QImage)     # 渲染完成的海报
+    result = pyqtSignal(str)         # 完成信号，发送图片分析结果
+    error = pyqtSignal(str)          # 错误信号
+    cancelled = pyqtSignal()         # 取消完成信号
+
+    # 各阶段开始时对应的进度
+    STAGE_PROGRESS = {'load': 0, 'analyze': 10, 'plan': 80, 'render': 90}
+
+    def __init__(self, size_str: str, image_path: Optional[str], pipeline: Optional[PosterPipeline] = None,
+                 texts: Optional[Dict[str, str]] = None):
+        super().__init__()
+        self.size_str = size_str
+        self.image_path = image_path
+        self.pipeline = pipeline or PosterPipeline()
+        self.texts = texts
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """请求取消，可以从任意线程调用"""
+        self._cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def _enter_stage(self, name: str, message: str):
+        if self.is_cancelled():
+            raise GenerationCancelled()
+        self.stage.emit(name, message)
+        self.progress.emit(self.STAGE_PROGRESS[name])
+
+    def run(self):
+        try:
+            self._enter_stage('load', f"正在打开图片：{self.image_path}")
+            product_image = self.pipeline.load_image(self.image_path)
+
+            self._enter_stage('analyze', "正在分析图片内容，请稍候...")
+            token_count = 0
+            analyze_start = self.STAGE_PROGRESS['analyze']
+            analyze_span = self.STAGE_PROGRESS['plan'] - analyze_start
+
+            def on_token(token: str):
+                nonlocal token_count
+                token_count += 1
+                self.partial.emit(token)
+                done = min(1.0, token_count / self.pipeline.max_new_tokens)
+                self.progress.emit(analyze_start + int(done * analyze_span))
+
+            description = self.pipeline.analyze(product_image, on_token=on_token, should_stop=self.is_cancelled)
+            if self.is_cancelled():
+                raise GenerationCancelled()
+
+            self._enter_stage('plan', "正在规划海报布局...")
+            layout = self.pipeline.plan(description, self.size_str, texts=self.texts)
+
+            self._enter_stage('render', f"正在渲染 {self.size_str} 海报...")
+            compositor = self.pipeline.render(layout, product_image)
+            canvas = compositor.render()
+            height, width = canvas.shape[:2]
+            # copy() 让QImage拥有自己的像素内存，跨线程传递后依然有效
+            image = QImage(canvas.data, width, height, width * 3, QImage.Format_RGB888).copy()
+            if self.is_cancelled():
+                raise GenerationCancelled()
+
+            self.preview.emit(image)
+            self.progress.emit(100)
+            self.result.emit(description)
+        except GenerationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(str(e))
@@ -0,0 +1,269 @@
+"""回放 LLMLogger 记录的模型调用，用真实流量比较模型或参数的变化
+
+从 log/llm_log_*.jsonl 中取出每次调用的完整输入和当时的回答作为用例，按指定并发
+重新请求任意模型（或模拟服务），统计每次调用的延迟、首字延迟、生成速度，
+以及新回答相对录制回答的偏移(drift，1 - 文本相似度)。
+
+用法示例：
+    python replay.py ../log/llm_log_20250101_120000.jsonl --model qwen2.5:14b --concurrency 2
+    python replay.py ../log/llm_log_*.jsonl --limit 50 --export fixtures.jsonl   # 只导出用例
+    python replay.py fixtures.jsonl --fake --rate 80                             # 对模拟服务回放
+
+用例文件(JSONL)每行一条 {"id", "model", "messages", "response", "recorded"}，
+也可以直接作为 fake_ollama_server.py 的 --responses 录制回答。
+"""
+import argparse
+import difflib
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from agent_prompt import message_role, message_text
+from load_test import percentile
+from think_parser import ThinkStreamParser
+from utils.llm_logger import expand_records, read_records
+from utils.token_accounting import usage_from_ollama
+
+logger = logging.getLogger(__name__)
+
+# smolagents 的消息角色与 Ollama 聊天接口的对应关系
+ROLE_MAP = {"tool-response": "tool", "tool-call": "assistant"}
+
+
+def _response_text(response: Any) -> str:
+    """录制回答的文本；只有工具调用时使用工具调用的JSON"""
+    if isinstance(response, str):
+        return response
+    if not isinstance(response, dict):
+        return ""
+    text = message_text(response)
+    if not text and response.get("tool_calls"):
+        text = json.dumps(response["tool_calls"], ensure_ascii=False, sort_keys=True)
+    return text
+
+
+def _role(message: Dict[str, Any]) -> str:
+    """Ollama 聊天接口的角色；较早的日志把 smolagents 的角色写成了 "MessageRole.TOOL_RESPONSE" 这样的枚举名"""
+    role = message_role(message) or "user"
+    if role.startswith("MessageRole."):
+        role = role[len("MessageRole."):].lower().replace("_", "-")
+    return ROLE_MAP.get(role, role)
+
+
+def _chat_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    return [{"role": _role(m), "content": message_text(m)} for m in messages if isinstance(m, dict)]
+
+
+def fixtures_from_log(path: str) -> List[Dict[str, Any]]:
+    """把一个日志文件（含切分的分段）中的 输入消息+回答 配对为用例"""
+    fixtures = []
+    pending: Dict[int, Dict[str, Any]] = {}
+    for record in expand_records(read_records(path)):
+        conv = record.get("conv")
+        record_type = record.get("type")
+        if record_type == "messages":
+            pending[conv] = {
+                "id": f"{os.path.basename(path)}#{conv}",
+                "model": None,
+                "messages": _chat_messages(record["data"]),
+                "response": None,
+                "recorded": {"ts": record.get("ts")},
+            }
+        elif record_type == "event" and conv in pending and record["data"].get("name") == "token_usage":
+            usage = record["data"]
+            pending[conv]["model"] = (usage.get("model") or "").split("/", 1)[-1] or None
+            pending[conv]["recorded"].update(prompt_tokens=usage.get("prompt_tokens"),
+                                             completion_tokens=usage.get("completion_tokens"),
+                                             seconds=usage.get("seconds"))
+        elif record_type == "response" and conv in pending:
+            fixture = pending[conv]
+            fixture["response"] = _response_text(record.get("data"))
+            if fixture["recorded"].get("seconds") is None and fixture["recorded"]["ts"]:
+                fixture["recorded"]["seconds"] = round(record["ts"] - fixture["recorded"]["ts"], 3)
+            fixtures.append(fixture)
+    return fixtures
+
+
+def load_fixtures(paths: Iterable[str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """读取用例：导出的用例文件直接读取，日志文件先配对"""
+    fixtures: List[Dict[str, Any]] = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            first = f.readline().strip()
+        # 用例文件的每行有 messages 字段，日志记录则有 type 字段（压缩的分段交给 read_records 处理）
+        head = json.loads(first) if first.startswith('{') else {}
+        if "messages" in head and "type" not in head:
+            with open(path, 'r', encoding='utf-8') as f:
+                fixtures.extend(json.loads(line) for line in f if line.strip())
+        else:
+            fixtures.extend(fixtures_from_log(path))
+    return fixtures[:limit] if limit else fixtures
+
+
+def drift(expected: str, actual: str) -> float:
+    """回答的偏移：1 - 相似度，只比较回答部分（去掉 <think> 推理）"""
+    expected = ThinkStreamParser.split(expected)[1].strip()
+    actual = ThinkStreamParser.split(actual)[1].strip()
+    if expected == actual:
+        return 0.0
+    return round(1 - difflib.SequenceMatcher(None, expected, actual, autojunk=False).ratio(), 4)
+
+
+class ReplayRunner:
+    """按并发数回放用例，每个请求使用流式接口以测量首字延迟"""
+
+    def __init__(self, base_url: str, model: Optional[str] = None, concurrency: int = 1,
+                 temperature: float = 0.0, keep_alive: Any = None):
+        """
+        Args:
+            base_url: Ollama(或模拟服务)地址
+            model: 回放使用的模型，为 None 时使用用例录制时的模型
+            concurrency: 同时进行的请求数
+            temperature: 采样温度，默认0以减少随机性对偏移的影响
+        """
+        from llm_ollama import DEFAULT_CONTEXT_WINDOW, DEFAULT_KEEP_ALIVE, MODEL_CONTEXT_WINDOW, OllamaClientPool
+
+        self.client = OllamaClientPool.client(base_url)
+        self.model = model
+        self.concurrency = concurrency
+        self.temperature = temperature
+        self.keep_alive = keep_alive if keep_alive is not None else DEFAULT_KEEP_ALIVE
+        self._context_window = lambda name: MODEL_CONTEXT_WINDOW.get(name, DEFAULT_CONTEXT_WINDOW)
+
+    def replay_one(self, fixture: Dict[str, Any]) -> Dict[str, Any]:
+        model = self.model or fixture.get("model")
+        result = {"id": fixture.get("id"), "model": model}
+        if not model:
+            result["error"] = "用例没有记录模型，需要用 --model 指定"
+            return result
+        start = time.perf_counter()
+        first = None
+        parts = []
+        final = None
+        try:
+            for chunk in self.client.chat(model=model, messages=fixture["messages"], stream=True,
+                                          keep_alive=self.keep_alive,
+                                          options={"temperature": self.temperature,
+                                                   "num_ctx": self._context_window(model)}):
+                content = chunk["message"]["content"] if chunk.get("message") else ""
+                if content:
+                    if first is None:
+                        first = time.perf_counter()
+                    parts.append(content)
+                if chunk.get("done"):
+                    final = chunk
+        except Exception as e:
+            result["error"] = str(e)
+            result["latency"] = round(time.perf_counter() - start, 3)
+            return result
+
+        end = time.perf_counter()
+        text = "".join(parts)
+        usage = usage_from_ollama(final or {})
+        generate_seconds = usage["eval_seconds"] or ((end - first) if first else None)
+        recorded = fixture.get("recorded") or {}
+        result.update(
+            latency=round(end - start, 3),
+            first_token=round(first - start, 3) if first else None,
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            tokens_per_second=(round(usage["completion_tokens"] / generate_seconds, 1)
+                               if generate_seconds and usage["completion_tokens"] else None),
+            recorded_latency=recorded.get("seconds"),
+            recorded_completion_tokens=recorded.get("completion_tokens"),
+            drift=drift(fixture.get("response") or "", text),
+        )
+        return result
+
+    def run(self, fixtures: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='replay') as pool:
+            return list(pool.map(self.replay_one, fixtures))
+
+
+def summarize(results: List[Dict[str, Any]], seconds: float) -> Dict[str, Any]:
+    ok = [r for r in results if "error" not in r]
+    latencies = [r["latency"] for r in ok]
+    first_tokens = [r["first_token"] for r in ok if r["first_token"] is not None]
+    rates = [r["tokens_per_second"] for r in ok if r["tokens_per_second"]]
+    drifts = [r["drift"] for r in ok]
+    recorded = [r["recorded_latency"] for r in ok if r.get("recorded_latency")]
+    return {
+        "calls": len(results),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "seconds": round(seconds, 3),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "recorded_latency_p50": percentile(recorded, 50),
+        "first_token_p50": percentile(first_tokens, 50),
+        "first_token_p95": percentile(first_tokens, 95),
+        "tokens_per_second_mean": round(statistics.mean(rates), 1) if rates else 0.0,
+        "completion_tokens": sum(r["completion_tokens"] for r in ok),
+        "drift_mean": round(statistics.mean(drifts), 4) if drifts else 0.0,
+        "drift_p95": percentile(drifts, 95),
+        "exact_matches": sum(d == 0.0 for d in drifts),
+    }
+
+
+def main():
+    from llm_ollama import MODEL_LIST
+
+    parser = argparse.ArgumentParser(description="回放记录的模型调用")
+    parser.add_argument('paths', nargs='+', help="LLMLogger 日志(.jsonl)或导出的用例文件")
+    parser.add_argument('--model', choices=MODEL_LIST, help="回放使用的模型，默认使用录制时的模型")
+    parser.add_argument('--concurrency', type=int, default=1, help="同时进行的请求数")
+    parser.add_argument('--temperature', type=float, default=0.0, help="采样温度")
+    parser.add_argument('--limit', type=int, help="最多回放的用例数")
+    parser.add_argument('--export', help="把用例写入该文件后退出")
+    parser.add_argument('--host', help="Ollama 服务地址，默认使用 OLLAMA_HOST")
+    parser.add_argument('--fake', action='store_true', help="在进程内启动模拟服务，按录制的回答回放")
+    parser.add_argument('--rate', type=float, default=50.0, help="模拟服务的生成速度(token/s)")
+    parser.add_argument('--latency', type=float, default=0.1, help="模拟服务的首字延迟(秒)")
+    parser.add_argument('--output', help="把每次调用的结果和汇总写入该JSON文件")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.paths, args.limit)
+    if args.export:
+        with open(args.export, 'w', encoding='utf-8') as f:
+            for fixture in fixtures:
+                f.write(json.dumps(fixture, ensure_ascii=False) + '\n')
+        print(f"已导出 {len(fixtures)} 个用例到 {args.export}")
+        return
+    if not fixtures:
+        print("没有可回放的用例")
+        return
+
+    server = None
+    base_url = args.host or os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+    if args.fake:
+        import tempfile
+        from fake_ollama_server import FakeOllamaConfig, start_in_thread
+        # 模拟服务按顺序回放录制的回答
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as f:
+            for fixture in fixtures:
+                f.write(json.dumps({"response": fixture.get("response") or ""}, ensure_ascii=False) + '\n')
+        config = FakeOllamaConfig(tokens_per_second=args.rate, first_token_latency=args.latency,
+                                  responses_path=f.name, seed=0)
+        server, base_url = start_in_thread(config)
+        os.remove(f.name)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    runner = ReplayRunner(base_url, args.model, args.concurrency, args.temperature)
+    start = time.perf_counter()
+    results = runner.run(fixtures)
+    report = summarize(results, time.perf_counter() - start)
+    if server is not None:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"summary": report, "results": results}, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
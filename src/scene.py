@@ -0,0 +1,236 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from background import BackgroundGenerator, default_generator, parse_size
+from compositor import Layer, PosterCompositor, render_badge_image, render_text_image
+
+Size = Union[str, Tuple[int, int]]
+
+# 不同画幅的版式预设，坐标为相对画布的比例(0~1)
+LAYOUT_PRESETS: Dict[str, Dict[str, Any]] = {
+    # 竖版：标题在上，产品居中，价格右下，标语底部
+    "portrait": {
+        "product": [0.1, 0.28, 0.9, 0.78],
+        "title": [0.08, 0.06], "features": [0.08, 0.16],
+        "price": [0.6, 0.82], "slogan": [0.08, 0.92],
+    },
+    # 横版：文字在左，产品在右
+    "landscape": {
+        "product": [0.5, 0.1, 0.95, 0.9],
+        "title": [0.06, 0.12], "features": [0.06, 0.34],
+        "price": [0.06, 0.7], "slogan": [0.06, 0.86],
+    },
+    "square": {
+        "product": [0.35, 0.25, 0.95, 0.85],
+        "title": [0.06, 0.06], "features": [0.06, 0.22],
+        "price": [0.06, 0.72], "slogan": [0.06, 0.9],
+    },
+}
+
+# 字号为相对画布短边的比例
+FONT_SIZES = {"title": 0.065, "features": 0.032, "price": 0.045, "slogan": 0.035}
+TEXT_COLOR = [30, 30, 40]
+
+
+def orientation(width: int, height: int) -> str:
+    """按宽高比判断画幅"""
+    if height > width * 1.2:
+        return "portrait"
+    if width > height * 1.2:
+        return "landscape"
+    return "square"
+
+
+class Scene:
+    """与分辨率无关的海报场景
+
+    只记录文案、背景风格和各画幅下的相对坐标，不包含任何像素尺寸，
+    同一个场景可以渲染到 PosterGUI.size_combo 中的任意尺寸。
+    """
+
+    def __init__(self, texts: Dict[str, str], background: Dict[str, Any], description: str = "",
+                 presets: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.texts = dict(texts)
+        self.background = background
+        self.description = description
+        self.presets = presets or LAYOUT_PRESETS
+
+    def layout_for(self, size: Size) -> Dict[str, Any]:
+        """展开为指定尺寸的布局（PosterPipeline.render 使用的格式）"""
+        width, height = parse_size(size)
+        preset = self.presets[orientation(width, height)]
+
+        elements = []
+        for name in ('title', 'features', 'slogan'):
+            if self.texts.get(name):
+                elements.append({
+                    "kind": "text", "name": name, "text": self.texts[name],
+                    "pos": preset[name], "font_size": FONT_SIZES[name], "color": TEXT_COLOR,
+                })
+        if self.texts.get('price'):
+            elements.append({
+                "kind": "badge", "name": "price", "text": self.texts['price'],
+                "pos": preset['price'], "font_size": FONT_SIZES['price'],
+            })
+
+        return {
+            "size": [width, height],
+            "background": self.background,
+            "product": {"box": preset["product"]},
+            "elements": elements,
+            "description": self.description,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"texts": self.texts, "background": self.background, "description": self.description}
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> 'Scene':
+        return Scene(data.get("texts", {}), data["background"], data.get("description", ""))
+
+
+class SceneRenderer:
+    """将布局渲染成分层合成器，多个尺寸一次完成并共享中间结果
+
+    - 背景：在覆盖所有尺寸的主画布上只生成一次，各尺寸按 cover 方式裁剪/缩放
+    - 产品图：从原图只重采样一次到最大所需尺寸，其余尺寸从它缩小
+    - 文字/角标：按最大字号只栅格化一次，其余字号从它缩小
+    """
+
+    def __init__(self, background_generator: Optional[BackgroundGenerator] = None):
+        self.background_generator = background_generator or default_generator
+
+    @staticmethod
+    def _cover(master: np.ndarray, width: int, height: int) -> np.ndarray:
+        """从主画布中按 cover 方式取出目标尺寸（先等比缩放再居中裁剪）"""
+        master_h, master_w = master.shape[:2]
+        scale = max(width / master_w, height / master_h)
+        if abs(scale - 1.0) > 1e-6:
+            scaled_w = max(width, int(round(master_w * scale)))
+            scaled_h = max(height, int(round(master_h * scale)))
+            image = Image.fromarray(master).resize((scaled_w, scaled_h), Image.BILINEAR)
+            master = np.asarray(image)
+            master_h, master_w = master.shape[:2]
+        x0 = (master_w - width) // 2
+        y0 = (master_h - height) // 2
+        return master[y0:y0 + height, x0:x0 + width]
+
+    @staticmethod
+    def _product_box(layout: Dict[str, Any]) -> Tuple[int, int, int, int]:
+        width, height = layout["size"]
+        bx0, by0, bx1, by1 = layout["product"]["box"]
+        return int(bx0 * width), int(by0 * height), int(bx1 * width), int(by1 * height)
+
+    @staticmethod
+    def _fit(image_size: Tuple[int, int], box: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+        """等比缩放到布局框内并居中，返回 (宽, 高, x, y)"""
+        x0, y0, x1, y1 = box
+        box_w, box_h = max(1, x1 - x0), max(1, y1 - y0)
+        scale = min(box_w / image_size[0], box_h / image_size[1])
+        new_w, new_h = max(1, int(image_size[0] * scale)), max(1, int(image_size[1] * scale))
+        return new_w, new_h, x0 + (box_w - new_w) // 2, y0 + (box_h - new_h) // 2
+
+    @staticmethod
+    def _element_px(element: Dict[str, Any], size: Sequence[int]) -> int:
+        return max(8, int(element["font_size"] * min(size)))
+
+    @staticmethod
+    def _rasterize(element: Dict[str, Any], font_size: int) -> Image.Image:
+        if element["kind"] == "badge":
+            return render_badge_image(element["text"], font_size)
+        return render_text_image(element["text"], font_size, tuple(element.get("color", (0, 0, 0))))
+
+    @staticmethod
+    def _element_key(element: Dict[str, Any]) -> Tuple:
+        return (element["kind"], element["text"], tuple(element.get("color", ())))
+
+    def render_layouts(self, layouts: List[Dict[str, Any]],
+                       product_image: Optional[Image.Image] = None) -> List[PosterCompositor]:
+        """渲染多份布局，返回与输入顺序对应的合成器列表"""
+        if not layouts:
+            return []
+
+        # 背景：按风格分组，每种风格只在覆盖所有尺寸的主画布上生成一次
+        style_keys = [json.dumps(layout["background"], sort_keys=True) for layout in layouts]
+        master_sizes: Dict[str, Tuple[int, int]] = {}
+        for key, layout in zip(style_keys, layouts):
+            width, height = layout["size"]
+            old_w, old_h = master_sizes.get(key, (0, 0))
+            master_sizes[key] = (max(old_w, width), max(old_h, height))
+        backgrounds = {
+            key: self.background_generator.generate(layout["background"], master_sizes[key])
+            for key, layout in zip(style_keys, layouts)
+        }
+
+        # 产品图：先从原图重采样到最大需求尺寸，其余尺寸从它缩小
+        product_fits = []
+        product_master = None
+        if product_image is not None:
+            product_fits = [self._fit(product_image.size, self._product_box(layout)) for layout in layouts]
+            max_w = max(fit[0] for fit in product_fits)
+            max_h = max(fit[1] for fit in product_fits)
+            product_master = product_image.convert('RGBA').resize((max_w, max_h), Image.LANCZOS)
+        product_cache: Dict[Tuple[int, int], np.ndarray] = {}
+
+        # 文字/角标：同一元素只按所需的最大字号栅格化一次
+        glyph_px: Dict[Tuple, int] = {}
+        for layout in layouts:
+            for element in layout["elements"]:
+                key = self._element_key(element)
+                glyph_px[key] = max(glyph_px.get(key, 0), self._element_px(element, layout["size"]))
+        glyph_masters: Dict[Tuple, Image.Image] = {}
+        glyph_cache: Dict[Tuple, np.ndarray] = {}
+
+        compositors = []
+        for index, layout in enumerate(layouts):
+            width, height = layout["size"]
+            compositor = PosterCompositor(width, height)
+            compositor.add_layer(Layer("background", self._cover(backgrounds[style_keys[index]], width, height)))
+
+            if product_master is not None:
+                new_w, new_h, x, y = product_fits[index]
+                pixels = product_cache.get((new_w, new_h))
+                if pixels is None:
+                    if (new_w, new_h) == product_master.size:
+                        pixels = np.asarray(product_master)
+                    else:
+                        pixels = np.asarray(product_master.resize((new_w, new_h), Image.LANCZOS))
+                    product_cache[(new_w, new_h)] = pixels
+                compositor.add_layer(Layer("product", pixels, x, y))
+
+            for element in layout["elements"]:
+                key = self._element_key(element)
+                px = self._element_px(element, layout["size"])
+                pixels = glyph_cache.get(key + (px,))
+                if pixels is None:
+                    master_px = glyph_px[key]
+                    master = glyph_masters.get(key)
+                    if master is None:
+                        master = glyph_masters[key] = self._rasterize(element, master_px)
+                    if px == master_px:
+                        pixels = np.asarray(master)
+                    else:
+                        ratio = px / master_px
+                        target = (max(1, int(master.width * ratio)), max(1, int(master.height * ratio)))
+                        pixels = np.asarray(master.resize(target, Image.LANCZOS))
+                    glyph_cache[key + (px,)] = pixels
+                x, y = int(element["pos"][0] * width), int(element["pos"][1] * height)
+                compositor.add_layer(Layer(element["name"], pixels, x, y))
+
+            compositors.append(compositor)
+        return compositors
+
+    def render_layout(self, layout: Dict[str, Any], product_image: Optional[Image.Image] = None) -> PosterCompositor:
+        """渲染单个布局"""
+        return self.render_layouts([layout], product_image)[0]
+
+    def render_scene(self, scene: Scene, sizes: Sequence[Size],
+                     product_image: Optional[Image.Image] = None) -> Dict[str, PosterCompositor]:
+        """将场景一次渲染到多个尺寸，返回 {'1080x1920': 合成器, ...}"""
+        layouts = [scene.layout_for(size) for size in sizes]
+        compositors = self.render_layouts(layouts, product_image)
+        return {f"{layout['size'][0]}x{layout['size'][1]}": compositor
+                for layout, compositor in zip(layouts, compositors)}
@@ -0,0 +1,107 @@
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import QTextEdit
+
+
+class StreamingTextView(QTextEdit):
+    """支持流式追加的只读文本框
+
+    流式增量先写入缓冲区，最多每帧(约16ms)刷新一次，刷新时只在文档末尾插入新文本，
+    不再对整个对话记录做 toPlainText/setPlainText。文档的段落数有上限，
+    超出后最早的段落会被丢弃，长时间会话也能保持流畅。
+    """
+
+    FRAME_INTERVAL_MS = 16
+    DEFAULT_MAX_BLOCKS = 5000
+
+    def __init__(self, parent=None, max_blocks: int = DEFAULT_MAX_BLOCKS):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        self.document().setMaximumBlockCount(max_blocks)
+
+        self._pending = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(self.FRAME_INTERVAL_MS)
+        self._flush_timer.timeout.connect(self.flush)
+
+        # 标记当前AI回答的起始位置。锚点放在回答起点的前一个字符上，
+        # 这样末尾插入文本时锚点不动，而顶部段落被丢弃时QTextCursor会自动前移
+        self._response_anchor = None
+        self._anchor_offset = 0
+
+    def _at_bottom(self) -> bool:
+        scrollbar = self.verticalScrollBar()
+        return scrollbar.value() >= scrollbar.maximum() - 4
+
+    def _scroll_to_bottom(self):
+        scrollbar = self.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
+    def append_delta(self, text: str):
+        """追加一段流式文本，实际写入会合并到下一帧"""
+        if not text:
+            return
+        self._pending.append(text)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def flush(self):
+        """立即把缓冲区的文本写入文档末尾"""
+        self._flush_timer.stop()
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending = []
+
+        follow = self._at_bottom()
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        if follow:
+            self._scroll_to_bottom()
+
+    def append(self, text: str):
+        """追加一个新段落，先写入尚未刷新的流式文本以保持顺序"""
+        self.flush()
+        follow = self._at_bottom()
+        super().append(text)
+        if follow:
+            self._scroll_to_bottom()
+
+    def begin_response(self):
+        """标记一段新的流式回答从文档末尾开始"""
+        self.flush()
+        self._response_anchor = QTextCursor(self.document())
+        self._response_anchor.movePosition(QTextCursor.End)
+        self._anchor_offset = 0
+        if self._response_anchor.position() > 0:
+            self._response_anchor.movePosition(QTextCursor.PreviousCharacter)
+            self._anchor_offset = 1
+
+    def end_response(self):
+        """结束当前回答，写入剩余的缓冲文本"""
+        self.flush()
+        self._response_anchor = None
+
+    def replace_response(self, text: str):
+        """用完整文本替换当前回答（如出错时清空已显示的部分）"""
+        self._pending = []
+        self._flush_timer.stop()
+        if self._response_anchor is None:
+            self.append_delta(text)
+            return
+        cursor = QTextCursor(self.document())
+        # 空文档时回答从0开始，锚点会随插入移动，因此不能使用其位置
+        start = self._response_anchor.position() + 1 if self._anchor_offset else 0
+        cursor.setPosition(start)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.insertText(text)
+        self._scroll_to_bottom()
+
+    def clear(self):
+        self._pending = []
+        self._flush_timer.stop()
+        self._response_anchor = None
+        super().clear()
@@ -1,19 +1,56 @@
 from smolagents import ToolCallingAgent, LiteLLMModel, tool, Tool, ChatMessage  
 from ollama import Client  
+import httpx
+import litellm
 import os  
 from dotenv import load_dotenv  
+import re
+import logging
 import json
+import time
+import hashlib
+from datetime import datetime
 from utils.llm_logger import LLMLogger
+from utils.llm_cache import LLMResponseCache, get_default_cache
+from utils.tool_cache import memoize_tool, log_tool_cache_stats
+from utils.tracing import tracer
+from utils.token_accounting import BudgetExceeded, RunBudget, TokenLedger
+from utils.agent_checkpoint import CheckpointStore, StepFailed, activate, active_checkpoint, call_with_retry, find_cause
+from background import BackgroundGenerator, default_generator as background_generator
+from tool_graph import ToolGraph, ToolGraphExecutor, ToolNode
+from agent_prompt import AgentPromptAssembler
+from think_parser import ThinkStreamParser
+from workflow import WorkflowRouter, WorkflowTemplate
 from typing import List, Dict, Optional, Any
   
 model_list = ['qwen2.5:7b', 'qwen2.5:14b', 'deepseek-r1:7b', 'deepseek-r1:14b', 'deepseek-r1:7b-qwen-distill-q8_0']
 use_model = model_list[3]
 
+# 海报输出配置
+POSTER_SIZE = "1080x1920"
+OUTPUT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'output'))
+
+logger = logging.getLogger(__name__)
+
 # 加载本地环境变量  
 load_dotenv()  
   
 # 配置Ollama客户端  
 client = Client(host=os.getenv('OLLAMA_HOST', 'http://localhost:11434'))  
+
+# 可以重试的暂时性错误：连接失败、超时和服务端5xx。请求本身有误（如超出上下文窗口）时重试也不会成功
+TRANSIENT_MODEL_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    httpx.TransportError,
+    litellm.exceptions.APIConnectionError,
+    litellm.exceptions.Timeout,
+    litellm.exceptions.ServiceUnavailableError,
+    litellm.exceptions.InternalServerError,
+)
+
+# 每次运行的token用量和预算（POSTER_AGENT_MAX_TOKENS / POSTER_AGENT_MAX_SECONDS / POSTER_AGENT_MAX_STEPS）
+token_ledger = TokenLedger(RunBudget.from_env())
   
 # 定义工具函数  
 @tool  
@@ -29,6 +66,7 @@ def get_weather(location: str) -> str:
     return f"{location}的当前气温为23℃，晴，东南风2级，空气湿度65%。"  
   
 @tool
+@memoize_tool(ttl_seconds=600)
 def get_product_description(product_name: str) -> Dict[str, str]:
     """获取产品的详细描述信息。
 
@@ -48,6 +86,7 @@ def get_product_description(product_name: str) -> Dict[str, str]:
     }
 
 @tool
+@memoize_tool(ttl_seconds=600)
 def plan_poster_layout(product_info: Dict[str, str]) -> Dict[str, Dict[str, str]]:
     """规划海报布局。
 
@@ -77,6 +116,7 @@ def plan_poster_layout(product_info: Dict[str, str]) -> Dict[str, Dict[str, str]
     }
 
 @tool
+@memoize_tool(ttl_seconds=3600)
 def get_product_image(product_name: str) -> str:
     """获取产品主图的抠图。
 
@@ -88,19 +128,30 @@ def get_product_image(product_name: str) -> str:
     """
     return "[模拟输出] 已生成保温杯透明背景主图，45度展示角度，突出杯身质感和材质"
 
+# 不做磁盘缓存：结果中的图片路径在 output 目录被清理或换目录运行后会失效，
+# 相同风格的背景由 BackgroundGenerator 的 LRU 缓存复用
 @tool
+@tracer.traced("tool")
 def get_background_image(style_description: str) -> str:
     """获取海报背景图。
 
     Args:
-        style_description: 背景风格描述。
+        style_description: 背景风格描述，例如"从左上角的浅蓝色渐变到右下角的深紫色"。
 
     Returns:
-        str: 模拟的背景图片描述。
+        str: 生成的背景图片路径及风格说明。
     """
-    return "[模拟输出] 已生成渐变背景，从左上角的浅蓝色渐变到右下角的深紫色，营造高级感"
+    style = background_generator.style_from_description(style_description)
+    image = background_generator.generate_image(style, POSTER_SIZE)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    key = hashlib.md5(BackgroundGenerator.cache_key(style, POSTER_SIZE).encode('utf-8')).hexdigest()[:12]
+    path = os.path.join(OUTPUT_DIR, f"background_{key}.png")
+    if not os.path.exists(path):
+        image.save(path)
+    return f"已生成{POSTER_SIZE}背景图：{path}（风格参数：{json.dumps(style, ensure_ascii=False)}）"
 
 @tool
+@memoize_tool(ttl_seconds=600)
 def generate_poster_text(product_info: Dict[str, str]) -> Dict[str, str]:
     """生成海报文案。
 
@@ -118,6 +169,7 @@ def generate_poster_text(product_info: Dict[str, str]) -> Dict[str, str]:
     }
 
 @tool
+@tracer.traced("tool")
 def compose_final_poster(
     product_image: str,
     background: str,
@@ -145,10 +197,135 @@ def compose_final_poster(
        - 标语：{text_content['slogan']} ({layout['text_elements']['slogan']})
     """
 
+def _background_style(context: Dict[str, Any]) -> str:
+    """未指定背景风格时，用产品配色生成渐变描述"""
+    if context.get("style_description"):
+        return context["style_description"]
+    colors = context["product_info"].get("colors") or []
+    if len(colors) >= 2:
+        return f"从左上角的{colors[0]}渐变到右下角的{colors[-1]}"
+    return "从左上角的浅蓝色渐变到右下角的深紫色"
+
+# 海报工具的依赖关系：产品描述之后，布局、背景、文案可以并行，产品图只依赖产品名称
+poster_graph = ToolGraph(
+    [
+        ToolNode(get_product_description, "product_info", {"product_name": "product_name"}),
+        ToolNode(get_product_image, "product_image", {"product_name": "product_name"}),
+        ToolNode(plan_poster_layout, "layout", {"product_info": "product_info"}),
+        ToolNode(get_background_image, "background",
+                 {"style_description": (_background_style, ["style_description", "product_info"])}),
+        ToolNode(generate_poster_text, "text_content", {"product_info": "product_info"}),
+        ToolNode(compose_final_poster, "poster", {
+            "product_image": "product_image",
+            "background": "background",
+            "text_content": "text_content",
+            "layout": "layout",
+        }),
+    ],
+    inputs=["product_name", "style_description"],
+)
+
+# 采样生成(温度0.7)的结果不缓存；检查点仍记录生成的文案，继续运行时与中断前一致
+@memoize_tool(cache_results=False)
+def _generate_poster_copy(product_info: Dict[str, str]) -> Dict[str, str]:
+    """用模型为产品撰写海报文案，调用失败或输出不是JSON对象时抛出异常"""
+    messages = [
+        {"role": "system", "content": "你是电商海报文案撰写助手。只输出一个JSON对象，包含 title、features、price、slogan "
+                                      "四个字段：features 每行以 • 开头列出3-4个卖点，slogan 不超过12个字。"},
+        {"role": "user", "content": json.dumps(product_info, ensure_ascii=False)},
+    ]
+    with tracer.span("llm", "llm", model=use_model) as span:
+        start = time.perf_counter()
+        try:
+            response = client.chat(model=use_model, messages=messages, format="json", options={"temperature": 0.7})
+        except Exception as e:
+            span.set(error=str(e))
+            raise
+        usage = token_ledger.record_ollama(use_model, response, seconds=time.perf_counter() - start)
+        span.set(prompt_tokens=usage["prompt_tokens"], completion_tokens=usage["completion_tokens"])
+    # deepseek-r1 的回答前带有 <think> 推理部分
+    _, answer = ThinkStreamParser.split(response["message"]["content"])
+    copy = json.loads(answer)
+    if not isinstance(copy, dict):
+        raise ValueError(f"文案不是JSON对象: {answer[:100]}")
+    return copy
+
+def write_poster_copy(product_info: Dict[str, str]) -> Dict[str, str]:
+    """固定流程中唯一需要模型生成的步骤；生成失败时使用默认文案（默认文案不写入缓存或检查点），缺少的字段用默认值补全"""
+    default = generate_poster_text(product_info=product_info)
+    try:
+        copy = _generate_poster_copy(product_info=product_info)
+    except Exception as e:
+        logger.warning(f"模型生成文案失败，使用默认文案: {str(e)}")
+        return default
+    return {key: str(copy.get(key) or value) for key, value in default.items()}
+
+# 固定流程使用的工具图：与 poster_graph 相同，只是文案由模型生成
+compiled_poster_graph = ToolGraph(
+    [
+        node if node.output != "text_content" else ToolNode(write_poster_copy, "text_content",
+                                                             {"product_info": "product_info"})
+        for node in poster_graph.nodes
+    ],
+    inputs=poster_graph.inputs,
+)
+
+# 产品名称前后常见的修饰词，不属于产品名（如"一个关于咖啡的"中的"一个""关于""的"）
+_PRODUCT_NAME_NOISE = re.compile(r"^(?:一[个张幅份款]|关于|有关|针对)|(?:的|产品|电商|商品|展示|宣传|促销)+$")
+
+def _poster_inputs(groups: Dict[str, Optional[str]]) -> Optional[Dict[str, Any]]:
+    product_name = groups.get("product_name") or ""
+    while True:
+        cleaned = _PRODUCT_NAME_NOISE.sub("", product_name).strip()
+        if cleaned == product_name:
+            break
+        product_name = cleaned
+    if not product_name:
+        return None
+    return {"product_name": product_name, "style_description": groups.get("style_description")}
+
+# "制作一个保温杯产品电商商品展示海报"、"帮我做一张蓝牙耳机海报，背景从浅蓝渐变到深紫" 等请求直接走固定流程，
+# 省去智能体每一步选择工具的模型调用；其他请求仍交给智能体
+workflows = WorkflowRouter([
+    WorkflowTemplate(
+        "poster",
+        r"(?:请|帮我|给我)?(?:制作|做|生成|设计)(?P<product_name>[^，,。]+?)海报"
+        r"(?:[，,]\s*背景(?:风格)?(?:为|是|用)?(?P<style_description>[^。]+))?[。.!！]?",
+        compiled_poster_graph,
+        output="poster",
+        extract=_poster_inputs,
+    ),
+])
+
+@tool
+@tracer.traced("tool")
+def make_poster(product_name: str, style_description: Optional[str] = None) -> str:
+    """一次完成整张海报：获取产品描述、规划布局、获取产品图和背景图、生成文案并合成海报，互不依赖的步骤并行执行。
+
+    Args:
+        product_name: 产品名称。
+        style_description: 可选的背景风格描述，例如"从左上角的浅蓝色渐变到右下角的深紫色"；不提供时根据产品配色选择。
+
+    Returns:
+        str: 最终海报的说明。
+    """
+    context = ToolGraphExecutor(poster_graph).run({
+        "product_name": product_name,
+        "style_description": style_description,
+    })
+    return context["poster"]
+
 # 创建本地LLM模型实例  
 class OllamaModel(LiteLLMModel):  
-    def __init__(self):  
-        system_prompt = """你是一个智能海报制作助手。在制作海报时，你需要按照以下固定步骤来完成任务：
+    def __init__(self, use_cache: bool = os.getenv('POSTER_AGENT_LLM_CACHE', '0') == '1',
+                 temperature: Optional[float] = None):
+        """
+        Args:
+            use_cache: 温度不为0时也使用响应缓存
+            temperature: 采样温度，为 None 时使用模型服务的默认值；为0时自动使用响应缓存
+        """
+        system_prompt = """你是一个智能海报制作助手。制作完整海报时，直接调用一次 make_poster 工具，
+它会自动完成下列全部步骤，并把互不依赖的步骤并行执行：
 
 1. 首先获取商品的完整描述信息，使用 get_product_description 工具
 2. 根据商品信息规划海报布局，使用 plan_poster_layout 工具
@@ -157,82 +334,163 @@ class OllamaModel(LiteLLMModel):
 5. 生成海报文案文本，使用 generate_poster_text 工具
 6. 最后将所有视觉元素整合在一起，使用 compose_final_poster 工具
 
-请严格按照上述步骤顺序执行，每次只调用一个工具，并将上一步的结果用于下一步。
+只有在需要单独调整某一步的结果时，才单独调用对应的工具，并将上一步的结果用于下一步。
 当需要调用工具时，请使用以下格式：
 {"name": "工具名称", "arguments": {"参数名": "参数值"}}"""
 
         super().__init__(
             model_id=f"ollama/{use_model}",
+            # 与 Ollama 客户端使用同一服务地址，便于指向本地模拟服务做离线测试
+            api_base=os.getenv('OLLAMA_HOST', 'http://localhost:11434'),
             model_config={
                 "functions_supported": True,
                 "function_call_supported": True,
                 "system_prompt": system_prompt
-            }
+            },
+            **({"temperature": temperature} if temperature is not None else {}),
         )
         self.logger = LLMLogger()
+        self.token_ledger = token_ledger
+        # 单次模型调用失败时的重试次数（含第一次）
+        self.max_attempts = int(os.getenv('POSTER_AGENT_RETRIES', '3'))
+        # 工具前言按工具集缓存、已使用的工具输出压缩，控制每步的提示长度
+        self.prompt_assembler = AgentPromptAssembler()
+        # 温度为0或显式开启时，相同请求直接返回缓存的响应
+        self.use_cache = use_cache
+        self.response_cache = get_default_cache()
+
+    def generate(
+        self,
+        messages: List[Any],
+        stop_sequences: Optional[List[str]] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        """smolagents 1.x 的模型入口：智能体每一步直接调用 generate()，Model.__call__ 也转到这里"""
+        if response_format is not None:
+            kwargs["response_format"] = response_format
+        return self._step(super().generate, messages, stop_sequences, tools_to_call_from, **kwargs)
 
     def __call__(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Any],
         stop_sequences: Optional[List[str]] = None,
         grammar: Optional[str] = None,
         tools_to_call_from: Optional[List[Tool]] = None,
         **kwargs,
-    ) -> ChatMessage:  
+    ) -> ChatMessage:
+        """较早的 smolagents 没有 generate()，智能体调用 __call__，走同一套处理"""
+        if hasattr(LiteLLMModel, "generate"):
+            return self.generate(messages, stop_sequences=stop_sequences, tools_to_call_from=tools_to_call_from,
+                                 **kwargs)
+        if grammar is not None:
+            kwargs["grammar"] = grammar
+        return self._step(super().__call__, messages, stop_sequences, tools_to_call_from, **kwargs)
+
+    def _step(self, parent_call, messages, stop_sequences, tools_to_call_from, **kwargs) -> ChatMessage:
+        """智能体的一步：追踪、预算、提示组装、检查点、缓存、重试和日志，parent_call 是父类的模型调用"""
+        # 每次模型调用开始智能体的一个新步骤，步骤内随后的工具调用挂在该步骤之下
+        tracer.next_step()
+        self.token_ledger.next_step()
+        # 超出预算时抛出 BudgetExceeded，由运行入口结束本次运行
+        self.token_ledger.check()
+        with tracer.span("llm", "llm", model=self.model_id) as span:
+            return self._traced_call(span, parent_call, messages, stop_sequences, tools_to_call_from, **kwargs)
+
+    def _traced_call(self, span, parent_call, messages, stop_sequences, tools_to_call_from, **kwargs) -> ChatMessage:
         try:
+            # 工具说明前言放在最前面且内容固定，较早的工具输出压缩为摘要
+            messages = self.prompt_assembler.assemble(messages, tools_to_call_from)
+            span.set(estimated_prompt_tokens=self.prompt_assembler.step_tokens[-1])
+
             # 记录日志
             self.logger.log_messages(messages)
+            tools = [[t.name, t.description, t.inputs] for t in tools_to_call_from or []]
 
-            # 添加工具说明到每个对话中
-            if tools_to_call_from:
-                tools_description = "\n".join([
-                    f"- {tool.name}: {tool.description}" 
-                    for tool in tools_to_call_from
-                ])
-                
-                # 确保第一条消息是系统消息
-                if not messages or messages[0]["role"] != "system":
-                    messages = [
-                        {
-                            "role": "system",
-                            "content": f"""可用工具列表：
-                            {tools_description}
-                            
-                            请记住：
-                            1. 严格按照系统提示中的步骤顺序执行
-                            2. 每次只调用一个工具
-                            3. 将上一步的结果用于下一步
-                            4. 确保完成所有步骤"""
-                        }
-                    ] + messages
-
-            # 调用父类的 __call__ 方法
-            response = super().__call__(
-                messages=messages,
-                stop_sequences=stop_sequences,
-                grammar=grammar,
-                tools_to_call_from=tools_to_call_from,
-                **kwargs
-            )
-            
-            # 记录响应
-            if isinstance(response, dict):
-                self.logger.log_response(response)
+            # 从检查点继续的运行：输入与记录一致的步骤直接使用记录的回答
+            checkpoint = active_checkpoint()
+            step_key = None
+            if checkpoint is not None:
+                step_key = LLMResponseCache.make_key(self.model_id, messages, tools=tools)
+                recorded = checkpoint.replay_step(step_key)
+                if recorded is not None:
+                    response = ChatMessage.from_dict(recorded)
+                    span.set(resumed=True)
+                    self.logger.log_event("resumed_step", run_id=checkpoint.run_id, step=checkpoint.cursor)
+                    self.logger.log_response(response)
+                    return response
+
+            cache_key = None
+            # 智能体不会逐次传入温度，未传入时使用创建模型时配置的温度
+            temperature = kwargs.get("temperature", getattr(self, "kwargs", {}).get("temperature"))
+            if LLMResponseCache.should_cache(temperature, self.use_cache):
+                cache_key = LLMResponseCache.make_key(
+                    self.model_id,
+                    messages,
+                    tools=tools,
+                    temperature=temperature,
+                    options={"stop_sequences": stop_sequences, "grammar": kwargs.get("grammar"),
+                             "response_format": kwargs.get("response_format")},
+                )
+                cached = self.response_cache.get(cache_key)
+                self.response_cache.log_stats()
+                if cached is not None:
+                    response = ChatMessage.from_dict(cached)
+                    span.set(cached=True)
+                    self.logger.log_event("token_usage", **self.token_ledger.record(self.model_id, 0, 0, cached=True))
+                    self.logger.log_response(response)
+                    if checkpoint is not None:
+                        checkpoint.record_step(step_key, cached)
+                    return response
+
+            # 调用父类的模型方法，只对这一步的暂时性错误按指数退避重试
+            start = time.perf_counter()
+            try:
+                response = call_with_retry(
+                    lambda: parent_call(
+                        messages=messages,
+                        stop_sequences=stop_sequences,
+                        tools_to_call_from=tools_to_call_from,
+                        **kwargs
+                    ),
+                    attempts=self.max_attempts,
+                    retry_on=TRANSIENT_MODEL_ERRORS,
+                )
+            except TRANSIENT_MODEL_ERRORS as e:
+                # 不再返回固定的道歉回答：中止本次运行，已完成的步骤保存在检查点中，之后可以继续
+                raise StepFailed(f"模型调用重试 {self.max_attempts} 次后仍然失败: {str(e)}") from e
+            if checkpoint is not None:
+                checkpoint.record_step(step_key, response.dict())
+            if cache_key is not None:
+                self.response_cache.put(cache_key, response.dict(), self.model_id)
+            # LiteLLM 把 Ollama 的 prompt_eval_count / eval_count 换算为输入和输出 token 数，
+            # smolagents 1.x 放在回答的 token_usage 中，较早的版本记录在模型的 last_*_token_count 上
+            token_usage = getattr(response, 'token_usage', None)
+            if token_usage is not None:
+                input_tokens, output_tokens = token_usage.input_tokens, token_usage.output_tokens
             else:
-                self.logger.log_response({"content": str(response)})
+                input_tokens = getattr(self, 'last_input_token_count', None)
+                output_tokens = getattr(self, 'last_output_token_count', None)
+            usage = self.token_ledger.record(self.model_id, input_tokens, output_tokens,
+                                             seconds=time.perf_counter() - start)
+            span.set(prompt_tokens=usage["prompt_tokens"], completion_tokens=usage["completion_tokens"])
+            self.logger.log_event("token_usage", estimated_prompt_tokens=self.prompt_assembler.step_tokens[-1], **usage)
+            
+            # 记录响应（序列化在日志的写入线程中完成）
+            self.logger.log_response(response)
             
             return response
             
         except Exception as e:
+            span.set(error=str(e))
             self.logger.log_error(f"Error in model call: {str(e)}")
-            return ChatMessage(
-                role="assistant",
-                content="抱歉，处理过程中出现了错误。请重试或换个方式描述您的需求。"
-            )
+            raise
 
 # 初始化智能体时添加更多配置  
 agent = ToolCallingAgent(  
     tools=[
+        make_poster,
         get_product_description,
         plan_poster_layout,
         get_product_image,
@@ -247,17 +505,69 @@ agent = ToolCallingAgent(
 if __name__ == "__main__":  
     print("系统已启动，输入'exit'退出")
     default_query = "制作一个保温杯产品电商商品展示海报"
+    # 每次运行的检查点，失败或中断后输入 resume 从最后完成的步骤继续
+    checkpoints = CheckpointStore()
     
     while True:  
-        query = input("\n用户提问 (直接回车使用默认任务): ").strip()
+        query = input("\n用户提问 (直接回车使用默认任务，resume [运行ID] 继续未完成的运行): ").strip()
         
         if query.lower() == 'exit':  
             break
         
-        # 如果用户直接按回车，使用默认查询
-        if not query:
-            print(f"\n使用默认任务: {default_query}")
-            query = default_query
+        if query.lower().split()[:1] == ['resume']:
+            parts = query.split()
+            checkpoint = checkpoints.load(parts[1]) if len(parts) > 1 else checkpoints.latest_unfinished()
+            if checkpoint is None:
+                print("没有可以继续的运行")
+                continue
+            query = checkpoint.query
+            print(f"\n继续运行 {checkpoint.run_id}（已完成 {len(checkpoint.steps)} 步）: {query}")
+        else:
+            # 如果用户直接按回车，使用默认查询
+            if not query:
+                print(f"\n使用默认任务: {default_query}")
+                query = default_query
+            checkpoint = checkpoints.create(query)
           
-        response = agent.run(query)  
-        print(f"\nAI回复: {response}")  
\ No newline at end of file
+        agent.model.prompt_assembler.reset()
+        token_ledger.start_run()
+        tracer.clear()
+        resume_hint = f"输入 resume {checkpoint.run_id} 可以从最后完成的步骤继续"
+        with tracer.run(query=query, run_id=checkpoint.run_id):
+            try:
+                with activate(checkpoint):
+                    # 匹配固定流程的请求直接执行工具图，其余交给智能体
+                    response = workflows.run(query, fallback=agent.run)
+                checkpoint.finish(response)
+            except KeyboardInterrupt:
+                checkpoint.fail("interrupted", status="interrupted")
+                response = f"已中断，{resume_hint}"
+            except Exception as e:
+                exceeded = find_cause(e, BudgetExceeded)
+                failed = find_cause(e, StepFailed)
+                if exceeded is not None:
+                    checkpoint.fail(exceeded.reason, status="stopped")
+                    response = f"已达到本次运行的预算上限（{exceeded.reason}），已停止；{resume_hint}"
+                elif failed is not None:
+                    checkpoint.fail(failed)
+                    response = f"{failed}；已完成的 {len(checkpoint.steps)} 步已保存，{resume_hint}"
+                else:
+                    checkpoint.fail(e)
+                    raise
+            finally:
+                tracer.end_step()
+        print(f"\nAI回复: {response}")
+        if checkpoint.replayed_steps or checkpoint.replayed_tools:
+            print(f"从检查点恢复了 {checkpoint.replayed_steps} 次模型调用和 {checkpoint.replayed_tools} 次工具调用")
+        usage = token_ledger.summary()
+        agent.model.logger.log_event("run_usage", **usage)
+        totals = usage["totals"]
+        print(f"本次运行 {totals['steps']} 步，{totals['calls']} 次模型调用，"
+              f"prompt {totals['prompt_tokens']} + 生成 {totals['completion_tokens']} tokens，"
+              f"耗时 {totals['wall_seconds']:.1f}s")
+        log_tool_cache_stats()
+        if tracer.enabled:
+            trace_file = os.path.join(os.path.dirname(agent.model.logger.log_file),
+                                      f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+            tracer.write_chrome_trace(trace_file)
+            print(f"\n{tracer.format_summary()}\n追踪文件: {trace_file}")  
\ No newline at end of file
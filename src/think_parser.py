@@ -0,0 +1,114 @@
+import time
+from typing import Dict, Optional, Tuple
+
+from chat_session import estimate_tokens
+
+
+class ThinkStreamParser:
+    """增量拆分 deepseek-r1 输出中的 <think> 推理部分和最终回答
+
+    每次 feed() 只处理新到达的增量以及上次保留的至多 len("</think>")-1 个字符
+    (可能是被切断的标签)，不会重新扫描已累积的文本。同时分别统计推理和回答的
+    token数与生成速度。
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.in_reasoning = False
+        self._carry = ""
+        self._answer_started = False
+        self.reasoning_tokens = 0
+        self.answer_tokens = 0
+        self._reasoning_span = [None, None]  # [首次, 最后] 收到推理文本的时间
+        self._answer_span = [None, None]
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        """text 末尾与 tag 开头重合的最长长度，这部分可能是被切断的标签"""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def _emit(self, text: str, reasoning: bool, parts: list):
+        if not reasoning and not self._answer_started:
+            # 去掉 </think> 之后的空行
+            text = text.lstrip()
+            if not text:
+                return
+            self._answer_started = True
+        if not text:
+            return
+        now = time.monotonic()
+        span = self._reasoning_span if reasoning else self._answer_span
+        if span[0] is None:
+            span[0] = now
+        span[1] = now
+        if reasoning:
+            self.reasoning_tokens += estimate_tokens(text)
+        else:
+            self.answer_tokens += estimate_tokens(text)
+        parts[0 if reasoning else 1].append(text)
+
+    def feed(self, delta: str) -> Tuple[str, str]:
+        """处理一段增量，返回 (推理增量, 回答增量)"""
+        parts = ([], [])
+        text = self._carry + delta
+        self._carry = ""
+        while text:
+            tag = self.CLOSE_TAG if self.in_reasoning else self.OPEN_TAG
+            index = text.find(tag)
+            if index >= 0:
+                self._emit(text[:index], self.in_reasoning, parts)
+                text = text[index + len(tag):]
+                self.in_reasoning = not self.in_reasoning
+                continue
+            keep = self._partial_tag_length(text, tag)
+            if keep:
+                self._carry = text[-keep:]
+                text = text[:-keep]
+            self._emit(text, self.in_reasoning, parts)
+            break
+        return "".join(parts[0]), "".join(parts[1])
+
+    def finish(self) -> Tuple[str, str]:
+        """输出结束时写出保留的字符"""
+        parts = ([], [])
+        if self._carry:
+            self._emit(self._carry, self.in_reasoning, parts)
+            self._carry = ""
+        return "".join(parts[0]), "".join(parts[1])
+
+    @staticmethod
+    def _rate(tokens: int, span) -> float:
+        if span[0] is None or span[1] <= span[0]:
+            return 0.0
+        return round(tokens / (span[1] - span[0]), 1)
+
+    def stats(self, eval_tokens: Optional[int] = None) -> Dict[str, float]:
+        """推理和回答各自的token数与 tok/s
+
+        Args:
+            eval_tokens: 服务端统计的生成token总数，提供时按估算比例分配给两部分
+        """
+        reasoning, answer = self.reasoning_tokens, self.answer_tokens
+        estimated = reasoning + answer
+        if eval_tokens and estimated:
+            reasoning = round(eval_tokens * reasoning / estimated)
+            answer = eval_tokens - reasoning
+        return {
+            "reasoning_tokens": reasoning,
+            "reasoning_tokens_per_second": self._rate(reasoning, self._reasoning_span),
+            "answer_tokens": answer,
+            "answer_tokens_per_second": self._rate(answer, self._answer_span),
+        }
+
+    @classmethod
+    def split(cls, text: str) -> Tuple[str, str]:
+        """一次性拆分完整文本，返回 (推理, 回答)"""
+        parser = cls()
+        reasoning, answer = parser.feed(text)
+        tail_reasoning, tail_answer = parser.finish()
+        return reasoning + tail_reasoning, answer + tail_answer
@@ -0,0 +1,144 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 节点参数的来源：上游输出/初始输入的名称，或 (转换函数, [依赖的名称]) —— 转换函数接收当前上下文
+InputSource = Union[str, Tuple[Callable[[Dict[str, Any]], Any], Sequence[str]]]
+
+
+class ToolGraphError(RuntimeError):
+    """工具图定义错误或某个工具执行失败"""
+
+
+class ToolNode:
+    """工具图中的一个节点：声明工具的输入来自哪里、输出保存为什么名字"""
+
+    def __init__(self, tool: Callable[..., Any], output: str, inputs: Optional[Dict[str, InputSource]] = None):
+        """
+        Args:
+            tool: 工具函数或 smolagents Tool（按关键字参数调用）
+            output: 输出在上下文中的名称，下游节点通过该名称引用
+            inputs: {参数名: 来源}，来源为上下文中的名称或 (转换函数, [依赖名称])
+        """
+        self.tool = tool
+        self.output = output
+        self.inputs = inputs or {}
+        self.name = getattr(tool, 'name', None) or getattr(tool, '__name__', output)
+
+    @property
+    def dependencies(self) -> Set[str]:
+        deps: Set[str] = set()
+        for source in self.inputs.values():
+            if isinstance(source, str):
+                deps.add(source)
+            else:
+                deps.update(source[1])
+        return deps
+
+    def resolve_inputs(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = {}
+        for param, source in self.inputs.items():
+            kwargs[param] = context[source] if isinstance(source, str) else source[0](context)
+        return kwargs
+
+
+class ToolGraph:
+    """由工具节点组成的有向无环图
+
+    初始输入(inputs)由调用方提供，其余名称必须是某个节点的输出。
+    """
+
+    def __init__(self, nodes: Iterable[ToolNode], inputs: Iterable[str] = ()):
+        self.nodes: List[ToolNode] = list(nodes)
+        self.inputs = set(inputs)
+        self.by_output: Dict[str, ToolNode] = {}
+        for node in self.nodes:
+            if node.output in self.by_output or node.output in self.inputs:
+                raise ToolGraphError(f"输出名称重复: {node.output}")
+            self.by_output[node.output] = node
+        for node in self.nodes:
+            unknown = node.dependencies - self.inputs - set(self.by_output)
+            if unknown:
+                raise ToolGraphError(f"{node.name} 依赖未定义的输入: {sorted(unknown)}")
+        self.levels = self._levels()
+
+    def _levels(self) -> List[List[ToolNode]]:
+        """按依赖深度分层，同一层的节点互不依赖；存在环时报错"""
+        available = set(self.inputs)
+        remaining = list(self.nodes)
+        levels = []
+        while remaining:
+            ready = [node for node in remaining if node.dependencies <= available]
+            if not ready:
+                raise ToolGraphError(f"工具图存在循环依赖: {[node.name for node in remaining]}")
+            levels.append(ready)
+            available.update(node.output for node in ready)
+            remaining = [node for node in remaining if node not in ready]
+        return levels
+
+    @property
+    def critical_path_length(self) -> int:
+        """关键路径上的工具数，即并行执行时最少需要的串行步数"""
+        return len(self.levels)
+
+    def describe(self) -> str:
+        return " → ".join("[" + ", ".join(node.name for node in level) + "]" for level in self.levels)
+
+
+class ToolGraphExecutor:
+    """在线程池中执行工具图：依赖就绪的节点立即提交，互不依赖的工具并发运行"""
+
+    def __init__(self, graph: ToolGraph, max_workers: int = 4):
+        self.graph = graph
+        self.max_workers = max_workers
+        self.timings: Dict[str, Tuple[float, float]] = {}  # 节点名 -> (开始, 结束)，相对于run开始的秒数
+
+    def _run_node(self, node: ToolNode, kwargs: Dict[str, Any], origin: float) -> Any:
+        start = time.perf_counter()
+        try:
+            return node.tool(**kwargs)
+        finally:
+            self.timings[node.name] = (start - origin, time.perf_counter() - origin)
+
+    def run(self, initial: Dict[str, Any]) -> Dict[str, Any]:
+        """执行整个图，返回包含初始输入和所有输出的上下文"""
+        missing = self.graph.inputs - set(initial)
+        context = dict(initial)
+        # 未提供的可选初始输入以None占位，由转换函数决定如何处理
+        context.update({name: None for name in missing})
+        pending = list(self.graph.nodes)
+        self.timings = {}
+        origin = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tool') as pool:
+            running = {}
+
+            def submit_ready():
+                for node in [node for node in pending if node.dependencies <= set(context)]:
+                    pending.remove(node)
+                    # 复制上下文，工具内的追踪 span 挂在调用 run 的 span 之下
+                    future = pool.submit(contextvars.copy_context().run,
+                                         self._run_node, node, node.resolve_inputs(context), origin)
+                    running[future] = node
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    try:
+                        context[node.output] = future.result()
+                    except Exception as e:
+                        for other in running:
+                            other.cancel()
+                        raise ToolGraphError(f"工具 {node.name} 执行失败: {e}") from e
+                submit_ready()
+
+        elapsed = time.perf_counter() - origin
+        logger.info(f"工具图执行完成，耗时 {elapsed:.2f}s，关键路径 {self.graph.critical_path_length} 步："
+                    f"{self.graph.describe()}")
+        return context
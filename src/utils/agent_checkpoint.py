@@ -0,0 +1,238 @@
+import os
+import re
+import copy
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+class StepFailed(RuntimeError):
+    """某一步的模型调用重试后仍然失败，运行中止，可以从检查点继续"""
+
+
+def find_cause(error: BaseException, error_type: Type[BaseException]) -> Optional[BaseException]:
+    """在异常链中查找指定类型的异常（smolagents 会把模型调用中的异常包装一层再抛出）"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, error_type):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def call_with_retry(func: Callable[[], Any], attempts: int = 3, base_delay: float = 1.0, max_delay: float = 10.0,
+                    retry_on: Tuple[Type[BaseException], ...] = (ConnectionError, TimeoutError),
+                    no_retry: Tuple[Type[BaseException], ...] = ()) -> Any:
+    """调用 func，遇到 retry_on 中的暂时性错误时按指数退避（带随机抖动）重试
+
+    其他异常立即抛出，不做重试；重试次数用完后最后一次的异常原样抛出。
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except no_retry:
+            raise
+        except retry_on as e:
+            if attempt == attempts:
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            logger.warning(f"第 {attempt} 次调用失败: {str(e)}，{delay:.1f}s 后重试")
+            time.sleep(delay)
+
+
+class RunCheckpoint:
+    """一次智能体运行的检查点：每一步的模型回答和工具输出
+
+    继续运行时，智能体从头执行同一任务：输入与记录一致的步骤直接返回记录的回答，
+    工具调用直接返回记录的输出，到第一个没有记录（或输入不一致）的步骤才真正调用模型。
+    每次记录后立即写入文件，进程被中断时已完成的步骤不会丢失。
+    """
+
+    def __init__(self, path: str, run_id: str, query: str, data: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.run_id = run_id
+        self.query = query
+        data = data or {}
+        self.status = data.get("status", "running")
+        self.steps: List[Dict[str, Any]] = data.get("steps", [])
+        self.tool_outputs: Dict[str, Any] = data.get("tool_outputs", {})
+        self.result = data.get("result")
+        self.error = data.get("error")
+        self.created = data.get("created", time.time())
+        self.cursor = 0  # 本次执行中已经过的步骤数
+        self.replayed_steps = 0
+        self.replayed_tools = 0
+        self._lock = threading.Lock()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "query": self.query,
+            "status": self.status,
+            "steps": self.steps,
+            "tool_outputs": self.tool_outputs,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "updated": time.time(),
+        }
+
+    def save(self):
+        with self._lock:
+            data = self.to_dict()
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, default=str)
+            # 先写临时文件再替换，写入过程中被中断也不会破坏已有的检查点
+            os.replace(tmp_path, self.path)
+
+    def replay_step(self, key: str) -> Optional[Dict[str, Any]]:
+        """输入与记录一致时返回该步记录的回答；不一致时丢弃该步及之后的记录"""
+        with self._lock:
+            if self.cursor < len(self.steps):
+                step = self.steps[self.cursor]
+                if step["key"] == key:
+                    self.cursor += 1
+                    self.replayed_steps += 1
+                    return copy.deepcopy(step["response"])
+                logger.info(f"运行 {self.run_id} 的第 {self.cursor + 1} 步输入与检查点不一致，从这一步重新执行")
+                del self.steps[self.cursor:]
+        return None
+
+    def record_step(self, key: str, response: Dict[str, Any]):
+        with self._lock:
+            del self.steps[self.cursor:]
+            self.steps.append({"key": key, "response": response, "time": time.time()})
+            self.cursor += 1
+        self.save()
+
+    def tool_output(self, key: str, default: Any = None) -> Any:
+        """记录的工具输出，没有记录时返回 default"""
+        with self._lock:
+            if key not in self.tool_outputs:
+                return default
+            self.replayed_tools += 1
+            return copy.deepcopy(self.tool_outputs[key])
+
+    def record_tool(self, key: str, value: Any):
+        try:
+            json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            logger.warning(f"工具输出无法序列化，不写入检查点: {key}")
+            return
+        with self._lock:
+            self.tool_outputs[key] = copy.deepcopy(value)
+        self.save()
+
+    def finish(self, result: Any):
+        self.status = "done"
+        self.result = str(result)
+        self.error = None
+        self.save()
+
+    def fail(self, error: Any, status: str = "failed"):
+        self.status = status
+        self.error = str(error)
+        self.save()
+
+
+class CheckpointStore:
+    """按运行ID保存检查点，默认位于 cache/runs/<运行ID>.json"""
+
+    # create 生成的运行ID格式：<日期>_<时间>_<6位十六进制>
+    RUN_ID_PATTERN = re.compile(r"\d{8}_\d{6}_[0-9a-f]{6}")
+
+    def __init__(self, root: Optional[str] = None, max_runs: int = 200):
+        if root is None:
+            root = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                                                'cache', 'runs'))
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_runs = max_runs
+
+    @classmethod
+    def is_valid_run_id(cls, run_id: Any) -> bool:
+        return isinstance(run_id, str) and cls.RUN_ID_PATTERN.fullmatch(run_id) is not None
+
+    def _path(self, run_id: str) -> str:
+        # 运行ID来自用户输入，只接受生成的格式，避免 ../ 等路径读写目录外的文件
+        if not self.is_valid_run_id(run_id):
+            raise ValueError(f"无效的运行ID: {run_id!r}")
+        return os.path.join(self.root, f"{run_id}.json")
+
+    def create(self, query: str) -> RunCheckpoint:
+        self._prune()
+        run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{random.getrandbits(24):06x}"
+        checkpoint = RunCheckpoint(self._path(run_id), run_id, query)
+        checkpoint.save()
+        return checkpoint
+
+    def load(self, run_id: str) -> Optional[RunCheckpoint]:
+        """读取运行的检查点，运行ID无效或不存在时返回None"""
+        if not self.is_valid_run_id(run_id):
+            return None
+        path = self._path(run_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return RunCheckpoint(path, data["run_id"], data["query"], data)
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """所有运行的概况，按更新时间从新到旧"""
+        runs = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.root, name), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not self.is_valid_run_id(data.get("run_id")):
+                continue
+            runs.append({"run_id": data["run_id"], "query": data["query"], "status": data["status"],
+                         "steps": len(data["steps"]), "updated": data.get("updated", 0)})
+        return sorted(runs, key=lambda run: run["updated"], reverse=True)
+
+    def latest_unfinished(self) -> Optional[RunCheckpoint]:
+        for run in self.runs():
+            if run["status"] != "done":
+                return self.load(run["run_id"])
+        return None
+
+    def _prune(self):
+        for run in self.runs()[self.max_runs:]:
+            try:
+                os.remove(self._path(run["run_id"]))
+            except OSError:
+                pass
+
+
+_active_checkpoint: "contextvars.ContextVar[Optional[RunCheckpoint]]" = contextvars.ContextVar(
+    'active_checkpoint', default=None)
+
+
+def active_checkpoint() -> Optional[RunCheckpoint]:
+    """当前正在执行的运行的检查点，工具图的线程池通过复制上下文继承"""
+    return _active_checkpoint.get()
+
+
+@contextmanager
+def activate(checkpoint: RunCheckpoint):
+    """在 with 块内把 checkpoint 设为当前检查点，并从第一步开始匹配记录"""
+    checkpoint.cursor = 0
+    token = _active_checkpoint.set(checkpoint)
+    try:
+        yield checkpoint
+    finally:
+        _active_checkpoint.reset(token)
@@ -0,0 +1,108 @@
+"""把 LLMLogger 写出的 JSONL 日志格式化为易读的文本
+
+用法示例（在 src 目录下）：
+    python -m utils.llm_log_viewer ../log/llm_log_20250101_120000.jsonl
+    python -m utils.llm_log_viewer ../log/llm_log_20250101_120000.jsonl --conversation 3
+    python -m utils.llm_log_viewer ../log/llm_log_20250101_120000.jsonl --type response error
+
+已切分(包括压缩)的分段会按顺序一起读取。日志中的输入消息只保存了每步新增的部分，
+查看时还原为每一步完整的消息列表；--conversation 指定第几次调用即可查看该步完整的输入，
+--raw 显示文件中实际保存的增量记录。
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+
+from utils.llm_logger import expand_records, read_records
+
+
+def _format_json(obj: Any) -> str:
+    """格式化 JSON 对象为易读的字符串"""
+    if isinstance(obj, str):
+        try:
+            # 尝试解析JSON字符串
+            obj = json.loads(obj)
+        except json.JSONDecodeError:
+            return obj
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+def _format_content(content: Any) -> str:
+    if isinstance(content, list):
+        return "\n".join(_format_json(item) for item in content)
+    if isinstance(content, dict):
+        return _format_json(content)
+    return str(content)
+
+
+def format_record(record: Dict[str, Any]) -> List[str]:
+    """一条记录对应的文本行"""
+    record_type = record.get("type")
+    data = record.get("data")
+    if record_type == "init":
+        return ["=== LLM Logger Initialized ==="]
+    if record_type == "conversation_start":
+        return ["==================================================",
+                f"Conversation #{record.get('conv')} Started"]
+    if record_type == "messages":
+        lines = ["=== LLM Input Messages ==="]
+        if record.get("incomplete"):
+            lines.append("(前面的日志分段已删除，以下消息不完整)")
+        for message in data or []:
+            lines.append(f"Role: {message.get('role')}")
+            lines.append(f"Content:\n{_format_content(message.get('content'))}")
+            if message.get('tool_calls'):
+                lines.append(f"Tool Calls:\n{_format_json(message['tool_calls'])}")
+            if 'tool_call_id' in message:
+                lines.append(f"Tool Call ID: {message['tool_call_id']}")
+        return lines
+    if record_type == "tools":
+        return ["=== Available Tools ==="] + [_format_json(tool) for tool in data or []]
+    if record_type == "response":
+        return ["=== LLM Response ===", _format_json(data)]
+    if record_type == "error":
+        lines = ["=== Error in LLM Call ==="]
+        if data.get("type"):
+            lines.append(f"Error Type: {data['type']}")
+        lines.append(f"Error Message: {data.get('message')}")
+        return lines
+    if record_type == "event":
+        data = dict(data)
+        name = data.pop("name", "")
+        return [f"[{name}] " + json.dumps(data, ensure_ascii=False)]
+    return [f"[{record_type}] " + json.dumps(data, ensure_ascii=False)]
+
+
+def render(records: Iterable[Dict[str, Any]], out: TextIO, conversation: Optional[int] = None,
+           types: Optional[List[str]] = None):
+    for record in records:
+        if conversation is not None and record.get("conv") != conversation:
+            continue
+        if types and record.get("type") not in types:
+            continue
+        timestamp = datetime.fromtimestamp(record.get("ts", 0)).strftime('%Y-%m-%d %H:%M:%S,%f')[:-3]
+        for line in format_record(record):
+            out.write(f"{timestamp} - {line}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="格式化查看 LLM 调用日志")
+    parser.add_argument('path', help="日志文件(.jsonl 或切分出的 .jsonl.gz)")
+    parser.add_argument('--conversation', type=int, help="只显示指定编号的会话")
+    parser.add_argument('--type', nargs='+', dest='types', help="只显示指定类型的记录，如 messages response error")
+    parser.add_argument('--raw', action='store_true', help="不还原增量记录，按文件内容显示")
+    args = parser.parse_args()
+    records = read_records(args.path)
+    if not args.raw:
+        records = expand_records(records)
+    try:
+        render(records, sys.stdout, args.conversation, args.types)
+    except BrokenPipeError:
+        # 输出到 head/less 等被提前关闭时安静退出
+        pass
+
+
+if __name__ == '__main__':
+    main()
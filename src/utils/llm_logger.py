@@ -1,130 +1,325 @@
 import os
 import json
+import gzip
+import glob
+import hashlib
+import queue
+import atexit
+import shutil
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+_STOP = object()
+
+
+def to_jsonable(obj: Any) -> Any:
+    """把 ChatMessage 等对象转换为可序列化的结构（在写入线程中调用）"""
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    if isinstance(obj, dict):
+        return {str(k): to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v) for v in obj]
+    if hasattr(obj, 'content') and hasattr(obj, 'role'):
+        # 处理 ChatMessage 对象
+        # smolagents 的角色是 MessageRole 枚举，取其值（str() 会得到 "MessageRole.USER"）
+        role = getattr(obj, 'role', 'assistant')
+        message = {'role': str(getattr(role, 'value', role)), 'content': to_jsonable(obj.content)}
+        tool_calls = getattr(obj, 'tool_calls', None)
+        if tool_calls:
+            message['tool_calls'] = to_jsonable(tool_calls)
+        return message
+    for method in ('dict', 'model_dump'):
+        if hasattr(obj, method):
+            try:
+                return to_jsonable(getattr(obj, method)())
+            except Exception:
+                break
+    return str(obj)
+
+
+def log_segments(path: str) -> List[str]:
+    """日志文件的所有分段：按序号排列的已切分文件，最后是当前文件"""
+    base = path[:-len('.gz')] if path.endswith('.gz') else path
+    base = base[:-len('.jsonl')] if base.endswith('.jsonl') else base
+    # 传入的是某个切分出的分段时，找到原始文件名
+    stem, _, number = base.rpartition('.')
+    if stem and number.isdigit():
+        base = stem
+    segments = sorted(glob.glob(base + '.[0-9][0-9][0-9][0-9][0-9][0-9].jsonl*'))
+    if os.path.exists(base + '.jsonl'):
+        segments.append(base + '.jsonl')
+    return segments
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """按写入顺序读取日志记录（包括已切分和压缩的分段）"""
+    for segment in log_segments(path):
+        opener = gzip.open if segment.endswith('.gz') else open
+        with opener(segment, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:20]
+
+
+class MessageDeltaEncoder:
+    """把每次调用的完整消息列表编码为增量记录，在写入线程中使用
+
+    - 同一次运行（系统提示和第一条用户任务相同）的连续调用只写出与上一次相比新增的消息：
+      {"type": "messages_delta", "data": {"thread", "base", "append"}}，
+      完整列表 = 上一次的前 base 条 + append；
+    - 超过 blob_min_chars 的内容（工具说明、系统提示、较长的工具输出）按内容哈希只写一次
+      {"type": "blob", "data": {"hash", "value"}}，之后以 {"$blob": 哈希} 引用。
+
+    日志切分时调用 reset()，每个分段都能独立还原。
+    """
+
+    BLOB_MIN_CHARS = 1024
+    MAX_THREADS = 64
+
+    def __init__(self, blob_min_chars: int = BLOB_MIN_CHARS):
+        self.blob_min_chars = blob_min_chars
+        self.reset()
+
+    def reset(self):
+        self._threads: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._blobs = set()
+
+    def _blob(self, value: Any, record: Dict[str, Any], out: List[Dict[str, Any]]) -> Any:
+        text = _dumps(value)
+        if len(text) < self.blob_min_chars:
+            return value
+        key = _digest(text)
+        if key not in self._blobs:
+            self._blobs.add(key)
+            out.append({"ts": record.get("ts"), "conv": record.get("conv"), "type": "blob",
+                        "data": {"hash": key, "value": value}})
+        return {"$blob": key}
+
+    def encode(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        record_type = record.get("type")
+        out: List[Dict[str, Any]] = []
+        if record_type == "tools":
+            out.append(dict(record, data=self._blob(record["data"], record, out)))
+            return out
+        if record_type != "messages":
+            return [record]
+
+        messages = record["data"]
+        fingerprints = [_digest(_dumps(message)) for message in messages]
+        # 会话身份：直到第一条用户消息（含）为止的内容
+        head_end = next((i for i, m in enumerate(messages) if isinstance(m, dict) and m.get("role") == "user"),
+                        len(messages) - 1) + 1
+        thread = _digest("".join(fingerprints[:head_end]))
+        previous = self._threads.pop(thread, [])
+        base = 0
+        for old, new in zip(previous, fingerprints):
+            if old != new:
+                break
+            base += 1
+        self._threads[thread] = fingerprints
+        while len(self._threads) > self.MAX_THREADS:
+            self._threads.popitem(last=False)
+
+        append = []
+        for message in messages[base:]:
+            if isinstance(message, dict) and "content" in message:
+                message = dict(message, content=self._blob(message["content"], record, out))
+            append.append(message)
+        out.append({"ts": record.get("ts"), "conv": record.get("conv"), "type": "messages_delta",
+                    "data": {"thread": thread, "base": base, "append": append}})
+        return out
+
+
+def _resolve(value: Any, blobs: Dict[str, Any]) -> Any:
+    if isinstance(value, dict) and len(value) == 1 and "$blob" in value:
+        return blobs.get(value["$blob"], value)
+    return value
+
+
+def expand_records(records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """把增量和去重的记录还原为每一步完整的消息列表（type=messages）"""
+    blobs: Dict[str, Any] = {}
+    threads: Dict[str, List[Any]] = {}
+    for record in records:
+        record_type = record.get("type")
+        data = record.get("data")
+        if record_type == "blob":
+            blobs[data["hash"]] = data["value"]
+        elif record_type == "messages_delta":
+            previous = threads.get(data["thread"], [])
+            appended = [dict(m, content=_resolve(m["content"], blobs)) if isinstance(m, dict) and "content" in m else m
+                        for m in data["append"]]
+            messages = previous[:data["base"]] + appended
+            threads[data["thread"]] = messages
+            expanded = dict(record, type="messages", data=messages)
+            if len(previous) < data["base"]:
+                # 前面的分段已被删除，无法完整还原
+                expanded["incomplete"] = True
+            yield expanded
+        elif record_type == "tools":
+            yield dict(record, data=_resolve(data, blobs))
+        else:
+            yield record
+
+
+class JsonlLogWriter(threading.Thread):
+    """后台写入线程：从队列取出原始记录，序列化为紧凑的JSONL
+
+    文件超过 max_bytes 时切分，切分出的文件按序号命名为 <名称>.000001.jsonl，
+    compress=True 时在写入线程中压缩为 .gz，最多保留 backup_count 个。
+    消息列表经 MessageDeltaEncoder 编码为增量记录后写入。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 2**20, backup_count: int = 10, compress: bool = True):
+        super().__init__(name='llm-log-writer', daemon=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._segment = 0
+        self.encoder = MessageDeltaEncoder()
+        self.records = 0
+        self.start()
+
+    def submit(self, record: Dict[str, Any]):
+        self.queue.put(record)
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                break
+            self._write(record)
+            if self.queue.empty():
+                self._file.flush()
+        self._file.flush()
+        self._file.close()
+
+    def _write(self, record: Dict[str, Any]):
+        try:
+            lines = [json.dumps(encoded, ensure_ascii=False, separators=(',', ':'))
+                     for encoded in self.encoder.encode(to_jsonable(record))]
+        except Exception as e:
+            lines = [json.dumps({"ts": record.get("ts"), "type": "log_error", "data": str(e)}, ensure_ascii=False)]
+        for line in lines:
+            self._file.write(line + '\n')
+        self.records += 1
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._segment += 1
+        base = self.path[:-len('.jsonl')]
+        rotated = f"{base}.{self._segment:06d}.jsonl"
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        rotated_segments = [path for path in log_segments(self.path) if path != self.path]
+        for old in rotated_segments[:max(0, len(rotated_segments) - self.backup_count)]:
+            os.remove(old)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        # 新分段不引用之前分段中的内容
+        self.encoder.reset()
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中剩余的记录后停止线程"""
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join(timeout)
+
 
 class LLMLogger:
-    def __init__(self):
-        # 创建上两级目录下的log文件夹
-        self.log_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'log'))
+    """LLM调用日志
+
+    调用方线程只把原始对象放入队列（不做格式化和IO），由后台线程序列化为
+    log/llm_log_<时间>.jsonl，每行一条 {"ts", "conv", "type", "data"} 记录。
+    输入消息只写出新增部分，较长的重复内容只写一次，读取时用 expand_records 还原。
+    需要阅读时使用 `python -m utils.llm_log_viewer <文件>` 格式化输出。
+    """
+
+    def __init__(self, max_bytes: int = 50 * 2**20, backup_count: int = 10, compress: bool = True,
+                 log_dir: Optional[str] = None):
+        """
+        Args:
+            log_dir: 日志目录，默认为上两级目录下的log文件夹
+        """
+        if log_dir is None:
+            log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'log')
+        self.log_dir = os.path.abspath(log_dir)
         os.makedirs(self.log_dir, exist_ok=True)
-        
+
         # 创建新的日志文件，使用时间戳命名
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        log_file = os.path.join(self.log_dir, f'llm_log_{timestamp}.log')
-        
-        # 配置日志记录器
-        self.logger = logging.getLogger('LLMLogger')
-        self.logger.setLevel(logging.DEBUG)
-        
-        # 清除已有的处理器
-        self.logger.handlers = []
-        
-        # 创建文件处理器
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
-        
-        # 设置日志格式 - 移除日志级别，保持更简洁的输出
-        formatter = logging.Formatter('%(asctime)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        
-        # 添加处理器到记录器
-        self.logger.addHandler(file_handler)
-        
-        self.logger.info("=== LLM Logger Initialized ===")
+        self.log_file = os.path.join(self.log_dir, f'llm_log_{timestamp}.jsonl')
+        # 同一秒内创建多个日志时加序号，避免写入同一个文件
+        index = 1
+        while os.path.exists(self.log_file):
+            self.log_file = os.path.join(self.log_dir, f'llm_log_{timestamp}_{index}.jsonl')
+            index += 1
+        self.writer = JsonlLogWriter(self.log_file, max_bytes=max_bytes, backup_count=backup_count,
+                                     compress=compress)
+        atexit.register(self.close)
+
         self.conversation_counter = 0
+        self._emit("init", None)
 
-    def _format_json(self, obj: Any) -> str:
-        """格式化 JSON 对象为易读的字符串"""
-        try:
-            if isinstance(obj, str):
-                try:
-                    # 尝试解析JSON字符串
-                    obj = json.loads(obj)
-                except json.JSONDecodeError:
-                    # 如果不是JSON字符串，直接返回
-                    return obj
-            return json.dumps(obj, indent=2, ensure_ascii=False)
-        except Exception:
-            return str(obj)
-
-    def _format_content(self, content: Any) -> str:
-        """格式化消息内容"""
-        if isinstance(content, list):
-            return "\n".join(self._format_json(item) for item in content)
-        elif isinstance(content, dict):
-            return self._format_json(content)
-        else:
-            return str(content)
+    def _emit(self, record_type: str, data: Any):
+        self.writer.submit({"ts": time.time(), "conv": self.conversation_counter, "type": record_type, "data": data})
 
     def log_conversation_start(self) -> None:
         """记录新会话的开始"""
         self.conversation_counter += 1
-        self.logger.info("==================================================")
-        self.logger.info(f"Conversation #{self.conversation_counter} Started")
-        # self.logger.info("\n==================================================")
+        self._emit("conversation_start", None)
 
     def log_messages(self, messages: List[Dict[str, str]]) -> None:
         """记录输入消息"""
         self.log_conversation_start()
-        self.logger.info("=== LLM Input Messages ===")
-        for msg in messages:
-            self.logger.info(f"Role: {msg.get('role')}")
-            content = msg.get('content')
-            self.logger.info(f"Content:\n{self._format_content(content)}")
-            
-            if 'tool_calls' in msg and msg['tool_calls']:
-                self.logger.info(f"Tool Calls:\n{self._format_json(msg['tool_calls'])}")
-            if 'tool_call_id' in msg:
-                self.logger.info(f"Tool Call ID: {msg['tool_call_id']}")
-            # self.logger.info("---")
-    
+        # 只复制列表本身，消息内容的序列化在写入线程中完成
+        self._emit("messages", list(messages))
+
     def log_tools(self, tools: Optional[List[Any]]) -> None:
         """记录可用工具信息"""
         if not tools:
             return
-        
-        self.logger.info("=== Available Tools ===")
-        for tool in tools:
-            try:
-                tool_info = {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "inputs": tool.inputs
-                }
-                self.logger.info(self._format_json(tool_info))
-            except AttributeError:
-                self.logger.info(str(tool))
-        # self.logger.info("---")
-    
+        self._emit("tools", [
+            {"name": getattr(tool, 'name', str(tool)), "description": getattr(tool, 'description', None),
+             "inputs": getattr(tool, 'inputs', None)}
+            for tool in tools
+        ])
+
     def log_response(self, response: Any) -> None:
         """记录LLM响应"""
-        self.logger.info("=== LLM Response ===")
-        
-        # 尝试提取和格式化响应信息
-        try:
-            if hasattr(response, 'content'):
-                # 处理 ChatMessage 对象
-                content = {
-                    'role': getattr(response, 'role', 'assistant'),
-                    'content': response.content
-                }
-                if hasattr(response, 'tool_calls') and response.tool_calls:
-                    content['tool_calls'] = response.tool_calls
-                self.logger.info(self._format_json(content))
-            else:
-                # 处理其他类型的响应
-                self.logger.info(self._format_json(response))
-        except Exception as e:
-            self.logger.warning(f"Failed to format response: {str(e)}")
-            self.logger.info(f"Raw response: {str(response)}")
-        
-        # self.logger.info("---")
-    
-    def log_error(self, error: Exception) -> None:
-        """记录错误信息"""
-        self.logger.error("\n=== Error in LLM Call ===")
-        self.logger.error(f"Error Type: {type(error).__name__}")
-        self.logger.error(f"Error Message: {str(error)}")
-        self.logger.error("---\n") 
\ No newline at end of file
+        self._emit("response", response)
+
+    def log_event(self, name: str, **data: Any) -> None:
+        """记录其他结构化信息，如token数、耗时"""
+        self._emit("event", dict(data, name=name))
+
+    def log_error(self, error: Any) -> None:
+        """记录错误信息，可以是异常对象或说明文字"""
+        if isinstance(error, BaseException):
+            self._emit("error", {"type": type(error).__name__, "message": str(error)})
+        else:
+            self._emit("error", {"message": str(error)})
+
+    def close(self) -> None:
+        """等待后台线程写完剩余记录"""
+        self.writer.close()
@@ -0,0 +1,176 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+
+def usage_from_ollama(raw: Any) -> Dict[str, Any]:
+    """从 Ollama 响应（流式输出的最后一块）中取出 token 数和耗时，时间从纳秒换算为秒"""
+    def get(key):
+        try:
+            return raw.get(key) if hasattr(raw, 'get') else getattr(raw, key, None)
+        except Exception:
+            return None
+
+    def seconds(key):
+        value = get(key)
+        return value / 1e9 if value else None
+
+    return {
+        "prompt_tokens": get('prompt_eval_count') or 0,
+        "completion_tokens": get('eval_count') or 0,
+        "prompt_seconds": seconds('prompt_eval_duration'),
+        "eval_seconds": seconds('eval_duration'),
+        "load_seconds": seconds('load_duration'),
+        "total_seconds": seconds('total_duration'),
+    }
+
+
+class BudgetExceeded(RuntimeError):
+    """运行超出 token、时间或步数预算"""
+
+    def __init__(self, reason: str, totals: Optional[Dict[str, Any]] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.totals = totals or {}
+
+
+class RunBudget:
+    """一次运行的预算，None 表示不限制"""
+
+    def __init__(self, max_tokens: Optional[int] = None, max_seconds: Optional[float] = None,
+                 max_steps: Optional[int] = None):
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.max_steps = max_steps
+
+    @classmethod
+    def from_env(cls, prefix: str = 'POSTER_AGENT_') -> "RunBudget":
+        """从环境变量读取预算：<prefix>MAX_TOKENS、<prefix>MAX_SECONDS、<prefix>MAX_STEPS"""
+        def read(name, convert):
+            value = os.getenv(prefix + name)
+            return convert(value) if value else None
+
+        return cls(read('MAX_TOKENS', int), read('MAX_SECONDS', float), read('MAX_STEPS', int))
+
+    def __repr__(self):
+        return f"RunBudget(max_tokens={self.max_tokens}, max_seconds={self.max_seconds}, max_steps={self.max_steps})"
+
+
+class TokenLedger:
+    """模型调用的 token 账本：记录每次调用，按步骤、模型和整次运行汇总，并检查预算
+
+    每次模型调用前调用 next_step() 进入新步骤，调用结束后 record() 记录用量；
+    check() 在超出预算时抛出 BudgetExceeded。
+    """
+
+    def __init__(self, budget: Optional[RunBudget] = None):
+        self.budget = budget or RunBudget()
+        self._lock = threading.Lock()
+        self.start_run()
+
+    def start_run(self):
+        """开始新的一次运行，清空记录"""
+        with self._lock:
+            self.calls: List[Dict[str, Any]] = []
+            self.step = 0
+            self.started = time.monotonic()
+
+    def next_step(self) -> int:
+        with self._lock:
+            self.step += 1
+            return self.step
+
+    def record(self, model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int],
+               seconds: Optional[float] = None, eval_seconds: Optional[float] = None,
+               prompt_seconds: Optional[float] = None, cached: bool = False) -> Dict[str, Any]:
+        """记录一次模型调用，返回这次调用的统计
+
+        Args:
+            seconds: 调用的总耗时
+            eval_seconds: 生成阶段的耗时（Ollama 的 eval_duration），没有时按总耗时计算生成速度
+            prompt_seconds: 处理提示的耗时（Ollama 的 prompt_eval_duration）
+            cached: 是否来自缓存，缓存命中的 token 不计入预算
+        """
+        prompt_tokens = prompt_tokens or 0
+        completion_tokens = completion_tokens or 0
+        generate_seconds = eval_seconds or seconds
+        entry = {
+            "step": self.step,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "seconds": round(seconds, 3) if seconds else None,
+            "tokens_per_second": round(completion_tokens / generate_seconds, 1) if generate_seconds else None,
+            "prompt_tokens_per_second": round(prompt_tokens / prompt_seconds, 1) if prompt_seconds else None,
+            "cached": cached,
+        }
+        with self._lock:
+            self.calls.append(entry)
+        return entry
+
+    def record_ollama(self, model: str, raw: Any, seconds: Optional[float] = None) -> Dict[str, Any]:
+        """按 Ollama 响应中的计数和耗时记录"""
+        usage = usage_from_ollama(raw)
+        return self.record(model, usage["prompt_tokens"], usage["completion_tokens"],
+                           seconds=seconds or usage["total_seconds"], eval_seconds=usage["eval_seconds"],
+                           prompt_seconds=usage["prompt_seconds"])
+
+    @staticmethod
+    def _aggregate(calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+        billable = [c for c in calls if not c["cached"]]
+        prompt = sum(c["prompt_tokens"] for c in billable)
+        completion = sum(c["completion_tokens"] for c in billable)
+        seconds = sum(c["seconds"] or 0 for c in calls)
+        return {
+            "calls": len(calls),
+            "cached_calls": len(calls) - len(billable),
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+            "llm_seconds": round(seconds, 3),
+        }
+
+    def totals(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.calls)
+            steps = self.step
+        totals = self._aggregate(calls)
+        totals.update(steps=steps, wall_seconds=round(time.monotonic() - self.started, 3))
+        return totals
+
+    def by_step(self) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            calls = list(self.calls)
+        steps: Dict[int, List[Dict[str, Any]]] = {}
+        for call in calls:
+            steps.setdefault(call["step"], []).append(call)
+        return {step: self._aggregate(step_calls) for step, step_calls in steps.items()}
+
+    def by_model(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            calls = list(self.calls)
+        models: Dict[str, List[Dict[str, Any]]] = {}
+        for call in calls:
+            models.setdefault(call["model"], []).append(call)
+        return {model: self._aggregate(model_calls) for model, model_calls in models.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        return {"totals": self.totals(), "by_model": self.by_model(), "by_step": self.by_step()}
+
+    def exceeded(self) -> Optional[str]:
+        """超出预算时返回原因"""
+        budget = self.budget
+        totals = self.totals()
+        if budget.max_tokens is not None and totals["total_tokens"] >= budget.max_tokens:
+            return f"token 用量 {totals['total_tokens']} 达到上限 {budget.max_tokens}"
+        if budget.max_seconds is not None and totals["wall_seconds"] >= budget.max_seconds:
+            return f"运行时间 {totals['wall_seconds']:.1f}s 达到上限 {budget.max_seconds}s"
+        if budget.max_steps is not None and totals["steps"] > budget.max_steps:
+            return f"步数超过上限 {budget.max_steps}"
+        return None
+
+    def check(self):
+        reason = self.exceeded()
+        if reason is not None:
+            raise BudgetExceeded(reason, self.totals())
@@ -0,0 +1,205 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.llm_cache import LLMResponseCache
+from utils.tracing import tracer
+from utils.agent_checkpoint import active_checkpoint
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def canonical_arguments(func: Callable, args: tuple, kwargs: dict) -> str:
+    """把调用参数规范化为稳定的字符串：按参数名绑定并补全默认值，字典按键排序"""
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return json.dumps(bound.arguments, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class ToolResultCache:
+    """单个工具的结果缓存：内存LRU + 磁盘(SQLite)，两层都有过期时间
+
+    磁盘层复用 LLMResponseCache 的存储，条目中保存各自的过期时间，
+    因此不同工具可以使用不同的TTL。
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int,
+                 disk_cache: Optional[LLMResponseCache] = None, version: str = ""):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.version = version
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    def make_key(self, canonical_args: str) -> str:
+        raw = f"{self.name}\0{self.version}\0{canonical_args}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """返回缓存的结果，未命中时返回 _MISSING"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    # 返回副本，避免调用方修改缓存中的字典/列表
+                    return copy.deepcopy(entry[1])
+                del self._memory[key]
+
+        if self.disk_cache is not None:
+            stored = self.disk_cache.get(key)
+            if stored is not None and stored.get("expires", 0) > now:
+                self._remember(key, stored["expires"], copy.deepcopy(stored["value"]))
+                with self._lock:
+                    self.disk_hits += 1
+                return stored["value"]
+        return _MISSING
+
+    def record(self, hit: bool, seconds: float):
+        """记录一次调用的耗时（命中时为查缓存的耗时，未命中时包括执行工具的耗时）"""
+        with self._lock:
+            if hit:
+                self.hit_seconds += seconds
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+
+    def _remember(self, key: str, expires: float, value: Any):
+        with self._lock:
+            self._memory[key] = (expires, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, value: Any):
+        expires = time.time() + self.ttl_seconds
+        self._remember(key, expires, copy.deepcopy(value))
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.put(key, {"expires": expires, "value": value}, model=f"tool:{self.name}")
+            except (TypeError, ValueError) as e:
+                logger.warning(f"工具 {self.name} 的结果无法写入磁盘缓存: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            calls = hits + self.misses
+            return {
+                "calls": calls,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / calls, 4) if calls else 0.0,
+                "avg_hit_ms": round(self.hit_seconds / hits * 1000, 3) if hits else 0.0,
+                "avg_miss_ms": round(self.miss_seconds / self.misses * 1000, 3) if self.misses else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+_caches: Dict[str, ToolResultCache] = {}
+_disk_cache: Optional[LLMResponseCache] = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_tool_disk_cache() -> LLMResponseCache:
+    """所有工具共享的磁盘缓存，位于 cache/tool_results.sqlite3"""
+    global _disk_cache
+    with _disk_cache_lock:
+        if _disk_cache is None:
+            cache_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'cache'))
+            os.makedirs(cache_dir, exist_ok=True)
+            # 过期时间由每个条目自己记录，这里只设置一个足够长的上限
+            _disk_cache = LLMResponseCache(os.path.join(cache_dir, 'tool_results.sqlite3'),
+                                           ttl_seconds=30 * 24 * 3600, max_entries=20000)
+        return _disk_cache
+
+
+def memoize_tool(ttl_seconds: float = 3600, max_entries: int = 256, disk: bool = True, version: str = "",
+                 cache_results: bool = True):
+    """工具函数的记忆化装饰器，放在 smolagents 的 @tool 之下使用：
+
+        @tool
+        @memoize_tool(ttl_seconds=600)
+        def get_product_description(product_name: str) -> Dict[str, str]:
+            ...
+
+    参数按函数签名绑定并规范化（字典键排序、列表保持顺序）后作为缓存键，
+    关键字参数与位置参数、显式传入默认值与省略默认值得到相同的键。
+
+    Args:
+        ttl_seconds: 结果的有效期
+        max_entries: 内存中最多保存的结果数
+        disk: 是否同时写入磁盘缓存，结果需要能序列化为JSON
+        version: 工具实现变化导致旧结果失效时修改此值
+        cache_results: 为 False 时不缓存结果（如采样生成的输出），只记录追踪并在检查点中记录和回放
+    """
+    def decorator(func: Callable) -> Callable:
+        cache = ToolResultCache(func.__name__, ttl_seconds, max_entries,
+                                get_tool_disk_cache() if disk and cache_results else None, version)
+        _caches[func.__name__] = cache
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(func.__name__, "tool") as span:
+                start = time.perf_counter()
+                canonical = canonical_arguments(func, args, kwargs)
+                # 从检查点继续的运行优先使用本次运行记录的输出，保证与中断前一致
+                checkpoint = active_checkpoint()
+                checkpoint_key = f"{func.__name__}:{canonical}"
+                if checkpoint is not None:
+                    value = checkpoint.tool_output(checkpoint_key, _MISSING)
+                    if value is not _MISSING:
+                        span.set(checkpoint=True)
+                        return value
+                key = cache.make_key(canonical)
+                value = cache.get(key) if cache_results else _MISSING
+                if value is not _MISSING:
+                    cache.record(True, time.perf_counter() - start)
+                    span.set(cache_hit=True)
+                else:
+                    value = func(*args, **kwargs)
+                    if cache_results:
+                        cache.put(key, value)
+                    cache.record(False, time.perf_counter() - start)
+                    span.set(cache_hit=False)
+                if checkpoint is not None:
+                    checkpoint.record_tool(checkpoint_key, value)
+                return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def tool_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """各工具的命中率和耗时统计"""
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def log_tool_cache_stats():
+    for name, stats in tool_cache_stats().items():
+        logger.info(f"工具缓存 {name}: {stats}")
@@ -0,0 +1,232 @@
+"""智能体运行的耗时追踪
+
+span 按 运行(run) → 步骤(step) → 模型调用(llm) / 工具调用(tool) 嵌套，记录起止时间、
+模型名和 token 数，可以导出为 Chrome trace 事件格式（用 Perfetto 或 chrome://tracing 打开）
+和按名称汇总的耗时表。
+
+默认关闭，设置环境变量 POSTER_AGENT_TRACE=1 或调用 tracer.enable() 开启；
+关闭时 span() 直接返回一个空对象，被追踪的函数只多一次属性判断。
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Span:
+    """一段被追踪的执行过程"""
+
+    __slots__ = ('tracer', 'span_id', 'name', 'category', 'start', 'end', 'attrs', 'parent', 'thread_id')
+
+    def __init__(self, tracer: "Tracer", span_id: int, name: str, category: str,
+                 attrs: Dict[str, Any], parent: Optional["Span"]):
+        self.tracer = tracer
+        self.span_id = span_id
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+        self.parent = parent
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attrs: Any) -> "Span":
+        """补充属性，如返回后才知道的 token 数"""
+        self.attrs.update(attrs)
+        return self
+
+    def finish(self):
+        self.tracer.end_span(self)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.finish()
+        return False
+
+
+class _NullSpan:
+    """追踪关闭时使用的空 span"""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> "_NullSpan":
+        return self
+
+    def finish(self):
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+# 当前上下文中最内层的 span；线程池中的任务需要通过 contextvars.copy_context() 继承
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar('current_span', default=None)
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.spans: List[Span] = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._step: Optional[Span] = None
+        self._step_count = 0
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+            self.origin = time.perf_counter()
+            self._step = None
+            self._step_count = 0
+
+    def start_span(self, name: str, category: str = "function", **attrs: Any):
+        """开始一个 span 并设为当前 span，需要配对调用 finish()；关闭时返回 NULL_SPAN"""
+        if not self.enabled:
+            return NULL_SPAN
+        with self._lock:
+            span_id = self._next_id
+            self._next_id += 1
+        span = Span(self, span_id, name, category, attrs, _current_span.get())
+        _current_span.set(span)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def end_span(self, span: Span):
+        if span.end is not None:
+            return
+        span.end = time.perf_counter()
+        if _current_span.get() is span:
+            _current_span.set(span.parent)
+
+    def span(self, name: str, category: str = "function", **attrs: Any):
+        """用作上下文管理器：with tracer.span("compose", "tool"): ..."""
+        return self.start_span(name, category, **attrs)
+
+    def run(self, name: str = "agent.run", **attrs: Any):
+        """一次智能体运行的根 span，结束时一并结束最后一个步骤"""
+        span = self.start_span(name, "run", **attrs)
+        if span is not NULL_SPAN:
+            self._step = None
+            self._step_count = 0
+        return span
+
+    def next_step(self, **attrs: Any):
+        """结束上一个步骤并开始新的步骤；步骤没有明确的结束点，由下一步或运行结束时关闭"""
+        if not self.enabled:
+            return NULL_SPAN
+        self.end_step()
+        self._step_count += 1
+        self._step = self.start_span(f"step {self._step_count}", "step", step=self._step_count, **attrs)
+        return self._step
+
+    def end_step(self):
+        if self._step is not None:
+            self.end_span(self._step)
+            self._step = None
+
+    def traced(self, category: str = "tool", name: Optional[str] = None) -> Callable:
+        """函数装饰器，放在 smolagents 的 @tool 之下使用"""
+        def decorator(func: Callable) -> Callable:
+            span_name = name or func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.start_span(span_name, category):
+                    return func(*args, **kwargs)
+
+            return wrapper
+        return decorator
+
+    def finished_spans(self) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if span.end is not None]
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Chrome trace 事件格式（完整事件 ph=X，时间单位为微秒）"""
+        pid = os.getpid()
+        thread_ids: Dict[int, int] = {}
+        events = []
+        for span in self.finished_spans():
+            tid = thread_ids.setdefault(span.thread_id, len(thread_ids) + 1)
+            args = dict(span.attrs, span_id=span.span_id)
+            if span.parent is not None:
+                args["parent_id"] = span.parent.span_id
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6, 1),
+                "dur": round((span.end - span.start) * 1e6, 1),
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            })
+        for thread_id, tid in thread_ids.items():
+            thread_name = "main" if thread_id == threading.main_thread().ident else f"worker {tid}"
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False, default=str)
+        return path
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """按 (类别, 名称) 汇总次数、耗时和 token 数，按总耗时降序"""
+        rows: Dict[tuple, Dict[str, Any]] = {}
+        for span in self.finished_spans():
+            # 步骤名带序号，汇总时合并为一行
+            name = "step" if span.category == "step" else span.name
+            row = rows.setdefault((span.category, name), {
+                "category": span.category, "name": name, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            ms = (span.end - span.start) * 1000
+            row["count"] += 1
+            row["total_ms"] += ms
+            row["max_ms"] = max(row["max_ms"], ms)
+            row["prompt_tokens"] += span.attrs.get("prompt_tokens") or 0
+            row["completion_tokens"] += span.attrs.get("completion_tokens") or 0
+        result = sorted(rows.values(), key=lambda row: row["total_ms"], reverse=True)
+        for row in result:
+            row["mean_ms"] = round(row["total_ms"] / row["count"], 2)
+            row["total_ms"] = round(row["total_ms"], 2)
+            row["max_ms"] = round(row["max_ms"], 2)
+        return result
+
+    def format_summary(self) -> str:
+        columns = ["category", "name", "count", "total_ms", "mean_ms", "max_ms", "prompt_tokens", "completion_tokens"]
+        rows = [[str(row[column]) for column in columns] for row in self.summary()]
+        widths = [max(len(column), *(len(row[i]) for row in rows)) if rows else len(column)
+                  for i, column in enumerate(columns)]
+        lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+        lines.append("  ".join("-" * width for width in widths))
+        lines.extend("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+        return "\n".join(lines)
+
+
+tracer = Tracer(enabled=os.getenv('POSTER_AGENT_TRACE', '0') == '1')
@@ -0,0 +1,81 @@
+import re
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tool_graph import ToolGraph, ToolGraphExecutor
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class WorkflowTemplate:
+    """预先编排好的固定流程：请求与模板匹配时直接执行工具图，不再让模型逐步选择工具"""
+
+    def __init__(self, name: str, pattern: str, graph: ToolGraph, output: str,
+                 extract: Optional[Callable[[Dict[str, Optional[str]]], Optional[Dict[str, Any]]]] = None,
+                 max_workers: int = 4):
+        """
+        Args:
+            name: 模板名称
+            pattern: 匹配整条请求的正则表达式，命名分组作为工具图的初始输入
+            graph: 要执行的工具图
+            output: 作为结果返回的上下文名称
+            extract: 对命名分组做清洗，返回 None 表示不匹配
+            max_workers: 工具图的并发数
+        """
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.graph = graph
+        self.output = output
+        self.extract = extract
+        self.max_workers = max_workers
+
+    def match(self, query: str) -> Optional[Dict[str, Any]]:
+        """匹配时返回工具图的初始输入"""
+        m = self.pattern.fullmatch(query.strip())
+        if m is None:
+            return None
+        inputs = {key: value.strip() if value else None for key, value in m.groupdict().items()}
+        if self.extract is not None:
+            return self.extract(inputs)
+        return inputs
+
+    def run(self, inputs: Dict[str, Any]) -> Any:
+        return ToolGraphExecutor(self.graph, self.max_workers).run(inputs)[self.output]
+
+
+class WorkflowRouter:
+    """按注册顺序匹配模板，命中时走固定流程，否则交给智能体处理"""
+
+    def __init__(self, templates: Optional[List[WorkflowTemplate]] = None):
+        self.templates: List[WorkflowTemplate] = list(templates or [])
+        self.compiled_runs = 0
+        self.fallback_runs = 0
+
+    def register(self, template: WorkflowTemplate) -> WorkflowTemplate:
+        self.templates.append(template)
+        return template
+
+    def route(self, query: str) -> Optional[Tuple[WorkflowTemplate, Dict[str, Any]]]:
+        for template in self.templates:
+            inputs = template.match(query)
+            if inputs is not None:
+                return template, inputs
+        return None
+
+    def run(self, query: str, fallback: Callable[[str], Any]) -> Any:
+        """执行请求：匹配模板时直接运行工具图，否则调用 fallback(query)"""
+        routed = self.route(query)
+        if routed is None:
+            self.fallback_runs += 1
+            logger.info("请求未匹配固定流程，交给智能体处理")
+            return fallback(query)
+
+        template, inputs = routed
+        start = time.perf_counter()
+        with tracer.span(f"workflow {template.name}", "workflow", **inputs):
+            result = template.run(inputs)
+        self.compiled_runs += 1
+        logger.info(f"固定流程 {template.name} 完成，耗时 {time.perf_counter() - start:.2f}s，输入 {inputs}")
+        return result